@@ -1,40 +1,377 @@
 import pyaudio
 import queue
+import threading
+import numpy as np
 from . import config
+from .resampler import StreamingResampler
+
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+BARGE_IN = "barge_in"
+
+class VoiceActivityDetector:
+    """
+    Energy / zero-crossing-rate voice activity detector for 16-bit PCM.
+
+    Chunks are split into fixed-length frames and the per-frame features are
+    computed on numpy views of the chunk. A small state machine turns the
+    per-frame decisions into explicit SPEECH_START / SPEECH_END events; the
+    hangover keeps short pauses between words from ending the utterance.
+    """
+    def __init__(self, sample_rate=config.AUDIO_SAMPLE_RATE, channels=config.AUDIO_CHANNELS,
+                 frame_ms=config.VAD_FRAME_MS, energy_margin_db=config.VAD_ENERGY_MARGIN_DB,
+                 min_energy_db=config.VAD_MIN_ENERGY_DB, start_ms=config.VAD_START_MS,
+                 hangover_ms=config.VAD_HANGOVER_MS, max_zcr=0.35):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_len = max(1, int(sample_rate * frame_ms / 1000))
+        self.frame_s = self.frame_len / sample_rate
+        self.energy_margin_db = energy_margin_db
+        self.min_energy_db = min_energy_db
+        self.max_zcr = max_zcr
+        self.start_frames = max(1, int(round(start_ms / frame_ms)))
+        self.hangover_frames = max(1, int(round(hangover_ms / frame_ms)))
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.noise_floor_db = None
+        self._speech_run = 0
+        self._silence_run = 0
+        self._frames_seen = 0
+        self._remainder = np.zeros(0, dtype=np.int16)
+
+    @property
+    def stream_time(self) -> float:
+        """Seconds of audio analysed so far (stream clock used for event timestamps)."""
+        return self._frames_seen * self.frame_s
+
+    def frame_features(self, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (energy in dBFS, zero-crossing rate) for each row of an int16 frame matrix."""
+        power = np.square(frames, dtype=np.float32).mean(axis=1)
+        energy_db = 10.0 * np.log10(power / (32768.0 ** 2) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / self.frame_len
+        return energy_db, zcr
+
+    def _update_noise_floor(self, energy_db):
+        if self.noise_floor_db is None:
+            self.noise_floor_db = energy_db
+        elif energy_db < self.noise_floor_db:
+            self.noise_floor_db += 0.5 * (energy_db - self.noise_floor_db) # Follow drops quickly
+        else:
+            self.noise_floor_db += 0.02 * (energy_db - self.noise_floor_db) # Rise slowly
+
+    def process_chunk(self, audio_chunk) -> list[tuple[str, float]]:
+        """
+        Feeds one chunk of interleaved int16 PCM to the detector.
+
+        Returns:
+            A list of (event, stream_time_s) tuples, where event is SPEECH_START or SPEECH_END.
+        """
+        samples = np.frombuffer(audio_chunk, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[::self.channels] # First channel is enough for endpointing
+        if self._remainder.size:
+            samples = np.concatenate((self._remainder, samples))
+        n_frames = samples.size // self.frame_len
+        self._remainder = samples[n_frames * self.frame_len:].copy()
+        if n_frames == 0:
+            return []
+
+        frames = samples[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        energy_db, zcr = self.frame_features(frames)
+
+        events = []
+        for e, z in zip(energy_db.tolist(), zcr.tolist()):
+            self._frames_seen += 1
+            floor = self.noise_floor_db if self.noise_floor_db is not None else e
+            threshold = max(floor + self.energy_margin_db, self.min_energy_db)
+            # High-ZCR frames only count as speech when clearly loud (fricatives), not hiss.
+            is_speech = e > threshold and (z < self.max_zcr or e > threshold + 6.0)
+
+            if is_speech:
+                self._speech_run += 1
+                self._silence_run = 0
+                if not self.in_speech and self._speech_run >= self.start_frames:
+                    self.in_speech = True
+                    events.append((SPEECH_START, self.stream_time))
+            else:
+                self._speech_run = 0
+                self._silence_run += 1
+                if not self.in_speech:
+                    self._update_noise_floor(e)
+                elif self._silence_run >= self.hangover_frames:
+                    self.in_speech = False
+                    events.append((SPEECH_END, self.stream_time))
+        return events
+
+def chunk_level_db(audio_chunk) -> float:
+    """RMS level of an int16 PCM chunk in dBFS."""
+    samples = np.frombuffer(audio_chunk, dtype=np.int16)
+    if samples.size == 0:
+        return -100.0
+    return float(10.0 * np.log10(np.square(samples, dtype=np.float32).mean() / (32768.0 ** 2) + 1e-10))
+
+class EchoGuard:
+    """
+    Tells the user's voice apart from the assistant's own voice picked up by the microphone.
+
+    While audio is playing, the level of the played signal (the reference) is
+    compared with the microphone level. The acoustic coupling between the two
+    (mic minus reference while only the assistant is audible) is tracked as an
+    upper envelope: it follows increases quickly and decays slowly, so echo
+    peaks stay below the prediction. A chunk counts as user speech when the
+    mic is louder than the predicted echo by margin_db; min_ms of such chunks,
+    with gaps between syllables shorter than max_gap_ms, is a barge-in. The
+    first warmup_ms of each playback only calibrate the coupling, since the
+    room or the volume may have changed since the last reply. VAD events
+    during playback are suppressed, since they are triggered by the echo.
+    """
+    def __init__(self, margin_db=config.BARGE_IN_MARGIN_DB, min_ms=config.BARGE_IN_MIN_MS,
+                 coupling_db=config.BARGE_IN_ECHO_COUPLING_DB, min_energy_db=config.VAD_MIN_ENERGY_DB,
+                 max_gap_ms=300, warmup_ms=400, adapt_up=0.3, adapt_down=0.02):
+        self.margin_db = margin_db
+        self.min_s = min_ms / 1000
+        self.max_gap_s = max_gap_ms / 1000
+        self.warmup_s = warmup_ms / 1000
+        self.coupling_db = coupling_db
+        self.min_energy_db = min_energy_db
+        self.adapt_up = adapt_up
+        self.adapt_down = adapt_down
+        self.barge_ins = 0
+        self.reset()
+
+    def reset(self):
+        """Called when playback has ended. The coupling estimate is kept for the next reply."""
+        self._speech_s = 0.0
+        self._gap_s = 0.0
+        self._playback_s = 0.0
+        self.fired = False
+
+    def process(self, mic_db, ref_db, chunk_s) -> bool:
+        """Feeds one chunk's levels; returns True once when a barge-in is detected."""
+        residual = mic_db - ref_db
+        self._playback_s += chunk_s
+        if self._playback_s <= self.warmup_s:
+            if ref_db > self.min_energy_db:
+                self.coupling_db += self.adapt_up * (residual - self.coupling_db)
+            return False
+        if residual > self.coupling_db + self.margin_db and mic_db > self.min_energy_db:
+            self._speech_s += chunk_s
+            self._gap_s = 0.0
+            if not self.fired and self._speech_s >= self.min_s:
+                self.fired = True
+                self.barge_ins += 1
+                return True
+            return False
+        self._gap_s += chunk_s
+        if self._gap_s > self.max_gap_s: # A dip between syllables does not end the run, a pause does
+            self._speech_s = 0.0
+        if self._speech_s == 0.0 and ref_db > self.min_energy_db: # Learn only from echo-only chunks
+            rate = self.adapt_up if residual > self.coupling_db else self.adapt_down
+            self.coupling_db = min(max(self.coupling_db + rate * (residual - self.coupling_db), -60.0), 20.0)
+        return False
+
+    def filter_events(self, audio_chunk, events, ref_db, stream_time, sample_rate, channels=1):
+        """
+        Applies the guard to one microphone chunk and the VAD events it produced.
+        ref_db is None when nothing is playing; then events pass through unchanged.
+        """
+        if ref_db is None:
+            if self.fired or self._speech_s:
+                self.reset()
+            return events
+        chunk_s = len(audio_chunk) / (2 * channels * sample_rate)
+        if self.process(chunk_level_db(audio_chunk), ref_db, chunk_s):
+            return [(BARGE_IN, stream_time)]
+        return [] # Speech events while the assistant talks come from its own voice
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+class PCMRingBuffer:
+    """
+    Fixed-size int16 ring buffer between the PyAudio callback and the consumer.
+
+    All storage is preallocated. Reads hand out memoryviews into the buffer
+    (or into a preallocated scratch area when a read wraps around), so no
+    per-chunk bytes objects are created. When the consumer falls behind, the
+    configured policy drops either the oldest unread audio or the incoming
+    audio instead of letting the backlog grow.
+
+    A memoryview returned by read() stays valid until the next read() call:
+    the physical array is one read larger than the logical capacity, so the
+    writer does not reach the most recently handed-out region unless a
+    drop_oldest overrun discards more than a read's worth of audio first.
+    """
+    def __init__(self, capacity_ms=config.AUDIO_BUFFER_MS, sample_rate=config.AUDIO_SAMPLE_RATE,
+                 channels=config.AUDIO_CHANNELS, max_read_frames=config.AUDIO_CHUNK_SIZE * 4,
+                 policy=config.AUDIO_BUFFER_POLICY):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown ring buffer policy: {policy}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.policy = policy
+        self.capacity = max(int(sample_rate * capacity_ms / 1000), max_read_frames) * channels
+        self.max_read = max_read_frames * channels
+        self._buffer = np.zeros(self.capacity + self.max_read, dtype=np.int16)
+        self._scratch = np.zeros(self.max_read, dtype=np.int16)
+        self._cond = threading.Condition()
+        self.clear()
+
+    def clear(self):
+        with self._cond:
+            self._write_pos = 0 # Absolute sample counters; positions in the array are taken modulo its size
+            self._read_pos = 0
+            self.overruns = 0
+            self.dropped_samples = 0
+
+    @property
+    def available(self) -> int:
+        """Unread samples (all channels)."""
+        return self._write_pos - self._read_pos
+
+    @property
+    def lag_ms(self) -> float:
+        """How far the consumer is behind the microphone."""
+        return self.available / (self.sample_rate * self.channels) * 1000
+
+    @property
+    def dropped_ms(self) -> float:
+        return self.dropped_samples / (self.sample_rate * self.channels) * 1000
+
+    def write(self, data) -> int:
+        """Copies interleaved int16 PCM into the buffer. Returns the number of samples stored."""
+        samples = np.frombuffer(data, dtype=np.int16)
+        size = self._buffer.size
+        with self._cond:
+            n = samples.size
+            free = self.capacity - self.available
+            if n > free:
+                self.overruns += 1
+                excess = n - free
+                self.dropped_samples += excess
+                if self.policy == DROP_NEWEST:
+                    samples = samples[:free]
+                    n = free
+                elif excess > self.available: # Incoming block alone exceeds capacity
+                    self._read_pos = self._write_pos
+                    samples = samples[-self.capacity:]
+                    n = samples.size
+                else:
+                    self._read_pos += excess
+            if n == 0:
+                return 0
+
+            start = self._write_pos % size
+            first = min(n, size - start)
+            self._buffer[start:start + first] = samples[:first]
+            if first < n:
+                self._buffer[:n - first] = samples[first:]
+            self._write_pos += n
+            self._cond.notify()
+        return n
+
+    def read(self, n_frames, timeout=None) -> memoryview | None:
+        """
+        Waits for n_frames of audio and returns them as a byte-format memoryview.
+        Returns None if they did not arrive within the timeout.
+        """
+        n = min(n_frames * self.channels, self.max_read)
+        size = self._buffer.size
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.available >= n, timeout=timeout):
+                return None
+            start = self._read_pos % size
+            if start + n <= size:
+                view = self._buffer[start:start + n]
+            else: # Wrapped read: stitch both halves into the scratch area
+                first = size - start
+                self._scratch[:first] = self._buffer[start:]
+                self._scratch[first:n] = self._buffer[:n - first]
+                view = self._scratch[:n]
+            self._read_pos += n
+        return memoryview(view).cast('B')
 
 class AudioInput:
     def __init__(self, sample_rate=config.AUDIO_SAMPLE_RATE, channels=config.AUDIO_CHANNELS, 
-                 chunk_size=config.AUDIO_CHUNK_SIZE, device_index=config.AUDIO_INPUT_DEVICE_INDEX):
-        self.sample_rate = sample_rate
+                 chunk_size=config.AUDIO_CHUNK_SIZE, device_index=config.AUDIO_INPUT_DEVICE_INDEX,
+                 vad_enabled=config.VAD_ENABLED, capture_rate=config.AUDIO_CAPTURE_SAMPLE_RATE,
+                 capture_channels=config.AUDIO_CAPTURE_CHANNELS, echo_reference=None):
+        self.sample_rate = sample_rate # Rate/channels delivered to consumers (what the recognizer expects)
         self.channels = channels
         self.chunk_size = chunk_size
         self.device_index = device_index
-        self.audio_queue = queue.Queue()
+        # Device-side format; None means the device's native format, converted in _callback.
+        self.capture_rate = capture_rate
+        self.capture_channels = capture_channels
+        self.resampler = None
+        self.audio_buffer = PCMRingBuffer(sample_rate=sample_rate, channels=channels,
+                                          max_read_frames=chunk_size * 4)
+        # VAD runs on the consumer side so its events stay in step with the chunks handed out.
+        self.vad = VoiceActivityDetector(sample_rate=sample_rate, channels=channels) if vad_enabled else None
+        self.vad_events = queue.Queue()
+        # Object with reference_level_db() (e.g. AudioOutput); enables barge-in detection during playback.
+        self.echo_reference = echo_reference
+        self.echo_guard = EchoGuard()
+        self._samples_read = 0
         self.p = pyaudio.PyAudio()
         self.stream = None
         self.running = False
 
     def _callback(self, in_data, frame_count, time_info, status):
         if self.running:
-            self.audio_queue.put(in_data)
+            self.audio_buffer.write(self.resampler.process(in_data) if self.resampler else in_data)
         return (None, pyaudio.paContinue)
 
+    def _native_format(self) -> tuple[int, int]:
+        """The device's default sample rate and channel count (at most stereo)."""
+        if self.device_index is not None:
+            info = self.p.get_device_info_by_index(self.device_index)
+        else:
+            info = self.p.get_default_input_device_info()
+        channels = min(int(info.get('maxInputChannels', 1)), 2) or 1
+        return int(info.get('defaultSampleRate', self.sample_rate)), channels
+
+    def _open_stream(self, rate, channels):
+        if rate == self.sample_rate and channels == self.channels:
+            self.resampler = None
+        else:
+            self.resampler = StreamingResampler(rate, self.sample_rate, channels)
+        return self.p.open(format=pyaudio.paInt16, # Standard format for Vosk
+                           channels=channels,
+                           rate=rate,
+                           input=True,
+                           frames_per_buffer=max(1, int(self.chunk_size * rate / self.sample_rate)),
+                           input_device_index=self.device_index,
+                           stream_callback=self._callback)
+
     def start_listening(self):
         if self.running:
             print("AudioInput is already listening.")
             return
 
         try:
-            self.stream = self.p.open(format=pyaudio.paInt16, # Standard format for Vosk
-                                     channels=self.channels,
-                                     rate=self.sample_rate,
-                                     input=True,
-                                     frames_per_buffer=self.chunk_size,
-                                     input_device_index=self.device_index,
-                                     stream_callback=self._callback)
+            rate, channels = self.capture_rate, self.capture_channels
+            if rate is None or channels is None:
+                native_rate, native_channels = self._native_format()
+                rate, channels = rate or native_rate, channels or native_channels
+            try:
+                self.stream = self._open_stream(rate, channels)
+            except Exception as e:
+                if (rate, channels) == (self.sample_rate, self.channels):
+                    raise
+                print(f"AudioInput: Could not open {rate} Hz/{channels}ch ({e}), falling back to "
+                      f"{self.sample_rate} Hz/{self.channels}ch.")
+                self.stream = self._open_stream(self.sample_rate, self.channels)
             self.running = True
             self.stream.start_stream()
-            print("AudioInput: Started listening...")
+            if self.resampler:
+                print(f"AudioInput: Started listening at {self.resampler.source_rate} Hz/{self.resampler.channels}ch, "
+                      f"converting to {self.sample_rate} Hz/{self.channels}ch...")
+            else:
+                print("AudioInput: Started listening...")
         except Exception as e:
             print(f"Error starting audio input stream: {e}")
             if "Invalid input device" in str(e) or "No Default Input Device Available" in str(e):
@@ -62,23 +399,69 @@ class AudioInput:
             print(f"Error stopping audio input stream: {e}")
         finally:
             self.stream = None
-            # Clear the queue after stopping
-            while not self.audio_queue.empty():
+            # Clear the buffers after stopping
+            self.audio_buffer.clear()
+            if self.resampler:
+                self.resampler.reset()
+            while not self.vad_events.empty():
                 try:
-                    self.audio_queue.get_nowait()
+                    self.vad_events.get_nowait()
                 except queue.Empty:
                     continue
+            if self.vad:
+                self.vad.reset()
 
-    def get_audio_chunk(self, timeout=1):
-        """Gets an audio chunk from the queue. Returns None if timeout."""
+    def get_audio_view(self, timeout=1) -> memoryview | None:
+        """
+        Gets the next chunk as a zero-copy memoryview into the ring buffer.
+        The view is only valid until the next get_audio_view()/get_audio_chunk() call.
+        Returns None if timeout.
+        """
         if not self.running:
             # print("AudioInput is not running. Cannot get audio chunk.")
             return None
+        view = self.audio_buffer.read(self.chunk_size, timeout=timeout)
+        if view is None:
+            return None
+        self._samples_read += len(view) // 2
+        events = self.vad.process_chunk(view) if self.vad else []
+        if self.echo_reference is not None:
+            stream_time = self._samples_read / (self.sample_rate * self.channels)
+            events = self.echo_guard.filter_events(view, events, self.echo_reference.reference_level_db(),
+                                                   stream_time, self.sample_rate, self.channels)
+        for event in events:
+            self.vad_events.put(event)
+        return view
+
+    def get_audio_chunk(self, timeout=1):
+        """Gets an audio chunk as bytes (for consumers such as Vosk that need bytes). Returns None if timeout."""
+        view = self.get_audio_view(timeout=timeout)
+        return bytes(view) if view is not None else None
+
+    def get_buffer_stats(self) -> dict:
+        """Overrun counters and current consumer lag of the capture ring buffer."""
+        return {
+            "overruns": self.audio_buffer.overruns,
+            "dropped_ms": self.audio_buffer.dropped_ms,
+            "lag_ms": self.audio_buffer.lag_ms,
+            "policy": self.audio_buffer.policy,
+        }
+
+    def get_vad_event(self):
+        """
+        Returns the next pending (event, stream_time_s) VAD tuple, or None.
+        event is SPEECH_START, SPEECH_END or, during playback with an echo reference, BARGE_IN.
+        Events are produced for the chunks already returned by get_audio_chunk().
+        """
         try:
-            return self.audio_queue.get(timeout=timeout)
+            return self.vad_events.get_nowait()
         except queue.Empty:
             return None
 
+    @property
+    def is_speaking(self) -> bool:
+        return bool(self.vad and self.vad.in_speech)
+
     def __del__(self):
         if self.stream and self.stream.is_active():
             self.stream.stop_stream()
@@ -86,8 +469,141 @@ class AudioInput:
         self.p.terminate()
         print("AudioInput: Resources released.")
 
+def run_vad_on_wav(file_path, vad=None, chunk_size=config.AUDIO_CHUNK_SIZE) -> list[tuple[str, float]]:
+    """Runs the VAD over a 16-bit WAV file chunk by chunk and returns all events."""
+    import wave
+    with wave.open(file_path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"VAD expects 16-bit PCM, got {wf.getsampwidth() * 8}-bit: {file_path}")
+        if vad is None:
+            vad = VoiceActivityDetector(sample_rate=wf.getframerate(), channels=wf.getnchannels())
+        events = []
+        data = wf.readframes(chunk_size)
+        while data:
+            events.extend(vad.process_chunk(data))
+            data = wf.readframes(chunk_size)
+    return events
+
+def _voiced_signal(t, freqs=(140, 280, 700, 1200), syllable_hz=4.0) -> np.ndarray:
+    """Harmonic, syllable-modulated stand-in for speech (peak around 1.5)."""
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * syllable_hz * t)
+    harmonics = sum(np.sin(2 * np.pi * f0 * t) / k for k, f0 in enumerate(freqs, start=1))
+    return envelope * harmonics
+
+def _write_vad_fixture(file_path, speech_start_s, speech_end_s, total_s, sample_rate=config.AUDIO_SAMPLE_RATE,
+                       noise_level=200.0, seed=0):
+    """Writes a WAV with background noise and a voiced, syllable-modulated burst between the given times."""
+    import wave
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(total_s * sample_rate)) / sample_rate
+    signal = rng.normal(0.0, noise_level, t.size)
+    voiced = (t >= speech_start_s) & (t < speech_end_s)
+    signal[voiced] += 6000.0 * _voiced_signal(t)[voiced]
+    pcm = np.clip(signal, -32768, 32767).astype(np.int16)
+    with wave.open(file_path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+
+def vad_endpoint_test(wav_paths=None):
+    """
+    Reports speech-end latency of the VAD on WAV fixtures.
+    Without arguments, synthetic fixtures with known speech boundaries are generated.
+    A user fixture can be given as "path.wav:<speech_end_seconds>".
+    """
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as fixture_dir: # Generated fixtures are removed afterwards
+        fixtures = []
+        if wav_paths:
+            for arg in wav_paths:
+                path, _, end_s = arg.partition(":")
+                fixtures.append((path, float(end_s) if end_s else None))
+        else:
+            for name, (start_s, end_s, total_s, noise) in {
+                "vad_quiet_room.wav": (0.5, 2.0, 3.5, 100.0),
+                "vad_noisy_room.wav": (1.0, 3.2, 5.0, 600.0),
+            }.items():
+                path = os.path.join(fixture_dir, name)
+                _write_vad_fixture(path, start_s, end_s, total_s, noise_level=noise)
+                fixtures.append((path, end_s))
+
+        all_ok = True
+        for path, true_end_s in fixtures:
+            events = run_vad_on_wav(path)
+            ends = [ts for ev, ts in events if ev == SPEECH_END]
+            print(f"{path}: events={[(ev, round(ts, 3)) for ev, ts in events]}")
+            if true_end_s is None:
+                continue
+            if not ends:
+                print(f"  FAIL: no speech_end detected (speech ends at {true_end_s:.3f}s)")
+                all_ok = False
+                continue
+            latency_ms = (ends[-1] - true_end_s) * 1000
+            ok = 0 <= latency_ms <= 600
+            all_ok = all_ok and ok
+            print(f"  speech_end latency: {latency_ms:.0f} ms ({'OK' if ok else 'FAIL'}, target 300-600 ms)")
+    return all_ok
+
+def barge_in_test(sample_rate=config.AUDIO_SAMPLE_RATE, chunk_size=config.AUDIO_CHUNK_SIZE,
+                  window_ms=config.BARGE_IN_REFERENCE_WINDOW_MS) -> bool:
+    """
+    Feeds synthetic overlapping PCM through the VAD and EchoGuard, the way AudioInput does during playback:
+    the assistant's reply is played for 4 s and reaches the microphone as a delayed, attenuated echo,
+    with or without the user talking over it from 2 s on. Echo alone must produce no events at all;
+    the user's voice must produce a barge-in within 400 ms.
+    """
+    reply_end_s, user_start_s, user_end_s, total_s = 4.0, 2.0, 3.5, 5.0
+    t = np.arange(int(total_s * sample_rate)) / sample_rate
+    reply = np.where(t < reply_end_s, 8000.0 * _voiced_signal(t, (220, 440, 1100, 1900), 3.0), 0.0)
+    user = np.where((t >= user_start_s) & (t < user_end_s), _voiced_signal(t, (120, 240, 600, 1000), 4.5), 0.0)
+    delay = int(0.04 * sample_rate) # Speaker -> room -> microphone
+
+    all_ok = True
+    for name, echo_gain, user_level in (("echo only, weak coupling", 0.15, 0.0),
+                                        ("echo only, strong coupling", 0.8, 0.0),
+                                        ("user over weak echo", 0.15, 4000.0),
+                                        ("user over strong echo", 0.8, 16000.0)):
+        rng = np.random.default_rng(1)
+        mic = rng.normal(0.0, 150.0, t.size) + user_level * user
+        mic[delay:] += echo_gain * reply[:-delay]
+        mic = np.clip(mic, -32768, 32767).astype(np.int16)
+        ref = reply.astype(np.int16)
+
+        vad = VoiceActivityDetector(sample_rate=sample_rate, channels=1)
+        guard = EchoGuard()
+        ref_levels = [] # (time the chunk is played, level) as AudioOutput records them
+        window_s = window_ms / 1000
+        events = []
+        for start in range(0, t.size - chunk_size + 1, chunk_size):
+            now = (start + chunk_size) / sample_rate
+            if now <= reply_end_s:
+                ref_levels.append((now, chunk_level_db(ref[start:start + chunk_size].tobytes())))
+            recent = [db for played_at, db in ref_levels if played_at >= now - window_s]
+            chunk = mic[start:start + chunk_size].tobytes()
+            events += guard.filter_events(chunk, vad.process_chunk(chunk), max(recent) if recent else None,
+                                          now, sample_rate)
+        during_playback = [(ev, ts) for ev, ts in events if ts <= reply_end_s + window_s]
+        barge_ins = [ts for ev, ts in events if ev == BARGE_IN]
+        if user_level:
+            ok = len(barge_ins) == 1 and 0 <= barge_ins[0] - user_start_s <= 0.4
+            detail = f"barge-in after {(barge_ins[0] - user_start_s) * 1000:.0f} ms" if barge_ins else "no barge-in"
+        else:
+            ok = not during_playback
+            detail = f"{len(during_playback)} events during playback"
+        all_ok = all_ok and ok
+        print(f"{name:28s} coupling estimate {guard.coupling_db:6.1f} dB, {detail} -> {'OK' if ok else 'FAIL'}")
+    return all_ok
+
 if __name__ == '__main__':
+    import sys
     import time
+    if len(sys.argv) > 1 and sys.argv[1] == "--vad-test":
+        sys.exit(0 if vad_endpoint_test(sys.argv[2:]) else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "--barge-in-test":
+        sys.exit(0 if barge_in_test() else 1)
+
     print("Testing AudioInput module...")
     audio_input = AudioInput()
     audio_input.start_listening()
@@ -111,6 +627,7 @@ if __name__ == '__main__':
         finally:
             audio_input.stop_listening()
             print(f"Collected {frames_collected} audio chunks during the test.")
+            print(f"Ring buffer stats: {audio_input.get_buffer_stats()}")
             if frames_collected == 0 and audio_input.running:
                  print("No audio chunks collected. Ensure your microphone is working and selected correctly.")
     print("AudioInput module test finished.")
@@ -1,139 +1,330 @@
 import pyaudio
+import threading
+import time
 import wave
 import os
+from collections import deque
+import numpy as np
 from . import config
+from .resampler import StreamingResampler
+
+def pcm_level_db(data: bytes, sample_width: int) -> float:
+    """dBFS of interleaved PCM in a PyAudio sample format (width 1: uint8, 2: int16, 3: int24, 4: float32)."""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        packed = np.frombuffer(data[:len(data) - len(data) % 3], dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((packed[:, 0] | packed[:, 1] << 8 | packed[:, 2] << 16) << 8 >> 8).astype(np.float32) / 8388608.0
+    else:
+        samples = np.frombuffer(data, dtype=np.float32)
+    if samples.size == 0:
+        return -100.0
+    return float(10.0 * np.log10(np.square(samples, dtype=np.float32).mean() + 1e-10))
 
 class AudioOutput:
-    def __init__(self, device_index=None): # Allow specifying output device
+    """
+    Speaker output through one long-lived, callback-driven PyAudio stream.
+
+    PCM is queued with enqueue() (non-blocking) and pulled by the PortAudio
+    callback, so the device is opened once per audio format instead of once
+    per utterance. drain() waits until queued audio has been played; flush()
+    drops it immediately. If the device rejects a format, the stream is opened
+    at the device's default rate and audio is resampled on enqueue.
+    """
+    def __init__(self, device_index=None, frames_per_buffer=config.AUDIO_OUTPUT_FRAMES_PER_BUFFER): # Allow specifying output device
         self.p = pyaudio.PyAudio()
         self.stream = None
         self.device_index = device_index
+        self.frames_per_buffer = frames_per_buffer
         # You might want to query available output devices if device_index is None
         # and select a default, or let PyAudio choose.
+        self._format = None # (sample_rate, channels, sample_width) of the audio being enqueued
+        self._device_channels = None
+        self._resampler = None
+        self._frame_bytes = 0
+        self._sample_width = 2 # Sample width of the device stream, for measuring played levels
+        self._rate = 0 # Rate the device stream actually runs at
+        self._queue = deque() # [bytes, offset, enqueue_time] entries, consumed by the callback
+        self._queued_bytes = 0
+        self._cond = threading.Condition()
+        self._dac_delay_s = 0.0 # Time from the last callback until its buffer reaches the speaker
+        self.latencies_s = [] # Enqueue -> first sample at the speaker, one value per enqueue() call
+        self._levels = deque(maxlen=256) # (time at the speaker, dBFS) per played buffer: echo reference for barge-in
+        self.volume = config.AUDIO_OUTPUT_VOLUME # Gain applied to audio as it is queued
 
-    def play_audio_data(self, audio_data: bytes, sample_rate: int, channels: int, sample_width: int):
-        """
-        Plays raw audio data.
+    def _open_output(self, sample_rate, channels, sample_width):
+        """Opens (or reuses) the output stream for a format, falling back to resampling if the device rejects it."""
+        if self.stream is not None and self._format == (sample_rate, channels, sample_width):
+            return
+        self._close_stream()
+        self._resampler = None
+        try:
+            self.stream = self._start_stream(sample_rate, channels, sample_width)
+            self._device_channels = channels
+        except Exception as e:
+            if sample_width != 2:
+                raise
+            info = (self.p.get_device_info_by_index(self.device_index) if self.device_index is not None
+                    else self.p.get_default_output_device_info())
+            device_rate = int(info.get('defaultSampleRate', 48000))
+            device_channels = 1 if int(info.get('maxOutputChannels', 2)) < 2 else min(max(channels, 1), 2)
+            print(f"AudioOutput: Device rejected {sample_rate} Hz/{channels}ch ({e}); "
+                  f"resampling to {device_rate} Hz/{device_channels}ch.")
+            self._resampler = StreamingResampler(sample_rate, device_rate, channels)
+            self.stream = self._start_stream(device_rate, device_channels, 2)
+            self._device_channels = device_channels
+        self._format = (sample_rate, channels, sample_width)
 
-        Args:
-            audio_data: Raw audio bytes.
-            sample_rate: Sample rate of the audio (e.g., 22050 for Piper default).
-            channels: Number of audio channels (e.g., 1 for mono).
-            sample_width: Sample width in bytes (e.g., 2 for 16-bit audio).
-        """
-        if self.stream and self.stream.is_active():
-            print("AudioOutput: Stream is already active. Stopping current playback.")
-            self.stop_playback()
+    def _start_stream(self, rate, channels, sample_width):
+        self._frame_bytes = channels * sample_width
+        self._sample_width = sample_width
+        self._rate = rate
+        stream = self.p.open(format=self.p.get_format_from_width(sample_width),
+                             channels=channels,
+                             rate=rate,
+                             output=True,
+                             frames_per_buffer=self.frames_per_buffer,
+                             output_device_index=self.device_index,
+                             stream_callback=self._callback)
+        stream.start_stream()
+        self._dac_delay_s = stream.get_output_latency()
+        return stream
 
-        try:
-            self.stream = self.p.open(format=self.p.get_format_from_width(sample_width),
-                                     channels=channels,
-                                     rate=sample_rate,
-                                     output=True,
-                                     output_device_index=self.device_index)
-            
-            print(f"AudioOutput: Playing audio data ({len(audio_data)} bytes, {sample_rate}Hz, {channels}ch, {sample_width*8}-bit).")
-            self.stream.start_stream() # Ensure stream is started before writing
-            self.stream.write(audio_data)
-            # self.stream.stop_stream() # Wait for playback to finish before stopping implicitly by close()
-            # self.stream.close()
-            print("AudioOutput: Finished playing audio data.")
+    def _callback(self, in_data, frame_count, time_info, status):
+        wanted = frame_count * self._frame_bytes
+        parts = []
+        now = time.perf_counter()
+        dac_time, current_time = time_info.get("output_buffer_dac_time", 0), time_info.get("current_time", 0)
+        dac_delay = dac_time - current_time if dac_time and current_time and dac_time > current_time else self._dac_delay_s
+        with self._cond:
+            filled = 0
+            while filled < wanted and self._queue:
+                entry = self._queue[0]
+                data, offset, enqueued_at = entry
+                if enqueued_at is not None:
+                    # First bytes of this enqueue() reach the speaker after the buffered-ahead audio
+                    self.latencies_s.append(now - enqueued_at + dac_delay + filled / self._frame_bytes / self._rate)
+                    entry[2] = None
+                take = min(wanted - filled, len(data) - offset)
+                parts.append(data[offset:offset + take])
+                filled += take
+                if offset + take == len(data):
+                    self._queue.popleft()
+                else:
+                    entry[1] = offset + take
+            self._queued_bytes -= filled
+            if filled:
+                self._levels.append((now + dac_delay, pcm_level_db(b"".join(parts), self._sample_width)))
+            if filled < wanted:
+                parts.append(bytes(wanted - filled))
+            self._dac_delay_s = dac_delay
+            if not self._queue:
+                self._cond.notify_all()
+        return b"".join(parts), pyaudio.paContinue
+
+    def enqueue(self, audio_data: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bool:
+        """
+        Queues PCM for playback and returns immediately. Audio in a different format
+        than the queued audio reopens the stream once the queued audio has played.
+        """
+        if not audio_data:
             return True
+        try:
+            if self._format != (sample_rate, channels, sample_width):
+                self.drain()
+            self._open_output(sample_rate, channels, sample_width)
         except Exception as e:
-            print(f"Error playing raw audio data: {e}")
+            print(f"Error opening audio output stream: {e}")
             if "Invalid output device" in str(e):
                 print("Please check your speaker/audio output configuration.")
                 print("Available audio output devices:")
                 for i in range(self.p.get_device_count()):
                     dev_info = self.p.get_device_info_by_index(i)
-                    if dev_info.get(\'maxOutputChannels
-') > 0:
-                        print(f"  Device {i}: {dev_info.get(\'name
-')} (Output Channels: {dev_info.get(\'maxOutputChannels
-')})")
+                    if dev_info.get('maxOutputChannels') > 0:
+                        print(f"  Device {i}: {dev_info.get('name')} (Output Channels: {dev_info.get('maxOutputChannels')})")
             return False
-        finally:
-            if self.stream:
-                if not self.stream.is_stopped(): # Ensure it's stopped before closing
-                    self.stream.stop_stream()
-                if self.stream.is_active(): # Should not be active if stopped, but good check
-                     self.stream.close() # Close if it was opened
-                self.stream = None
+        if self.volume != 1.0 and sample_width == 2:
+            scaled = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) * self.volume
+            audio_data = np.clip(scaled, -32768, 32767).astype(np.int16).tobytes()
+        if self._resampler is not None:
+            mono = self._resampler.process(np.frombuffer(audio_data, dtype=np.int16))
+            if self._device_channels > 1:
+                mono = np.repeat(mono, self._device_channels)
+            audio_data = mono.tobytes()
+        audio_data = bytes(audio_data[:len(audio_data) - len(audio_data) % self._frame_bytes])
+        with self._cond:
+            self._queue.append([audio_data, 0, time.perf_counter()])
+            self._queued_bytes += len(audio_data)
+        return True
+
+    def set_volume(self, volume: float) -> float:
+        """Sets the playback gain (0.0-1.0) for audio queued from now on; returns the value applied."""
+        self.volume = min(1.0, max(0.0, volume))
+        return self.volume
+
+    def enqueue_pcm(self, audio_data: bytes, audio_format: dict) -> bool:
+        """enqueue() with a format dict as returned by TTSModule.synthesize()."""
+        return self.enqueue(audio_data, audio_format["sample_rate"], audio_format["channels"], audio_format["sample_width"])
+
+    @property
+    def queued_s(self) -> float:
+        """Seconds of audio queued but not yet handed to the device."""
+        return self._queued_bytes / (self._frame_bytes * self._rate) if self._rate and self._frame_bytes else 0.0
+
+    @property
+    def is_playing(self) -> bool:
+        return self._queued_bytes > 0
+
+    def drain(self, timeout=None) -> bool:
+        """Blocks until all queued audio has been played. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Bounded wait: if the stream dies the callback stops notifying
+                self._cond.wait(0.1 if remaining is None else min(remaining, 0.1))
+                if self.stream is None or not self.stream.is_active():
+                    return not self._queue
+            delay = self._dac_delay_s
+        time.sleep(delay) # Last buffer still travelling to the speaker
+        return True
+
+    def flush(self):
+        """Drops all queued audio immediately; the stream stays open."""
+        with self._cond:
+            self._queue.clear()
+            self._queued_bytes = 0
+            self._cond.notify_all()
+        if self._resampler is not None:
+            self._resampler.reset()
+
+    def reference_level_db(self, window_s=config.BARGE_IN_REFERENCE_WINDOW_MS / 1000) -> float | None:
+        """
+        Loudest level (dBFS) played within the last window_s, i.e. what the microphone may
+        currently be hearing as echo. None when nothing has been played in that window.
+        """
+        cutoff = time.perf_counter() - window_s
+        with self._cond:
+            levels = [db for played_at, db in self._levels if played_at >= cutoff]
+        return max(levels) if levels else None
+
+    def latency_stats(self) -> dict:
+        """Enqueue-to-first-sample latency over all enqueue() calls so far."""
+        values = sorted(self.latencies_s)
+        if not values:
+            return {"count": 0}
+        return {"count": len(values), "median_ms": values[len(values) // 2] * 1000,
+                "max_ms": values[-1] * 1000}
+
+    def play_audio_data(self, audio_data: bytes, sample_rate: int, channels: int, sample_width: int):
+        """
+        Plays raw audio data and waits until it has been played.
+
+        Args:
+            audio_data: Raw audio bytes.
+            sample_rate: Sample rate of the audio (e.g., 22050 for Piper default).
+            channels: Number of audio channels (e.g., 1 for mono).
+            sample_width: Sample width in bytes (e.g., 2 for 16-bit audio).
+        """
+        print(f"AudioOutput: Playing audio data ({len(audio_data)} bytes, {sample_rate}Hz, {channels}ch, {sample_width*8}-bit).")
+        if not self.enqueue(audio_data, sample_rate, channels, sample_width):
+            return False
+        self.drain()
+        print("AudioOutput: Finished playing audio data.")
+        return True
+
+    def play_pcm(self, audio_data: bytes, audio_format: dict):
+        """Plays PCM with a format dict as returned by TTSModule.synthesize() (sample_rate, channels, sample_width)."""
+        return self.play_audio_data(audio_data, audio_format["sample_rate"], audio_format["channels"],
+                                    audio_format["sample_width"])
 
     def play_wav_file(self, file_path: str):
         if not os.path.exists(file_path):
             print(f"AudioOutput Error: WAV file not found: {file_path}")
             return False
 
-        if self.stream and self.stream.is_active():
-            print("AudioOutput: Stream is already active. Stopping current playback.")
-            self.stop_playback()
-
         try:
-            with wave.open(file_path, \'rb\
-') as wf:
+            with wave.open(file_path, 'rb') as wf:
                 sample_rate = wf.getframerate()
                 channels = wf.getnchannels()
                 sample_width = wf.getsampwidth()
-                
-                self.stream = self.p.open(format=self.p.get_format_from_width(sample_width),
-                                         channels=channels,
-                                         rate=sample_rate,
-                                         output=True,
-                                         output_device_index=self.device_index)
-                
                 print(f"AudioOutput: Playing WAV file: {file_path} ({sample_rate}Hz, {channels}ch, {sample_width*8}-bit).")
-                data = wf.readframes(config.AUDIO_CHUNK_SIZE) # Read in chunks
-                self.stream.start_stream()
-                while data:
-                    self.stream.write(data)
-                    data = wf.readframes(config.AUDIO_CHUNK_SIZE)
-                
-                # self.stream.stop_stream() # Implicitly handled by close or wait
-                # self.stream.close()
-                print(f"AudioOutput: Finished playing {file_path}.")
-                return True
+                data = wf.readframes(wf.getnframes())
         except wave.Error as e:
             print(f"Error opening or reading WAV file {file_path}: {e}")
             return False
-        except Exception as e:
-            print(f"Error playing WAV file {file_path}: {e}")
-            if "Invalid output device" in str(e):
-                 print("Please check your speaker/audio output configuration.")
+        if not self.enqueue(data, sample_rate, channels, sample_width):
             return False
-        finally:
-            if self.stream:
-                if not self.stream.is_stopped():
-                    self.stream.stop_stream()
-                if self.stream.is_active():
-                    self.stream.close()
-                self.stream = None
+        self.drain()
+        print(f"AudioOutput: Finished playing {file_path}.")
+        return True
 
     def stop_playback(self):
-        if self.stream and self.stream.is_active():
+        """Stops playback immediately (queued audio is discarded, the stream stays open)."""
+        if self.is_playing:
+            self.flush()
+            print("AudioOutput: Playback stopped.")
+
+    def _close_stream(self):
+        if self.stream:
             try:
                 self.stream.stop_stream()
                 self.stream.close()
-                print("AudioOutput: Playback stopped and stream closed.")
             except Exception as e:
-                print(f"Error stopping playback: {e}")
+                print(f"Error closing audio output stream: {e}")
             finally:
                 self.stream = None
-        else:
-            print("AudioOutput: No active stream to stop.")
+                self._format = None
+
+    def close(self):
+        self.flush()
+        self._close_stream()
 
     def __del__(self):
-        self.stop_playback() # Ensure stream is closed
+        self.close() # Ensure stream is closed
         self.p.terminate()
         print("AudioOutput: Resources released.")
 
-if __name__ == \'__main__\':
-    import time
+def measure_enqueue_latency(audio_out: AudioOutput, sample_rate=22050, runs=10, clip_s=0.3) -> dict:
+    """
+    Plays short tone clips (22050 Hz mono, Piper's usual format) and reports the
+    latency from enqueue() to the first sample at the speaker. The first clip
+    includes opening the stream; later ones reuse it.
+    """
+    t = np.arange(int(sample_rate * clip_s)) / sample_rate
+    clip = (3000 * np.sin(2 * np.pi * 440 * t) * np.hanning(t.size)).astype(np.int16).tobytes()
+    audio_out.latencies_s.clear()
+    start = time.perf_counter()
+    audio_out.enqueue(clip, sample_rate)
+    open_s = time.perf_counter() - start
+    audio_out.drain()
+    for _ in range(runs - 1):
+        audio_out.enqueue(clip, sample_rate)
+        audio_out.drain()
+        time.sleep(0.05)
+    stats = audio_out.latency_stats()
+    print(f"Stream open: {open_s * 1000:.1f} ms ({'resampling' if audio_out._resampler else 'native format'})")
+    if stats["count"]:
+        print(f"Enqueue to first sample: median {stats['median_ms']:.1f} ms, max {stats['max_ms']:.1f} ms "
+              f"over {stats['count']} clips")
+    return stats
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--latency":
+        # python -m src.audio_output --latency [sample_rate]
+        measure_enqueue_latency(AudioOutput(), int(sys.argv[2]) if len(sys.argv) > 2 else 22050)
+        sys.exit(0)
+
     print("Testing AudioOutput module...")
     # This test requires a speaker/audio output and a test WAV file.
     # We will use the TTS module to generate a test file if possible.
 
-    # Create a dummy output directory if it doesn\'t exist
+    # Create a dummy output directory if it doesn't exist
     test_audio_dir = "test_audio_output"
     if not os.path.exists(test_audio_dir):
         os.makedirs(test_audio_dir)
@@ -170,25 +361,21 @@ if __name__ == \'__main__\':
         time.sleep(3) # Give some time for playback to finish if it runs in background
     else:
         print("Skipping WAV file playback test as test file is not available.")
-        print("You can manually place a WAV file at 	hemed_text_is_not_recognized_by_the_user_facing_tool} and re-run.")
+        print(f"You can manually place a WAV file at {test_wav_file} and re-run.")
 
     # Test playing raw data (e.g., from Piper --output-raw)
     # This requires knowing the sample rate, channels, and width from the TTS model.
-    # For Piper en_US-lessac-medium, it\'s typically 22050 Hz, 1 channel, 16-bit (2 bytes width)
+    # For Piper en_US-lessac-medium, it's typically 22050 Hz, 1 channel, 16-bit (2 bytes width)
     if tts_available:
         print("\n--- Playing raw audio data (generated by TTS) ---")
         tts_raw_test_text = "Testing raw audio playback."
         # Assuming TTSModule has speak_to_raw_audio method
         if hasattr(tts, 'speak_to_raw_audio'):
-            raw_audio_data = tts.speak_to_raw_audio(tts_raw_test_text)
-            if raw_audio_data:
-                # Determine params from Piper model (example, may need to get from config)
-                # Typically, Piper models are 16-bit mono. Sample rate varies.
-                # en_US-lessac-medium is 22050 Hz.
-                sample_rate_raw = 22050 # This should ideally come from model config
-                channels_raw = 1
-                sample_width_raw = 2 # 16-bit
-                audio_output.play_audio_data(raw_audio_data, sample_rate_raw, channels_raw, sample_width_raw)
+            synthesized = tts.synthesize(tts_raw_test_text)
+            if synthesized:
+                # Format (sample rate etc.) comes from the voice's .onnx.json config
+                raw_audio_data, audio_format = synthesized
+                audio_output.play_pcm(raw_audio_data, audio_format)
                 print("Waiting for 3 seconds after raw audio playback...")
                 time.sleep(3)
             else:
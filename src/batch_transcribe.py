@@ -0,0 +1,183 @@
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import numpy as np
+from . import config
+
+# One vosk.Model per worker process, loaded by the pool initializer.
+_worker_model = None
+
+def read_wav_header(file_path) -> dict:
+    """
+    Parses the RIFF chunks of a WAV file.
+
+    Returns:
+        A dict with sample_rate, channels, sample_width, data_offset and data_size (bytes).
+    Raises:
+        ValueError if the file is not a PCM WAV file.
+    """
+    with open(file_path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError(f"Not a RIFF/WAVE file: {file_path}")
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                extension = f.read(min(chunk_size - 16, 24))
+                if fmt[0] == 0xFFFE: # WAVE_FORMAT_EXTENSIBLE: the real format is the SubFormat GUID's first field
+                    if len(extension) < 24:
+                        raise ValueError(f"Truncated WAVE_FORMAT_EXTENSIBLE fmt chunk: {file_path}")
+                    fmt = (struct.unpack("<H", extension[8:10])[0],) + fmt[1:]
+                f.seek(chunk_size - 16 - len(extension) + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"WAV data chunk before fmt chunk: {file_path}")
+                audio_format, channels, sample_rate, _, _, bits = fmt
+                if audio_format != 1: # PCM, possibly as the subformat of WAVE_FORMAT_EXTENSIBLE
+                    raise ValueError(f"Unsupported WAV encoding {audio_format} (PCM required): {file_path}")
+                data_offset = f.tell()
+                # Streamed WAVs may carry a placeholder size; clamp to the real file size.
+                data_size = min(chunk_size, os.path.getsize(file_path) - data_offset)
+                return {"sample_rate": sample_rate, "channels": channels, "sample_width": bits // 8,
+                        "data_offset": data_offset, "data_size": data_size}
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    raise ValueError(f"No data chunk in WAV file: {file_path}")
+
+def iter_pcm_blocks(file_path, header, block_s=config.STT_BATCH_BLOCK_S):
+    """
+    Yields mono 16-bit PCM blocks of about block_s seconds from a memory-mapped WAV file.
+    Multi-channel audio is downmixed.
+    """
+    if header["sample_width"] != 2:
+        raise ValueError(f"Only 16-bit PCM is supported, got {header['sample_width'] * 8}-bit: {file_path}")
+    if header["data_size"] <= 0:
+        return
+    frame_bytes = 2 * header["channels"]
+    block_bytes = max(1, int(block_s * header["sample_rate"])) * frame_bytes
+    start, end = header["data_offset"], header["data_offset"] + header["data_size"]
+    end -= (end - start) % frame_bytes
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for pos in range(start, end, block_bytes):
+            block = mm[pos:min(pos + block_bytes, end)]
+            if header["channels"] > 1:
+                frames = np.frombuffer(block, dtype=np.int16).reshape(-1, header["channels"])
+                block = frames.mean(axis=1).astype(np.int16).tobytes()
+            yield block
+
+def transcribe_file(model, file_path, block_s=config.STT_BATCH_BLOCK_S, words=True, sample_rate=None) -> dict:
+    """
+    Transcribes one WAV file with the given vosk.Model. Returns a JSON-serialisable result record;
+    failures are reported in its "error" field. sample_rate overrides the header's rate.
+    """
+    import vosk
+    record = {"file": file_path}
+    start = time.perf_counter()
+    try:
+        header = read_wav_header(file_path)
+        record["audio_s"] = header["data_size"] / (header["sample_rate"] * header["channels"] * header["sample_width"])
+        recognizer = vosk.KaldiRecognizer(model, sample_rate or header["sample_rate"])
+        recognizer.SetWords(words)
+        segments = []
+        for block in iter_pcm_blocks(file_path, header, block_s):
+            if recognizer.AcceptWaveform(block):
+                segments.append(json.loads(recognizer.Result()))
+        segments.append(json.loads(recognizer.FinalResult()))
+        record["text"] = " ".join(seg.get("text", "") for seg in segments if seg.get("text")).strip()
+        if words:
+            record["words"] = [w for seg in segments for w in seg.get("result", [])]
+    except Exception as e:
+        record["error"] = str(e)
+    record["processing_s"] = time.perf_counter() - start
+    if record.get("audio_s"):
+        record["rtf"] = record["processing_s"] / record["audio_s"]
+    return record
+
+def _init_worker(model_path):
+    global _worker_model
+    import vosk
+    vosk.SetLogLevel(-1)
+    _worker_model = vosk.Model(model_path)
+
+def _transcribe_in_worker(args):
+    file_path, block_s, words = args
+    return transcribe_file(_worker_model, file_path, block_s, words)
+
+def transcribe_batch(file_paths, model_path, workers=None, block_s=config.STT_BATCH_BLOCK_S, words=True):
+    """
+    Transcribes files on a process pool (one vosk.Model per worker) and yields
+    result records as they complete, largest files first to balance the pool.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1))
+    ordered = sorted(file_paths, key=lambda p: os.path.getsize(p) if os.path.exists(p) else 0, reverse=True)
+    jobs = [(path, block_s, words) for path in ordered]
+    if workers == 1:
+        _init_worker(model_path)
+        for job in jobs:
+            yield _transcribe_in_worker(job)
+        return
+    with multiprocessing.Pool(processes=min(workers, len(jobs)) or 1, initializer=_init_worker,
+                              initargs=(model_path,)) as pool:
+        for record in pool.imap_unordered(_transcribe_in_worker, jobs):
+            yield record
+
+def _collect_wav_paths(inputs) -> list[str]:
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".wav")]
+        else:
+            paths.append(item)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-transcribe recorded WAV sessions with Vosk.")
+    parser.add_argument("inputs", nargs="+", help="WAV files or directories containing WAV files")
+    parser.add_argument("--language", default=config.DEFAULT_LANGUAGE, choices=config.SUPPORTED_LANGUAGES)
+    parser.add_argument("--model", help="Vosk model directory (defaults to the configured model for --language)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--block-seconds", type=float, default=config.STT_BATCH_BLOCK_S)
+    parser.add_argument("--no-words", action="store_true", help="Omit per-word timings")
+    parser.add_argument("--output", "-o", help="JSONL output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    model_path = args.model or (config.VOSK_MODEL_PATH_ZH if args.language == "zh" else config.VOSK_MODEL_PATH_EN)
+    if not os.path.exists(model_path):
+        print(f"STT Error: Vosk model path not found: {model_path}", file=sys.stderr)
+        return 1
+    paths = _collect_wav_paths(args.inputs)
+    if not paths:
+        print("No WAV files found.", file=sys.stderr)
+        return 1
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    total_audio_s, failed = 0.0, 0
+    start = time.perf_counter()
+    try:
+        for record in transcribe_batch(paths, model_path, args.workers, args.block_seconds, not args.no_words):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            total_audio_s += record.get("audio_s", 0.0)
+            failed += "error" in record
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    wall_s = time.perf_counter() - start
+    rtf = wall_s / total_audio_s if total_audio_s else float("nan")
+    print(f"Transcribed {len(paths) - failed}/{len(paths)} files, {total_audio_s:.1f}s of audio in {wall_s:.1f}s "
+          f"(real-time factor {rtf:.3f}, {1 / rtf if rtf else 0:.1f}x real time).", file=sys.stderr)
+    return 0 if failed == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
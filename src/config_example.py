@@ -7,17 +7,77 @@ ROOT_DIR = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Gemini API Configuration
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")  # 设置您的Gemini API密钥
 GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "gemini-2.0-flash")  # 可选模型: gemini-2.0-flash, gemini-1.0-pro等
+LLM_BACKEND = "rest"  # rest: 直接调用Gemini REST接口（复用连接，无需在启动时导入SDK）；sdk: 使用google-generativeai包（首次请求时才导入）
+GEMINI_API_BASE_URL = os.environ.get("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com")  # REST接口地址，测试时可指向本地服务器
+LLM_TIMEOUT_S = 15.0  # 每个请求的总截止时间（秒，含重试），超时后返回错误而不是卡住助手
+LLM_CONNECT_TIMEOUT_S = 3.0  # 建立连接的超时（秒）
+LLM_MAX_RETRIES = 2  # 网络错误、429/5xx 时的最大重试次数（指数退避加随机抖动）
+LLM_RETRY_BACKOFF_S = 0.5  # 首次重试的最大退避时间（秒），之后每次翻倍
+LLM_HEDGE_ENABLED = False  # 对冲请求：请求超过近期延迟的百分位仍未返回时再发一次相同请求，取先到者（会增加API用量）
+LLM_HEDGE_PERCENTILE = 95  # 对冲请求的延迟百分位阈值
+LLM_HEDGE_INITIAL_DELAY_S = 3.0  # 延迟样本不足时使用的对冲等待时间（秒）
+LLM_STREAM_STALL_TIMEOUT_S = 10.0  # 流式回复中两段文本之间的最长等待（秒）
+LLM_STREAMING = True  # 流式获取LLM回复，生成第一句后即开始播报（需TTS_PIPELINED）
+LLM_SPECULATIVE_DISPATCH = False  # 投机请求：语音识别给出完整的最终片段后立即请求LLM，若用户继续说话则丢弃并重新请求；开启后回复不再流式获取（LLM_STREAMING对无图像的请求不生效）
+LLM_CACHE_ENABLED = True  # 缓存完整回复：相同请求（规范化文本、语言、场景）直接复用，省去一次LLM往返
+LLM_CACHE_TTL_S = 600  # 缓存条目有效期（秒）
+LLM_CACHE_MAX_ENTRIES = 256  # 最多缓存的回复条数，超出时按LRU淘汰
+LLM_CACHE_PATH = str(ROOT_DIR / "llm_cache.json")  # 缓存持久化文件（跨重启保留）；设为None则只用内存
+LLM_CACHE_SAVE_DELAY_S = 5.0  # 缓存变更后延迟多久由后台线程写盘（秒），合并连续写入，回复路径不等待SD卡
+LLM_CACHE_BYPASS_KEYWORDS = ["time", "date", "today", "weather", "news", "latest", "random", "joke",
+                             "几点", "时间", "日期", "今天", "天气", "新闻", "最新", "随机", "笑话"]  # 含这些词的请求答案会变化，不使用缓存
+
+# Conversation Context Configuration（多轮对话上下文）
+CONVERSATION_ENABLED = True             # 将最近几轮对话附在请求前，支持"它是什么颜色？"之类的追问
+CONVERSATION_TOKEN_BUDGET = 600         # 提示词（含历史）的估算token上限，使提示长度与LLM延迟不随对话增长
+CONVERSATION_MAX_TURNS = 10             # 最多保存的历史轮数
+CONVERSATION_KEEP_RECENT_TURNS = 2      # 最近几轮原文保留，更早的轮次压缩为前几句
+CONVERSATION_TURN_MAX_TOKENS = 60       # 压缩后每轮回复的估算token上限
+CONVERSATION_VISION_MAX_AGE_TURNS = 2   # 视觉描述在拍摄后的几轮内仍随请求发送
+CONVERSATION_IDLE_RESET_S = 300         # 超过该秒数无对话则清空历史，设为0不清空
 
 # Audio Configuration
 AUDIO_INPUT_DEVICE_INDEX = None  # 使用默认麦克风，或指定设备索引，例如1
 AUDIO_SAMPLE_RATE = 16000
 AUDIO_CHANNELS = 1
 AUDIO_CHUNK_SIZE = 1024
+AUDIO_CAPTURE_SAMPLE_RATE = None      # 麦克风采集采样率，None表示使用设备原生采样率（如44100/48000），再重采样到AUDIO_SAMPLE_RATE
+AUDIO_CAPTURE_CHANNELS = None         # 麦克风采集声道数，None表示使用设备原生声道数（最多2），再混合为单声道
+AUDIO_BUFFER_MS = 1000                # 麦克风环形缓冲区容量（毫秒），处理阻塞时超出部分被丢弃
+AUDIO_BUFFER_POLICY = "drop_oldest"   # 缓冲区满时的策略: drop_oldest（丢弃最旧音频）或 drop_newest（丢弃新音频）
+AUDIO_OUTPUT_FRAMES_PER_BUFFER = 1024 # 扬声器输出流每次回调的帧数，越小延迟越低但更易断音
+AUDIO_OUTPUT_VOLUME = 1.0             # 播放音量（0.0-1.0），可用"大声一点/小声一点"等语音命令调整
+AUDIO_OUTPUT_VOLUME_STEP = 0.2        # 每次语音调节音量的步长
+
+# Voice Activity Detection (VAD) Configuration
+VAD_ENABLED = True            # 启用基于能量/过零率的语音端点检测
+VAD_FRAME_MS = 20             # VAD分析帧长（毫秒）
+VAD_ENERGY_MARGIN_DB = 10.0   # 高于背景噪声多少dB视为语音
+VAD_MIN_ENERGY_DB = -50.0     # 语音帧的最低绝对能量（dBFS）
+VAD_START_MS = 60             # 连续语音超过该时长才触发 speech_start
+VAD_HANGOVER_MS = 400         # 静音持续超过该时长才触发 speech_end（拖尾时间）
+
+# Barge-in Configuration（播放时用户插话打断）
+BARGE_IN_ENABLED = True             # 播放回复时继续监听麦克风，检测到用户说话即停止播放并开始新一轮
+BARGE_IN_MARGIN_DB = 6.0            # 麦克风电平需高于预测回声电平多少dB才视为用户语音
+BARGE_IN_MIN_MS = 150               # 用户语音持续超过该时长才触发打断
+BARGE_IN_ECHO_COUPLING_DB = -10.0   # 扬声器到麦克风回声耦合的初始估计（dB），运行中自适应
+BARGE_IN_REFERENCE_WINDOW_MS = 250  # 参考信号电平取最近多长时间内的最大值，用于覆盖回声延迟
 
 # STT (Vosk) Configuration
 VOSK_MODEL_PATH_EN = str(ROOT_DIR / "models/vosk/vosk-model-small-en-us-0.15")  # 英文语音识别模型路径
 VOSK_MODEL_PATH_ZH = str(ROOT_DIR / "models/vosk/vosk-model-small-cn-0.22")     # 中文语音识别模型路径
 # 这些路径应指向已下载的Vosk模型位置，请参考README中的下载说明
+STT_PARTIAL_INTERVAL_S = 0.25  # 部分识别结果的最小输出间隔（秒），降低JSON解析开销
+STT_PREROLL_MS = 300           # 语音开始前保留的音频（毫秒），避免丢失首音节
+WAKE_WORD_ENABLED = False      # 唤醒词模式：空闲时只用受限语法识别唤醒词，听到后才启用完整识别
+WAKE_WORD_ACTIVE_S = 10.0      # 唤醒后（及每次回答后）保持完整识别的时长（秒）
+# 每种语言的唤醒词（键需在 SUPPORTED_LANGUAGES 中）；词语必须在Vosk模型词表内，中文以空格分词
+WAKE_WORD_PHRASES = {
+    "en": ["hey assistant", "hello assistant"],
+    "zh": ["你好 助手", "小 助手"],
+}
+STT_BATCH_BLOCK_S = 4.0        # 批量转写时每次送入识别器的音频块长度（秒）
 
 # TTS (Piper) Configuration
 PIPER_MODEL_PATH_EN = str(ROOT_DIR / "models/piper/en_US-lessac-medium.onnx")      # 英文语音合成模型路径
@@ -25,9 +85,51 @@ PIPER_CONFIG_PATH_EN = str(ROOT_DIR / "models/piper/en_US-lessac-medium.onnx.jso
 PIPER_MODEL_PATH_ZH = str(ROOT_DIR / "models/piper/zh_CN-huayan-medium.onnx")      # 中文语音合成模型路径
 PIPER_CONFIG_PATH_ZH = str(ROOT_DIR / "models/piper/zh_CN-huayan-medium.onnx.json")
 # 这些路径应指向已下载的Piper模型位置，请参考README中的下载说明
+TTS_PIPELINED = True       # 分句流水线播放：播放第N句时合成第N+1句
+TTS_FIRST_CLAUSE_CHARS = 60  # 第一个分句的最大长度（字符），越短首音越快
+TTS_MAX_CLAUSE_CHARS = 160   # 其余分句的最大长度（字符）
+TTS_MIN_CLAUSE_CHARS = 12    # 短于该长度的分句与相邻分句合并
+TTS_BACKEND = "inprocess"  # "inprocess": 进程内加载PiperVoice并复用ONNX会话（需piper-tts包）；"subprocess": 每次调用piper可执行文件
+TTS_CACHE_ENABLED = True    # 缓存合成好的语音（按音色、配置和规范化文本寻址），重复短语无需再次合成
+TTS_CACHE_MEMORY_MB = 32    # 内存缓存上限（MB），超出按LRU淘汰
+TTS_CACHE_DIR = str(ROOT_DIR / "tts_cache")  # 磁盘缓存目录（跨重启保留预热短语）；设为None则只用内存
+TTS_CACHE_PERSIST_ALL = False  # 是否把所有合成语音（包括LLM回复）都写入磁盘；默认只写入预热短语
+TTS_CACHE_DISK_MB = 200     # 磁盘缓存上限（MB），超出删除最久未用的条目
+# 启动时在后台预合成的固定短语，首次播放即可命中缓存
+TTS_PREWARM_PHRASES = {
+    "en": ["Hello! How can I help you today?", "Language switched to en.", "Goodbye!", "Shutting down."],
+    "zh": ["你好！今天我能帮你做些什么？", "语言已切换到中文。", "再见！", "正在关机。"],
+}
+
+# Model Registry Configuration
+MODEL_PRELOAD_LANGUAGES = ["en", "zh"]  # 启动时在后台预加载这些语言的STT/TTS模型，设为[]则按需加载
+MODEL_MEMORY_BUDGET_MB = 1024           # 已加载模型的内存预算（MB），超出时按LRU淘汰未被引用的模型
 
 # Vision (MediaPipe) Configuration
-# MediaPipe模型通常由库内部处理，无需额外配置
+VISION_BACKEND = "tasks"  # tasks: MediaPipe Tasks ObjectDetector（EfficientDet-Lite，输出真实类别名）；legacy: 旧版 mp.solutions 检测器
+VISION_MODEL_PATH = str(ROOT_DIR / "models/vision/efficientdet_lite0_int8.tflite")  # 检测模型路径（int8量化），不存在时回退到legacy
+VISION_RUNNING_MODE = "live_stream"  # live_stream: 异步检测，推理与采集重叠；image: 同步逐帧检测
+VISION_MAX_RESULTS = 5  # 每帧最多返回的物体数
+VISION_SCORE_THRESHOLD = 0.5  # 检测置信度阈值
+VISION_CHANGE_GATING = True  # 画面无明显变化时跳过检测，复用上一次的结果
+VISION_CHANGE_THRESHOLD = 0.01  # 缩小灰度图（32x24）中发生变化的格子比例超过该值即视为场景变化
+VISION_CHANGE_PIXEL_DELTA = 20  # 单个格子的灰度变化超过该值（0-255）才算变化，用于忽略传感器噪声
+VISION_CHANGE_MAX_AGE_S = 5.0  # 复用的检测结果最长保留时间（秒），超过后强制重新检测
+VISION_TRACKING_ENABLED = False  # 连续视觉跟踪：每N帧检测一次，其间用光流移动检测框，物体保持稳定的跟踪ID（适合较高的VISION_WORKER_RATE_HZ）
+VISION_DETECT_EVERY_N = 5  # 跟踪时每隔多少帧运行一次检测器
+VISION_TRACK_REFRESH_CONFIDENCE = 0.4  # 光流跟踪置信度低于该值时提前运行检测器
+VISION_TRACK_IOU_THRESHOLD = 0.3  # 检测框与跟踪框匹配所需的最小IoU（同类别）
+VISION_TRACK_MAX_MISSES = 2  # 连续几次检测未匹配后删除跟踪
+VISION_TRACK_MAX_AGE_S = 1.0  # 距上次检测超过该时间（秒）则重新检测，而不是用光流推算（如每次语音命令才取一帧时）
+VISION_WORKER_ENABLED = False  # 常驻视觉线程：后台以低频率持续检测，视觉命令直接读取最新结果（摄像头常开，占用CPU）
+VISION_WORKER_RATE_HZ = 1.0  # 后台检测频率（次/秒）
+VISION_MAX_STALENESS_S = 2.0  # 视觉命令可接受的最旧检测结果（秒），更旧时等待一次新的检测
+LLM_IMAGE_MODE = "auto"  # 是否把摄像头画面本身发送给LLM: auto（检测结果不可靠时才发送）、always、never
+LLM_IMAGE_ATTACH_BELOW_CONFIDENCE = 0.7  # auto模式下，有物体置信度低于该值（或未检测到物体）时附带图像
+LLM_IMAGE_MAX_SIDE = 512  # 发送图像的最长边（像素），在内存中缩放
+LLM_IMAGE_MAX_BYTES = 60000  # JPEG大小上限（字节），超出时依次降低质量和分辨率，适应慢速上行链路
+LLM_IMAGE_JPEG_QUALITY = 80  # 初始JPEG质量
+LLM_IMAGE_MIN_QUALITY = 40  # 降低质量的下限，再超出则缩小分辨率
 
 # Logging Configuration
 LOG_LEVEL = "INFO"  # 可选: DEBUG, INFO, WARNING, ERROR, CRITICAL
@@ -0,0 +1,211 @@
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from . import config
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|(?<=[。！？；…])")
+
+def estimate_tokens(text) -> int:
+    """
+    Rough token count without a tokenizer: one token per CJK character, about four
+    characters per token for everything else. Good enough to keep prompts bounded.
+    """
+    cjk = sum(1 for char in text if "　" <= char <= "鿿" or "＀" <= char <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+def truncate_to_tokens(text, max_tokens) -> str:
+    """Shortens text to max_tokens, preferring to cut at a sentence end; marks cuts with "…"."""
+    text = text.strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = None
+    for match in _SENTENCE_END.finditer(text):
+        if estimate_tokens(text[:match.start()]) > max_tokens:
+            break
+        cut = match.start()
+    if cut: # Whole sentences fit
+        return text[:cut].strip()
+    low, high = 0, len(text) # Longest prefix within budget
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) < max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
+
+class _Turn:
+    __slots__ = ("user", "assistant", "vision", "timestamp")
+
+    def __init__(self, user, assistant, vision):
+        self.user = user
+        self.assistant = assistant
+        self.vision = vision
+        self.timestamp = time.time()
+
+class ConversationManager:
+    """
+    Multi-turn context for the otherwise stateless LLM calls, with a bounded prompt size.
+
+    build_prompt() renders the recent turns in front of the new request. The
+    newest keep_recent turns are included verbatim; older ones are compressed to
+    turn_max_tokens each (first sentences of the reply), and the oldest are left
+    out once the prompt would exceed token_budget. Vision context is only carried
+    for vision_max_age turns after the capture it came from, so follow-ups like
+    "what colour is it?" still resolve but stale scene descriptions do not pile
+    up. History is forgotten after idle_reset_s without a turn.
+
+    The prompt, and with it the LLM latency, therefore stops growing after a few turns.
+    """
+    def __init__(self, token_budget=config.CONVERSATION_TOKEN_BUDGET, max_turns=config.CONVERSATION_MAX_TURNS,
+                 keep_recent=config.CONVERSATION_KEEP_RECENT_TURNS, turn_max_tokens=config.CONVERSATION_TURN_MAX_TOKENS,
+                 vision_max_age=config.CONVERSATION_VISION_MAX_AGE_TURNS, idle_reset_s=config.CONVERSATION_IDLE_RESET_S):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.turn_max_tokens = turn_max_tokens
+        self.vision_max_age = vision_max_age
+        self.idle_reset_s = idle_reset_s
+        self._turns = deque(maxlen=max_turns) # Oldest first
+        self._lock = threading.Lock()
+        # Shape of the last prompt built
+        self.last_prompt_tokens = 0
+        self.last_turns_included = 0
+        self.last_turns_compressed = 0
+
+    def build_prompt(self, user_text, vision_context=None) -> str:
+        """
+        Prompt for a new request. Without history this is the request itself
+        (plus " Current visual context: ..."), exactly as a single-turn prompt.
+        """
+        request = user_text
+        if vision_context:
+            request += f" Current visual context: {vision_context}"
+        with self._lock:
+            self._expire_locked()
+            turns = list(self._turns)
+            if not turns:
+                self.last_prompt_tokens, self.last_turns_included, self.last_turns_compressed = estimate_tokens(request), 0, 0
+                return request
+
+        header = "Conversation so far (most recent last):"
+        footer = f"Current request:\nUser: {request}"
+        used = estimate_tokens(header) + estimate_tokens(footer)
+
+        # The latest scene description still in range, unless a new one was just captured
+        vision_line = None
+        if not vision_context:
+            for age, turn in enumerate(reversed(turns), start=1):
+                if age > self.vision_max_age:
+                    break
+                if turn.vision:
+                    vision_line = f"(Visual context from {age} turn(s) ago: " \
+                                  f"{truncate_to_tokens(turn.vision, self.turn_max_tokens)})"
+                    used += estimate_tokens(vision_line)
+                    break
+
+        lines = [] # Newest first while filling the budget
+        compressed = 0
+        for age, turn in enumerate(reversed(turns), start=1):
+            if age <= self.keep_recent:
+                user, reply = turn.user, turn.assistant
+            else:
+                user, reply = self._compress(turn)
+            entry = f"User: {user}\nAssistant: {reply}"
+            cost = estimate_tokens(entry)
+            if used + cost > self.token_budget and age <= self.keep_recent:
+                user, reply = self._compress(turn) # Even recent turns give way to the budget
+                entry = f"User: {user}\nAssistant: {reply}"
+                cost = estimate_tokens(entry)
+            if used + cost > self.token_budget:
+                break
+            if (user, reply) != (turn.user, turn.assistant):
+                compressed += 1
+            lines.append(entry)
+            used += cost
+
+        prompt_lines = [header] + lines[::-1]
+        if vision_line:
+            prompt_lines.append(vision_line)
+        prompt_lines.append(footer)
+        prompt = "\n".join(prompt_lines)
+        with self._lock:
+            self.last_prompt_tokens = used
+            self.last_turns_included = len(lines)
+            self.last_turns_compressed = compressed
+        return prompt
+
+    def record(self, user_text, reply, vision_context=None):
+        """Adds a finished exchange. Error replies are not recorded: they carry no context."""
+        if not user_text or not reply or reply.startswith("LLM Error:"):
+            return
+        with self._lock:
+            self._expire_locked()
+            self._turns.append(_Turn(user_text.strip(), reply.strip(), vision_context))
+
+    def history_digest(self) -> str:
+        """Identifies the recorded history ("" without one), e.g. for caching replies that depend on it."""
+        with self._lock:
+            self._expire_locked()
+            if not self._turns:
+                return ""
+            history = "\n".join(f"{turn.user}\n{turn.assistant}" for turn in self._turns)
+        return hashlib.sha1(history.encode("utf-8")).hexdigest()[:16]
+
+    def reset(self):
+        with self._lock:
+            self._turns.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._turns)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"turns": len(self._turns), "last_prompt_tokens": self.last_prompt_tokens,
+                    "last_turns_included": self.last_turns_included,
+                    "last_turns_compressed": self.last_turns_compressed}
+
+    def _compress(self, turn) -> tuple[str, str]:
+        return (truncate_to_tokens(turn.user, self.turn_max_tokens // 2),
+                truncate_to_tokens(turn.assistant, self.turn_max_tokens))
+
+    def _expire_locked(self):
+        if self._turns and self.idle_reset_s and time.time() - self._turns[-1].timestamp > self.idle_reset_s:
+            self._turns.clear()
+
+def benchmark(turns=40, reply_sentences=4) -> list[int]:
+    """
+    Simulates a long session and prints the prompt size per turn: naive full
+    history versus the budgeted manager. Returns the budgeted sizes.
+    """
+    manager = ConversationManager(idle_reset_s=0)
+    naive_history = ""
+    sizes = []
+    for i in range(1, turns + 1):
+        question = f"Question number {i}: what about the object on the left of the desk?"
+        vision = f"Detected objects: a cup (confidence: 0.9{i % 10}), a laptop (confidence: 0.87)." if i % 5 == 1 else None
+        prompt = manager.build_prompt(question, vision)
+        naive_prompt = naive_history + question + (f" Current visual context: {vision}" if vision else "")
+        reply = " ".join(f"Sentence {s} of answer {i} describes the cup, its colour and where it is placed."
+                         for s in range(reply_sentences))
+        manager.record(question, reply, vision)
+        naive_history = f"{naive_prompt}\n{reply}\n"
+        sizes.append(estimate_tokens(prompt))
+        if i in (1, 2, 5, 10, 20, turns):
+            print(f"Turn {i:3d}: naive history {estimate_tokens(naive_prompt):6d} tokens, "
+                  f"budgeted {sizes[-1]:5d} tokens ({manager.last_turns_included} turns included)")
+    print(f"Budget {manager.token_budget} tokens, stats: {manager.stats()}")
+    return sizes
+
+if __name__ == "__main__":
+    import sys
+    # python -m src.conversation --bench
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        sizes = benchmark()
+        sys.exit(0 if max(sizes) <= ConversationManager().token_budget else 1)
+    manager = ConversationManager()
+    manager.record("What do you see?", "I see a red cup on a wooden desk next to a laptop.",
+                   "Detected objects: a cup (confidence: 0.91), a laptop (confidence: 0.85).")
+    print(manager.build_prompt("What colour is it?"))
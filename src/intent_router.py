@@ -0,0 +1,219 @@
+import re
+import time
+import unicodedata
+from collections import deque
+
+# Intents
+SWITCH_TO_CHINESE = "switch_to_chinese"
+SWITCH_TO_ENGLISH = "switch_to_english"
+EXIT = "exit"
+TIME = "time"
+DATE = "date"
+VOLUME_UP = "volume_up"
+VOLUME_DOWN = "volume_down"
+VISION = "vision" # Not handled locally: the frame description is added to the LLM prompt
+
+# Trigger phrases of both languages. Chinese phrases are matched with spaces removed,
+# since Vosk separates Chinese words with spaces.
+INTENT_PHRASES = {
+    SWITCH_TO_CHINESE: ["switch to chinese", "切换到中文"],
+    SWITCH_TO_ENGLISH: ["switch to english", "切换到英文"],
+    EXIT: ["exit", "quit", "stop listening", "再见", "退出"],
+    TIME: ["what time is it", "what's the time", "what is the time", "tell me the time", "current time",
+           "几点了", "现在几点", "现在是几点", "现在的时间"],
+    DATE: ["what's the date", "what is the date", "what date is it", "what day is it", "what day is today",
+           "today's date", "今天几号", "今天是几号", "今天星期几", "今天是星期几", "今天的日期"],
+    VOLUME_UP: ["volume up", "louder", "turn it up", "turn up the volume", "increase the volume",
+                "大声一点", "大声点", "调大音量", "音量调大", "声音大一点"],
+    VOLUME_DOWN: ["volume down", "quieter", "turn it down", "turn down the volume", "lower the volume",
+                  "decrease the volume", "小声一点", "小声点", "调小音量", "音量调小", "声音小一点"],
+    VISION: ["what do you see", "describe the scene", "look around", "这是什么", "看见什么了"],
+}
+
+# When several intents match, the first in this order wins (as the old if/elif chain did)
+LOCAL_INTENTS = [SWITCH_TO_CHINESE, SWITCH_TO_ENGLISH, EXIT, TIME, DATE, VOLUME_UP, VOLUME_DOWN]
+
+_CJK_SPACE = re.compile(r"(?<=[　-鿿＀-￯])\s+|\s+(?=[　-鿿＀-￯])")
+
+def normalize_command(text) -> str:
+    """Lower case, NFKC (full-width -> ASCII forms), collapsed whitespace, no spaces around CJK characters."""
+    text = " ".join(text.lower().split())
+    if text.isascii():
+        return text
+    return _CJK_SPACE.sub("", unicodedata.normalize("NFKC", text))
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a fixed set of phrases: finds every phrase occurrence
+    in one pass over the text, however many phrases there are.
+    """
+    def __init__(self, phrases):
+        self._goto = [{}] # state -> {char: next state}
+        self._fail = [0]
+        self._output = [[]] # state -> phrases ending here
+        for phrase in phrases:
+            state = 0
+            for char in phrase:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(phrase)
+        # Breadth-first: a state's failure link is the longest proper suffix that is also a prefix
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """Yields (end index, phrase) for every occurrence, overlapping ones included."""
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for phrase in output[state]:
+                yield i + 1, phrase
+
+class IntentRouter:
+    """
+    Matches a command against all trigger phrases at once with a compiled
+    Aho-Corasick automaton. English phrases only match whole words ("quit" does not
+    match "quite"); Chinese phrases match anywhere.
+    """
+    def __init__(self, phrases=INTENT_PHRASES):
+        self._intent_of = {}
+        for intent, intent_phrases in phrases.items():
+            for phrase in intent_phrases:
+                self._intent_of[normalize_command(phrase)] = intent
+        self._automaton = AhoCorasick(self._intent_of)
+
+    def intents(self, text) -> set[str]:
+        """All intents whose trigger phrases occur in text."""
+        text = normalize_command(text)
+        found = set()
+        for end, phrase in self._automaton.find(text):
+            start = end - len(phrase)
+            if phrase.isascii() and ((start > 0 and text[start - 1].isalnum()) or
+                                     (end < len(text) and text[end].isalnum())):
+                continue
+            found.add(self._intent_of[phrase])
+        return found
+
+    def route(self, text) -> str | None:
+        """The local intent to handle text with, or None if it goes to the LLM."""
+        found = self.intents(text)
+        return next((intent for intent in LOCAL_INTENTS if intent in found), None)
+
+def describe_time(language, now=None) -> str:
+    now = now or time.localtime()
+    if language == "zh":
+        period = "上午" if now.tm_hour < 12 else "下午"
+        return f"现在是{period}{(now.tm_hour % 12) or 12}点{now.tm_min:02d}分。"
+    return f"It's {(now.tm_hour % 12) or 12}:{now.tm_min:02d} {'AM' if now.tm_hour < 12 else 'PM'}."
+
+def describe_date(language, now=None) -> str:
+    now = now or time.localtime()
+    if language == "zh":
+        weekday = "一二三四五六日"[now.tm_wday]
+        return f"今天是{now.tm_year}年{now.tm_mon}月{now.tm_mday}日，星期{weekday}。"
+    return f"Today is {time.strftime('%A, %B', now)} {now.tm_mday}, {now.tm_year}."
+
+def _measure_llm_round_trip(phrases, model_delay_s, live) -> dict:
+    """
+    Seconds until each phrase's LLM reply arrives. live: through get_llm_response() and the
+    configured Gemini API. Otherwise through the same LLMClient/REST path against a local
+    stand-in server that takes model_delay_s to answer, so the request, JSON and client
+    overheads are measured rather than assumed.
+    """
+    round_trips = {}
+    if live:
+        from .llm_module import get_llm_response
+        for phrase in phrases:
+            start = time.perf_counter()
+            get_llm_response(phrase)
+            round_trips[phrase] = time.perf_counter() - start
+        return round_trips
+    from .llm_client import LLMClient, RestTransport, _StandInServer
+    server = _StandInServer({phrase: [("ok", model_delay_s, "A reply.")] for phrase in phrases})
+    try:
+        client = LLMClient(RestTransport(model_name="stand-in", api_key="test", base_url=server.url), hedge=False)
+        client.generate(phrases[0]) # Connection set-up, as for an assistant that is already running
+        for phrase in phrases:
+            start = time.perf_counter()
+            client.generate(phrase)
+            round_trips[phrase] = time.perf_counter() - start
+    finally:
+        server.close()
+    return round_trips
+
+def benchmark(model_delay_s=1.0, live=False, rounds=2000) -> dict:
+    """
+    Routing cost of the compiled router against the substring scans it replaces, and
+    the end-to-end latency saved per local intent: the measured LLM round trip for its
+    phrase minus the measured routing and local handler time (see _measure_llm_round_trip
+    for live and model_delay_s).
+    """
+    commands = ["what time is it", "switch to chinese", "please exit now", "turn it up a bit", "what's the date today",
+                "现在 几点 了", "切换 到 英文", "tell me about the history of the roman empire in a few sentences",
+                "what do you see on the table", "今天 天气 怎么样"]
+    phrase_lists = list(INTENT_PHRASES.items())
+    def substring_route(text):
+        lower = text.lower()
+        return [intent for intent, phrases in phrase_lists if any(p in lower for p in phrases)]
+
+    router = IntentRouter()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for command in commands:
+            router.route(command)
+    compiled_us = (time.perf_counter() - start) / (rounds * len(commands)) * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for command in commands:
+            substring_route(command)
+    substring_us = (time.perf_counter() - start) / (rounds * len(commands)) * 1e6
+    print(f"Routing: compiled {compiled_us:.1f} us/command, substring scans {substring_us:.1f} us/command "
+          f"({sum(len(p) for _, p in phrase_lists)} phrases)")
+    # Substring scans miss Chinese commands with Vosk's word spacing, and match "quit" in "quite"
+    for command in commands:
+        print(f"  {command!r:70} -> {router.route(command) or ('llm+vision' if VISION in router.intents(command) else 'llm')}")
+
+    handlers = {TIME: lambda: describe_time("en"), DATE: lambda: describe_date("en")}
+    round_trips = _measure_llm_round_trip([INTENT_PHRASES[intent][0] for intent in LOCAL_INTENTS], model_delay_s, live)
+    saved = {}
+    for intent in LOCAL_INTENTS:
+        phrase = INTENT_PHRASES[intent][0]
+        handler = handlers.get(intent, lambda: None) # Others only change state (language, volume, exit)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            router.route(phrase)
+            handler()
+        local_s = (time.perf_counter() - start) / rounds
+        saved[intent] = round_trips[phrase] - local_s
+        print(f"  {intent:18} local {local_s * 1e6:7.1f} us, LLM round trip {round_trips[phrase] * 1000:6.1f} ms "
+              f"-> saves {saved[intent] * 1000:6.1f} ms")
+    return {"compiled_us": compiled_us, "substring_us": substring_us, "saved_s": saved}
+
+if __name__ == "__main__":
+    import sys
+    # python -m src.intent_router --bench [model_delay_s | live] | python -m src.intent_router "command"
+    args = sys.argv[1:]
+    if args and args[0] == "--bench":
+        live = len(args) > 1 and args[1] == "live"
+        benchmark(float(args[1]) if len(args) > 1 and not live else 1.0, live=live)
+    else:
+        router = IntentRouter()
+        for command in args or ["switch to chinese", "现在 几点 了", "quite interesting", "what do you see"]:
+            print(f"{command!r}: route={router.route(command)}, intents={sorted(router.intents(command))}")
@@ -0,0 +1,534 @@
+import base64
+import io
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from . import config
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class LLMRequestError(Exception):
+    """A failed LLM request. retryable: transient (network, 429/5xx) rather than a bad request or key."""
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+class LLMTimeoutError(LLMRequestError):
+    def __init__(self, message):
+        super().__init__(message, retryable=True)
+
+class _TextResponse:
+    """Minimal stand-in for a google.generativeai response (or stream chunk): .text and .parts."""
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+
+def _to_parts(contents) -> list[dict]:
+    """generate_content() contents (a prompt, or a list of strings, image blobs, PIL images and JPEG bytes) as REST parts."""
+    items = contents if isinstance(contents, (list, tuple)) else [contents]
+    parts = []
+    for item in items:
+        if isinstance(item, str):
+            parts.append({"text": item})
+            continue
+        if isinstance(item, dict): # {"mime_type": ..., "data": bytes}, as the SDK accepts
+            parts.append({"inline_data": {"mime_type": item["mime_type"],
+                                          "data": base64.b64encode(item["data"]).decode("ascii")}})
+            continue
+        if isinstance(item, (bytes, bytearray)):
+            jpeg = bytes(item)
+        else: # PIL image
+            buffer = io.BytesIO()
+            item.convert("RGB").save(buffer, format="JPEG", quality=85)
+            jpeg = buffer.getvalue()
+        parts.append({"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(jpeg).decode("ascii")}})
+    return parts
+
+class _Call:
+    """
+    Shared by the attempts (retries, hedge) of one generate() call. Once the call is
+    decided (answered, failed or past its deadline), cancel() stops further retries
+    and closes responses still being read, so abandoned attempts free their worker.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._responses = set()
+        self._lock = threading.Lock()
+
+    def register(self, response) -> bool:
+        with self._lock:
+            if not self.cancelled:
+                self._responses.add(response)
+            return not self.cancelled
+
+    def unregister(self, response):
+        with self._lock:
+            self._responses.discard(response)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            responses, self._responses = self._responses, set()
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+def _response_text(payload) -> str:
+    try:
+        parts = payload["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        return ""
+    return "".join(part.get("text", "") for part in parts)
+
+class RestTransport:
+    """
+    Gemini REST API over one requests.Session, so the TCP/TLS connection is reused
+    across requests instead of being set up for every question. base_url can point
+    at a local stand-in server for tests.
+    """
+    def __init__(self, model_name=config.GEMINI_MODEL_NAME, api_key=config.GEMINI_API_KEY,
+                 base_url=config.GEMINI_API_BASE_URL, connect_timeout_s=config.LLM_CONNECT_TIMEOUT_S):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}"
+        self.connect_timeout_s = connect_timeout_s
+        self.session = requests.Session()
+        # One connection per LLMClient worker thread
+        self.session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+    def request(self, contents, timeout_s, call=None) -> str:
+        """Reply text. With a call, the response can be closed mid-read when the call is abandoned."""
+        response = self._post(":generateContent", contents, timeout_s, stream=True)
+        if call is not None and not call.register(response):
+            response.close()
+            raise LLMRequestError("Request abandoned")
+        try:
+            return _response_text(json.loads(response.content))
+        except Exception as e:
+            if call is not None and call.cancelled:
+                raise LLMRequestError("Request abandoned") from e
+            if isinstance(e, requests.exceptions.Timeout):
+                raise LLMTimeoutError(f"Request timed out: {e}") from e
+            if isinstance(e, requests.exceptions.RequestException):
+                raise LLMRequestError(f"Connection failed: {e}", retryable=True) from e
+            raise
+        finally:
+            if call is not None:
+                call.unregister(response)
+            response.close()
+
+    def stream(self, contents, stall_timeout_s):
+        """Yields text chunks of a server-sent-events stream; stall_timeout_s bounds the wait for each chunk."""
+        response = self._post(":streamGenerateContent?alt=sse", contents, stall_timeout_s, stream=True)
+        response.encoding = "utf-8" # text/event-stream carries no charset
+        try:
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if line and line.startswith("data:"):
+                    text = _response_text(json.loads(line[5:]))
+                    if text:
+                        yield text
+        except requests.exceptions.RequestException as e:
+            raise LLMRequestError(f"Stream interrupted: {e}", retryable=True) from e
+        finally:
+            response.close()
+
+    def _post(self, method, contents, timeout_s, stream=False):
+        body = {"contents": [{"role": "user", "parts": _to_parts(contents)}]}
+        try:
+            response = self.session.post(self.url + method, json=body, stream=stream,
+                                         headers={"x-goog-api-key": self.api_key},
+                                         timeout=(min(self.connect_timeout_s, timeout_s), timeout_s))
+        except requests.exceptions.Timeout as e:
+            raise LLMTimeoutError(f"Request timed out: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise LLMRequestError(f"Connection failed: {e}", retryable=True) from e
+        if response.status_code != 200:
+            try:
+                message = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = response.text[:200]
+            response.close()
+            raise LLMRequestError(f"HTTP {response.status_code}: {message}", status=response.status_code,
+                                  retryable=response.status_code in RETRYABLE_STATUS)
+        return response
+
+class SDKTransport:
+    """google-generativeai package, imported and configured on first use rather than at startup."""
+    _RETRYABLE_ERRORS = {"ServiceUnavailable", "DeadlineExceeded", "ResourceExhausted", "InternalServerError",
+                         "TooManyRequests", "GatewayTimeout"}
+
+    def __init__(self, model_name=config.GEMINI_MODEL_NAME, api_key=config.GEMINI_API_KEY):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def request(self, contents, timeout_s, call=None) -> str:
+        # The SDK call cannot be interrupted; timeout_s (the time left to the deadline) bounds it.
+        try:
+            response = self._get_model().generate_content(contents, request_options={"timeout": timeout_s})
+            return response.text
+        except Exception as e:
+            raise self._wrap(e) from e
+
+    def stream(self, contents, stall_timeout_s):
+        try:
+            for chunk in self._get_model().generate_content(contents, stream=True,
+                                                            request_options={"timeout": stall_timeout_s}):
+                try:
+                    text = chunk.text
+                except ValueError: # Chunk without text parts (e.g. safety metadata)
+                    continue
+                if text:
+                    yield text
+        except Exception as e:
+            raise self._wrap(e) from e
+
+    def _wrap(self, e):
+        retryable = isinstance(e, (ConnectionError, TimeoutError)) or type(e).__name__ in self._RETRYABLE_ERRORS
+        return LLMRequestError(str(e), retryable=retryable)
+
+class LLMClient:
+    """
+    Deadline-bounded LLM requests on top of a transport (REST or SDK).
+
+    generate_content() mirrors GenerativeModel.generate_content(), so it drops in
+    for the SDK model. Each request has a total deadline (timeout_s) that covers
+    retries: transient failures are retried up to max_retries times with
+    exponential backoff and full jitter. A request still unanswered after the
+    hedge delay (the hedge_percentile of recent latencies) gets a second,
+    identical request; whichever answers first wins and the other is stopped.
+    A stalled call never blocks the caller past the deadline: requests run on
+    worker threads that are abandoned when it passes. Abandoned attempts (past
+    the deadline, or the loser of a hedge) are not retried, responses they are
+    still reading are closed, and each attempt's own timeout ends at the call's
+    deadline, so they cannot hold workers for long.
+
+    Streams are retried only until their first chunk arrives (after that, text
+    has been spoken) and fail when no chunk arrives for stall_timeout_s.
+    """
+    def __init__(self, transport=None, timeout_s=config.LLM_TIMEOUT_S, max_retries=config.LLM_MAX_RETRIES,
+                 backoff_s=config.LLM_RETRY_BACKOFF_S, hedge=config.LLM_HEDGE_ENABLED,
+                 hedge_percentile=config.LLM_HEDGE_PERCENTILE, hedge_initial_delay_s=config.LLM_HEDGE_INITIAL_DELAY_S,
+                 stall_timeout_s=config.LLM_STREAM_STALL_TIMEOUT_S):
+        self.transport = transport or (SDKTransport() if config.LLM_BACKEND == "sdk" else RestTransport())
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_initial_delay_s = hedge_initial_delay_s
+        self.stall_timeout_s = stall_timeout_s
+        # Two concurrent calls (e.g. a speculative and a regular one) with a hedge each, plus as
+        # many attempts abandoned at their deadline that may still be waiting for a server reply
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-request")
+        self._latencies = deque(maxlen=50) # Successful request latencies, for the hedge delay
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.abandoned = 0 # Attempts stopped mid-request after their call was decided
+
+    def generate_content(self, contents, stream=False, timeout_s=None):
+        if stream:
+            return (_TextResponse(text) for text in self._stream(contents))
+        return _TextResponse(self.generate(contents, timeout_s))
+
+    def generate(self, contents, timeout_s=None) -> str:
+        """Reply text. Raises LLMTimeoutError once the deadline passes, LLMRequestError for other failures."""
+        timeout_s = timeout_s or self.timeout_s
+        deadline = time.monotonic() + timeout_s
+        with self._lock:
+            self.requests += 1
+        start = time.monotonic()
+        call = _Call()
+        try:
+            return self._generate(contents, timeout_s, deadline, start, call)
+        finally:
+            call.cancel() # Stops the attempts that lost or were abandoned
+
+    def _generate(self, contents, timeout_s, deadline, start, call) -> str:
+        primary = self._executor.submit(self._request_with_retries, contents, deadline, call)
+        pending = {primary}
+        hedge_delay = self.hedge_delay_s()
+        if self.hedge and hedge_delay < timeout_s:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                with self._lock:
+                    self.hedges += 1
+                pending.add(self._executor.submit(self._request_with_retries, contents, deadline, call))
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    text = future.result()
+                except LLMRequestError as e:
+                    error = error or e
+                    continue
+                with self._lock:
+                    self._latencies.append(time.monotonic() - start)
+                    if future is not primary:
+                        self.hedge_wins += 1
+                return text
+        if error is not None and not pending:
+            raise error
+        with self._lock:
+            self.timeouts += 1
+        raise LLMTimeoutError(f"No response within {timeout_s:.1f}s")
+
+    def _request_with_retries(self, contents, deadline, call) -> str:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Deadline passed before the request was sent")
+            if call.cancelled:
+                raise LLMRequestError("Request abandoned")
+            try:
+                return self.transport.request(contents, remaining, call)
+            except LLMRequestError as e:
+                if call.cancelled:
+                    with self._lock:
+                        self.abandoned += 1
+                    raise
+                if not e.retryable or attempt >= self.max_retries or call.cancelled:
+                    raise
+                error = e
+            attempt += 1
+            backoff = random.uniform(0, self.backoff_s * 2 ** (attempt - 1)) # Full jitter
+            if time.monotonic() + backoff >= deadline:
+                raise error
+            with self._lock:
+                self.retries += 1
+            print(f"LLM: {error}; retrying in {backoff:.2f}s (attempt {attempt + 1}).")
+            time.sleep(backoff)
+
+    def _stream(self, contents):
+        deadline = time.monotonic() + self.timeout_s
+        with self._lock:
+            self.requests += 1
+        attempt = 0
+        while True:
+            received = False
+            try:
+                for text in self.transport.stream(contents, min(self.stall_timeout_s, self.timeout_s)):
+                    received = True
+                    yield text
+                return
+            except LLMRequestError as e:
+                if received or not e.retryable or attempt >= self.max_retries:
+                    raise
+                error = e
+            attempt += 1
+            backoff = random.uniform(0, self.backoff_s * 2 ** (attempt - 1))
+            if time.monotonic() + backoff >= deadline:
+                raise error
+            with self._lock:
+                self.retries += 1
+            print(f"LLM stream: {error}; retrying in {backoff:.2f}s (attempt {attempt + 1}).")
+            time.sleep(backoff)
+
+    def hedge_delay_s(self) -> float:
+        """hedge_percentile of recent latencies; hedge_initial_delay_s until there are enough samples."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < 10:
+            return self.hedge_initial_delay_s
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {"requests": self.requests, "retries": self.retries, "hedges": self.hedges,
+                    "hedge_wins": self.hedge_wins, "timeouts": self.timeouts, "abandoned": self.abandoned,
+                    "median_s": latencies[len(latencies) // 2] if latencies else None}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> LLMClient:
+    """Shared client, created on first use so startup does not pay for the SDK import or connection setup."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+class _StandInServer:
+    """
+    Local stand-in for the Gemini REST API used by client_test(). script maps a prompt to
+    the actions for its successive calls (the last repeats):
+    ("ok", delay_s, text), ("slow body", delay_s, text) (headers at once, body after delay_s),
+    ("error", status, message) or ("stream", [(delay_s, text), ...]).
+    """
+    def __init__(self, script):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        self.script = script
+        self.calls = {}
+        self.client_ports = set() # One per TCP connection the client opened
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, so connection reuse is observable
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["contents"][0]["parts"][0]["text"]
+                with server._lock:
+                    server.client_ports.add(self.client_address[1])
+                    call = server.calls.get(prompt, 0)
+                    server.calls[prompt] = call + 1
+                actions = server.script[prompt]
+                action = actions[min(call, len(actions) - 1)]
+                if action[0] == "error":
+                    self._send_json(action[1], {"error": {"code": action[1], "message": action[2]}})
+                elif action[0] == "ok":
+                    time.sleep(action[1])
+                    self._send_json(200, {"candidates": [{"content": {"parts": [{"text": action[2]}]}}]})
+                elif action[0] == "slow body":
+                    self._send_json(200, {"candidates": [{"content": {"parts": [{"text": action[2]}]}}]}, action[1])
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for delay_s, text in action[1]:
+                        time.sleep(delay_s)
+                        event = f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]})}\r\n\r\n"
+                        data = event.encode("utf-8")
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+
+            def _send_json(self, status, payload, body_delay_s=0.0):
+                data = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.flush()
+                    time.sleep(body_delay_s)
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError): # The client gave up (deadline)
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, name="llm-stand-in", daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def client_test() -> bool:
+    """Checks deadlines, retries, hedging, streaming and connection reuse against a local stand-in server."""
+    ok = True
+    server = _StandInServer({
+        "hello": [("ok", 0.05, "Hi there.")],
+        "flaky": [("error", 503, "overloaded"), ("error", 503, "overloaded"), ("ok", 0.0, "Recovered.")],
+        "bad key": [("error", 400, "API key not valid. Please pass a valid API key.")],
+        "stall": [("ok", 3.0, "Too late.")],
+        "slow once": [("ok", 1.5, "Slow answer."), ("ok", 0.05, "Hedged answer.")],
+        "slow body once": [("slow body", 1.5, "Slow answer."), ("ok", 0.05, "Hedged answer.")],
+        "stream": [("error", 503, "overloaded"), ("stream", [(0.1, "Sure. "), (0.2, "你好，"), (0.2, "done.")])],
+    })
+    def client(**kwargs):
+        options = {"timeout_s": 2.0, "max_retries": 2, "backoff_s": 0.05, "hedge": False, "stall_timeout_s": 1.0}
+        options.update(kwargs)
+        return LLMClient(RestTransport(model_name="stand-in", api_key="test", base_url=server.url), **options)
+    try:
+        c = client()
+        texts = [c.generate("hello") for _ in range(3)]
+        case_ok = texts == ["Hi there."] * 3 and len(server.client_ports) == 1
+        print(f"Connection reuse: 3 requests over {len(server.client_ports)} connection(s) "
+              f"-> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        text = c.generate("flaky")
+        case_ok = text == "Recovered." and c.retries == 2
+        print(f"Retry with jitter: {text!r} after {c.retries} retries -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        start = time.monotonic()
+        try:
+            c.generate("bad key")
+            error = None
+        except LLMRequestError as e:
+            error = e
+        case_ok = (error is not None and error.status == 400 and server.calls["bad key"] == 1
+                   and "API key not valid" in str(error))
+        print(f"No retry on client error: {error} after {time.monotonic() - start:.2f}s "
+              f"-> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        c = client(timeout_s=0.5)
+        start = time.monotonic()
+        try:
+            c.generate("stall")
+            error = None
+        except LLMTimeoutError as e:
+            error = e
+        elapsed = time.monotonic() - start
+        case_ok = error is not None and elapsed < 0.7
+        print(f"Deadline: stalled server, gave up after {elapsed:.2f}s -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        c = client(hedge=True, hedge_initial_delay_s=0.2)
+        start = time.monotonic()
+        text = c.generate("slow once")
+        elapsed = time.monotonic() - start
+        case_ok = text == "Hedged answer." and c.hedge_wins == 1 and elapsed < 0.5
+        print(f"Hedged request: {text!r} after {elapsed:.2f}s (first request takes 1.5s) "
+              f"-> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        c = client(hedge=True, hedge_initial_delay_s=0.2)
+        text = c.generate("slow body once")
+        time.sleep(0.1)
+        case_ok = text == "Hedged answer." and c.abandoned == 1
+        print(f"Hedge loser stopped: {c.abandoned} attempt(s) closed 0.1s after the hedge won "
+              f"(first body takes 1.5s) -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        c = client()
+        start = time.monotonic()
+        received = [(round(time.monotonic() - start, 1), chunk.text) for chunk in c.generate_content("stream", stream=True)]
+        case_ok = [t for _, t in received] == ["Sure. ", "你好，", "done."] and c.retries == 1
+        print(f"Stream: chunks {received} after 1 retry -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+    finally:
+        server.close()
+    return ok
+
+if __name__ == "__main__":
+    import sys
+    # python -m src.llm_client --client-test
+    if len(sys.argv) > 1 and sys.argv[1] == "--client-test":
+        sys.exit(0 if client_test() else 1)
+    print(f"LLM client ({config.LLM_BACKEND}): {get_client().generate('Say hello in five words.')}")
@@ -1,25 +1,137 @@
-import google.generativeai as genai
 import requests
+import hashlib
+import json
 import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from . import config
+from .llm_client import get_client
 
-# Configure the Gemini API key
-genai.configure(api_key=config.GEMINI_API_KEY)
+# Requests go through the shared LLMClient (llm_client.py): per-request deadlines, retries and
+# hedging, a reused HTTP connection, and no SDK import or configuration at startup.
+# Gemini 1.5/2.0 models accept images directly, so the contents can be [prompt, image].
 
-# Initialize the GenerativeModel
-# Note: For multimodal input (text and image), you'd typically use a model like 'gemini-pro-vision'.
-# However, the user specified 'gemini-2.0-flash', which might be primarily text-based or have specific ways to handle multimodal input.
-# We will start with text-based interaction and can extend to vision later if the model supports it directly
-# or by passing image descriptions as text.
+def _build_contents(prompt_text: str, image_path: str = None, image_jpeg: bytes = None):
+    """
+    Prompt, or [prompt, image] for multimodal input: an in-memory JPEG (e.g. from
+    vision_module.encode_frame_jpeg()) is sent as is, an image file is opened with PIL.
+    """
+    if image_jpeg:
+        return [prompt_text, {"mime_type": "image/jpeg", "data": image_jpeg}]
+    if image_path and os.path.exists(image_path):
+        import PIL.Image
+        return [prompt_text, PIL.Image.open(image_path)]
+    return prompt_text
 
-# For gemini-2.0-flash, it's likely a newer model. We'll assume it can handle text and potentially image data if passed correctly.
-# The Gemini API typically uses `GenerativeModel(model_name)`
-# For models like gemini-1.5-flash or gemini-1.5-pro, you can send images directly.
-# Let's assume gemini-2.0-flash also supports this. If not, we'll need to adjust.
+def _chunk_text(chunk) -> str:
+    """Text of one streamed response chunk; chunks without text (e.g. safety metadata) give ""."""
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError): # .text raises when the chunk has no text parts
+        parts = getattr(chunk, "parts", None) or []
+        return "".join(part.text for part in parts if hasattr(part, "text"))
 
-model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
+def _error_message(e) -> str:
+    if "API key not valid" in str(e):
+        return "LLM Error: API key is not valid. Please check your configuration."
+    return f"LLM Error: {e}"
 
-def get_llm_response(prompt_text: str, image_path: str = None) -> str:
+_STREAM_END = object()
+
+class LLMStream:
+    """
+    Streaming Gemini response (generate_content(stream=True)) as an iterator of text chunks.
+
+    The HTTP stream is read on a producer thread and handed over through a
+    queue, so cancel() takes effect within poll_s even while the network read
+    is blocked; chunks that arrive afterwards are discarded. Errors end the
+    stream cleanly: text received so far is kept (.text) and the exception is
+    stored in .error. If the request fails before any text arrived, a single
+    "LLM Error: ..." chunk is yielded, like get_llm_response() returns.
+    """
+    def __init__(self, prompt_text: str, image_path: str = None, client=None, poll_s=0.05, image_jpeg: bytes = None):
+        self.prompt_text = prompt_text
+        self.image_path = image_path
+        self.image_jpeg = image_jpeg
+        self.client = client or get_client()
+        self.poll_s = poll_s
+        self.error = None
+        self.time_to_first_chunk_s = None
+        self.elapsed_s = None # Request to end of stream
+        self.complete = False # True once the whole response was received (not cancelled, no error)
+        self.done = threading.Event()
+        self._parts = []
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def text(self) -> str:
+        """Text received so far (the full response once the stream is done)."""
+        return "".join(self._parts)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def start(self):
+        """Sends the request. Called implicitly by iteration; call it early to overlap with other work."""
+        if self._thread is None:
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._produce, name="llm-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def _produce(self):
+        try:
+            response = self.client.generate_content(_build_contents(self.prompt_text, self.image_path, self.image_jpeg),
+                                                   stream=True)
+            for chunk in response:
+                if self._cancel.is_set():
+                    break # Stop reading; the connection is released with the response object
+                text = _chunk_text(chunk)
+                if not text:
+                    continue
+                if self.time_to_first_chunk_s is None:
+                    self.time_to_first_chunk_s = time.perf_counter() - self._started_at
+                self._parts.append(text)
+                self._queue.put(text)
+            else:
+                self.complete = True
+        except Exception as e:
+            self.error = e
+            print(f"Error interacting with LLM (stream): {e}")
+            if not self._parts and not self._cancel.is_set():
+                self._queue.put(_error_message(e))
+        finally:
+            self.elapsed_s = time.perf_counter() - self._started_at
+            self.done.set()
+            self._queue.put(_STREAM_END)
+
+    def __iter__(self):
+        self.start()
+        while not self._cancel.is_set():
+            try:
+                item = self._queue.get(timeout=self.poll_s)
+            except queue.Empty:
+                continue
+            if item is _STREAM_END or self._cancel.is_set():
+                return
+            yield item
+
+    def read(self) -> str:
+        """Waits for the whole response and returns it (the error message if nothing arrived)."""
+        return "".join(self)
+
+def get_llm_response(prompt_text: str, image_path: str = None, image_jpeg: bytes = None) -> str:
     """
     Gets a response from the Gemini LLM.
     Can optionally include an image for multimodal input if the model supports it.
@@ -27,26 +139,14 @@ def get_llm_response(prompt_text: str, image_path: str = None) -> str:
     Args:
         prompt_text: The text prompt for the LLM.
         image_path: (Optional) Path to an image file for multimodal input.
+        image_jpeg: (Optional) JPEG-encoded image in memory, used instead of image_path.
 
     Returns:
         The LLM's text response.
     """
     try:
-        if image_path and os.path.exists(image_path):
-            # For multimodal input with Gemini, you typically pass a list of content parts
-            # including text and image data (e.g., PIL.Image object or image bytes).
-            # Let's try to load the image and pass it.
-            # The exact way to pass images might vary slightly based on the specific Gemini model version
-            # and SDK updates. We'll use a common approach.
-            import PIL.Image
-            img = PIL.Image.open(image_path)
-            
-            # Check if the model is a vision model, typically names contain 'vision'
-            # Since 'gemini-2.0-flash' name doesn't explicitly state 'vision', we proceed with caution.
-            # The `generate_content` method can accept a list of parts (text, image).
-            response = model.generate_content([prompt_text, img])
-        else:
-            response = model.generate_content(prompt_text)
+        # For multimodal input with Gemini, generate_content() takes a list of parts (text, PIL image).
+        response = get_client().generate_content(_build_contents(prompt_text, image_path, image_jpeg))
         
         # Handle potential streaming or multi-candidate responses if applicable
         # For simplicity, we'll assume a direct text response part.
@@ -77,7 +177,399 @@ def get_llm_response(prompt_text: str, image_path: str = None) -> str:
                 return f"LLM Error: {e}"
         return f"LLM Error: {e}"
 
+def normalize_query(text: str) -> str:
+    """Cache form of a user request: NFKC, lower case, punctuation removed, whitespace collapsed."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(" " if unicodedata.category(char).startswith("P") else char for char in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def scene_signature(vision_context: str | None) -> str:
+    """
+    Hash of a scene description that ignores detection confidences (and how long tracked
+    objects have been in view) and object order, so the same objects in an unchanged
+    room give the same signature frame after frame.
+    """
+    if not vision_context:
+        return ""
+    text = re.sub(r"\(confidence: [^)]*\)|\d+(\.\d+)?", "", vision_context.lower())
+    parts = sorted(part.strip() for part in re.split(r",| and |[.:;]", text) if part.strip())
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+class ResponseCache:
+    """
+    Cache of complete LLM replies for repeated requests.
+
+    Keyed by sha1(normalized user text, language, scene signature, context), where
+    context identifies anything else the answer depends on (e.g. conversation history).
+    Entries expire after ttl_s and the least recently used are evicted beyond
+    max_entries. With a path, entries are saved as JSON and survive restarts; a
+    background writer saves save_delay_s after a change, so a burst of puts costs
+    one write and the reply path never waits on the SD card.
+    Requests containing a bypass keyword (time, news, ...) are never cached,
+    since their answers change. hits/misses/saved_s report the effect: saved_s
+    is the sum of the original LLM latencies of the replies served from cache.
+    """
+    def __init__(self, ttl_s=config.LLM_CACHE_TTL_S, max_entries=config.LLM_CACHE_MAX_ENTRIES,
+                 path=config.LLM_CACHE_PATH, bypass_keywords=config.LLM_CACHE_BYPASS_KEYWORDS,
+                 save_delay_s=config.LLM_CACHE_SAVE_DELAY_S):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.path = path
+        self.bypass_keywords = [normalize_query(k) for k in bypass_keywords]
+        self._entries = OrderedDict() # key -> (reply, expires_at, latency_s); LRU order: oldest first
+        self.save_delay_s = save_delay_s
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # One writer at a time
+        self._dirty = threading.Event() # Entries changed since the last save
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_s = 0.0
+        self._load()
+
+    @staticmethod
+    def make_key(user_text: str, language: str, vision_context: str = None, context: str = "") -> str:
+        parts = [normalize_query(user_text), language, scene_signature(vision_context), context]
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def should_bypass(self, user_text: str) -> bool:
+        """True for requests whose answers are not repeatable; counted as bypassed."""
+        words = f" {normalize_query(user_text)} "
+        # English keywords match whole words; Chinese ones (no spaces) match anywhere
+        bypass = any(f" {k} " in words if k.isascii() else k in words for k in self.bypass_keywords)
+        if bypass:
+            with self._lock:
+                self.bypassed += 1
+        return bypass
+
+    def get(self, key) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_s += entry[2]
+            return entry[0]
+
+    def put(self, key, reply: str, latency_s: float = 0.0):
+        """Stores a complete reply. Error replies are not cached."""
+        if not reply or reply.startswith("LLM Error:") or reply.startswith("Error:"):
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (reply, time.time() + self.ttl_s, latency_s)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._schedule_save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._schedule_save()
+
+    def flush(self):
+        """Saves pending changes now (e.g. at shutdown)."""
+        with self._save_lock:
+            if not self._dirty.is_set():
+                return
+            self._dirty.clear()
+            with self._lock:
+                snapshot = list(self._entries.items())
+            self._save(snapshot)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "saved_s": self.saved_s, "entries": len(self._entries)}
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"LLMCache: Ignoring unreadable cache file {self.path}: {e}")
+            return
+        if not isinstance(stored, list):
+            print(f"LLMCache: Ignoring cache file {self.path} in an unknown format.")
+            return
+        now = time.time()
+        skipped = 0
+        for entry in stored[-self.max_entries:]:
+            try:
+                key, reply, expires_at, latency_s = entry
+                if expires_at > now:
+                    self._entries[str(key)] = (str(reply), float(expires_at), float(latency_s))
+            except (TypeError, ValueError):
+                skipped += 1
+        if skipped:
+            print(f"LLMCache: Skipped {skipped} malformed entries in {self.path}.")
+
+    def _schedule_save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self._dirty.set()
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="llm-cache-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.save_delay_s) # Coalesce the puts of a burst into one write
+            self.flush()
+
+    def _save(self, snapshot):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([[key, *entry] for key, entry in snapshot], f, ensure_ascii=False)
+            os.replace(tmp_path, self.path) # Readers never see a partial file
+        except OSError as e:
+            print(f"LLMCache: Could not write {self.path}: {e}")
+
+# Shared instance used by main.py
+response_cache = ResponseCache() if config.LLM_CACHE_ENABLED else None
+
+class SpeculativeDispatcher:
+    """
+    Starts an LLM request for a likely-complete utterance before end of speech is confirmed.
+
+    speculate() issues the request in the background as soon as a stable final
+    segment arrives. If the user keeps talking, invalidate() discards it.
+    resolve() then either commits the in-flight answer (same prompt after
+    normalize_query(), not invalidated) or issues a fresh request. A running HTTP
+    call cannot be aborted, so a discarded request simply finishes and is ignored.
+    """
+    def __init__(self, llm_fn=None, max_workers=2):
+        self.llm_fn = llm_fn or get_llm_response
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-speculative")
+        self._lock = threading.Lock()
+        self._prompt = None # Normalized prompt of the in-flight request
+        self._future = None
+        self._started_at = 0.0
+        self.started = 0
+        self.committed = 0
+        self.wasted = 0
+        self.saved_s = 0.0
+
+    def speculate(self, prompt_text: str):
+        key = normalize_query(prompt_text)
+        with self._lock:
+            if self._future is not None and self._prompt == key:
+                return # Already in flight for this prompt
+            self._discard_locked()
+            self._prompt = key
+            self._started_at = time.time()
+            self._future = self._executor.submit(self._timed_call, prompt_text)
+            self.started += 1
+
+    def _timed_call(self, prompt_text):
+        return self.llm_fn(prompt_text), time.time()
+
+    def invalidate(self):
+        """The utterance continued: the in-flight speculation no longer matches."""
+        with self._lock:
+            self._discard_locked()
+
+    def resolve(self, prompt_text: str) -> str:
+        """Returns the answer for prompt_text, reusing the speculative request when it matches."""
+        key = normalize_query(prompt_text)
+        with self._lock:
+            future, prompt, started_at = self._future, self._prompt, self._started_at
+            if future is not None and prompt == key:
+                self._future, self._prompt = None, None
+            else:
+                self._discard_locked()
+                future = None
+        if future is None:
+            return self.llm_fn(prompt_text)
+        now = time.time()
+        result, finished_at = future.result()
+        with self._lock:
+            self.committed += 1
+            # Head start: how long the request had been running when we needed it, but no
+            # more than it took (a request that finished early saved only its duration).
+            self.saved_s += min(now, finished_at) - started_at
+        return result
+
+    def _discard_locked(self):
+        if self._future is not None:
+            self._future.cancel() # Only effective if the request has not started yet
+            self.wasted += 1
+        self._future, self._prompt = None, None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "committed": self.committed,
+                "wasted": self.wasted,
+                "waste_ratio": self.wasted / self.started if self.started else 0.0,
+                "saved_s": self.saved_s,
+            }
+
+    def shutdown(self):
+        self.invalidate()
+        self._executor.shutdown(wait=False)
+
+class _FakeStreamingModel:
+    """
+    Stand-in for genai.GenerativeModel in tests: generate_content(..., stream=True) yields
+    (delay_s, text) chunks, or raises `fail_with` after `fail_after` chunks.
+    """
+    class _Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, chunks, fail_after=None, fail_with=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.fail_with = fail_with or ConnectionError("stream reset by peer")
+
+    def generate_content(self, contents, stream=False):
+        def generate():
+            for i, (delay_s, text) in enumerate(self.chunks):
+                if i == self.fail_after:
+                    raise self.fail_with
+                time.sleep(delay_s)
+                yield self._Chunk(text)
+            if self.fail_after is not None and self.fail_after >= len(self.chunks):
+                raise self.fail_with
+        return generate()
+
+def stream_test() -> bool:
+    """Checks chunk delivery timing, mid-stream cancellation and mid-stream errors against a fake client."""
+    chunks = [(0.3, "Sure. "), (0.2, "The desk has a laptop, "), (0.2, "a cup and a notebook. "), (0.5, "Anything else?")]
+    ok = True
+
+    start = time.perf_counter()
+    stream = LLMStream("test", client=_FakeStreamingModel(chunks))
+    received = []
+    for text in stream:
+        received.append((round(time.perf_counter() - start, 2), text))
+    case_ok = stream.text == "".join(t for _, t in chunks) and 0.25 < stream.time_to_first_chunk_s < 0.4
+    print(f"Full stream: first chunk after {stream.time_to_first_chunk_s * 1000:.0f} ms (blocking call: "
+          f"{sum(d for d, _ in chunks) * 1000:.0f} ms), chunks={received} -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    stream = LLMStream("test", client=_FakeStreamingModel(chunks))
+    received, cancelled_at = [], []
+    def cancel():
+        cancelled_at.append(time.perf_counter())
+        stream.cancel()
+    for text in stream:
+        received.append(text)
+        if len(received) == 2:
+            threading.Timer(0.1, cancel).start() # Cancel while the producer waits for chunk 3
+    cancel_latency_s = time.perf_counter() - cancelled_at[0]
+    case_ok = received == [chunks[0][1], chunks[1][1]] and stream.cancelled and cancel_latency_s < 0.1
+    print(f"Cancel mid-stream: received {len(received)} chunks, iteration ended {cancel_latency_s * 1000:.0f} ms "
+          f"after cancel() -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    stream = LLMStream("test", client=_FakeStreamingModel(chunks, fail_after=2))
+    received = list(stream)
+    case_ok = received == [chunks[0][1], chunks[1][1]] and isinstance(stream.error, ConnectionError)
+    print(f"Error mid-stream: kept {stream.text!r}, error={stream.error!r} -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    stream = LLMStream("test", client=_FakeStreamingModel(chunks, fail_after=0, fail_with=ValueError("API key not valid")))
+    received = list(stream)
+    case_ok = len(received) == 1 and received[0].startswith("LLM Error: API key")
+    print(f"Error before first chunk: yielded {received} -> {'OK' if case_ok else 'FAIL'}")
+    return ok and case_ok
+
+def cache_test() -> bool:
+    """Checks ResponseCache keys, TTL, LRU eviction, persistence, malformed cache files, bypass and metrics."""
+    import tempfile
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.json")
+        cache = ResponseCache(ttl_s=60, max_entries=3, path=path, bypass_keywords=["time", "几点"], save_delay_s=0.2)
+        scene_a = "In the current view, the following objects are detected: a cup (confidence: 0.91) and a laptop (confidence: 0.85)."
+        scene_b = "In the current view, the following objects are detected: a laptop (confidence: 0.88) and a cup (confidence: 0.79)."
+        key = cache.make_key("What do you see?", "en", scene_a)
+        case_ok = (key == cache.make_key("  what do you SEE ", "en", scene_b)
+                   and key != cache.make_key("what do you see", "zh", scene_a)
+                   and key != cache.make_key("what do you see", "en", scene_a.replace("cup", "bottle")))
+        print(f"Normalized text and scene: case/punctuation, confidences and object order ignored; "
+              f"language and objects kept -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        cache.put(key, "A cup and a laptop.", latency_s=1.2)
+        cache.put(cache.make_key("hello", "en"), "LLM Error: quota exceeded")
+        hit = cache.get(cache.make_key("what do you see", "en", scene_b))
+        case_ok = hit == "A cup and a laptop." and cache.get(cache.make_key("hello", "en")) is None
+        print(f"Hit: {hit!r}, error replies not stored -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        for i in range(3):
+            cache.put(cache.make_key(f"question {i}", "en"), f"answer {i}")
+        case_ok = len(cache) == 3 and cache.get(key) is None
+        print(f"LRU eviction: {len(cache)} entries, oldest evicted -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        written_at_once = os.path.exists(path)
+        time.sleep(0.4)
+        reloaded = ResponseCache(ttl_s=60, max_entries=3, path=path)
+        case_ok = not written_at_once and reloaded.get(cache.make_key("question 2", "en")) == "answer 2"
+        print(f"Persistence: nothing written on the reply path, {len(reloaded)} entries reloaded from disk after "
+              f"the background save -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        loaded = []
+        for stored in [{"key": "reply"}, [["old key", "old reply", time.time() + 60]],
+                       [["bad", "entry", None, 0.0], [key, "A cup.", time.time() + 60, 0.5]]]:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            loaded.append(len(ResponseCache(ttl_s=60, max_entries=3, path=path)))
+        case_ok = loaded == [0, 0, 1]
+        print(f"Malformed cache files: a dict, 3-field entries and a bad entry ignored, {loaded} entries loaded "
+              f"-> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        short = ResponseCache(ttl_s=0.05, max_entries=3, path=None)
+        short.put(key, "A cup.")
+        time.sleep(0.1)
+        case_ok = short.get(key) is None
+        print(f"TTL: entry expired after ttl_s -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        case_ok = (cache.should_bypass("What time is it?") and cache.should_bypass("现在几点了")
+                   and not cache.should_bypass("what is a timetable"))
+        print(f"Bypass: time queries bypass, substrings of words do not -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+
+        stats = cache.stats()
+        case_ok = stats["hits"] == 1 and abs(stats["saved_s"] - 1.2) < 1e-9 and stats["bypassed"] == 2
+        print(f"Metrics: {stats} -> {'OK' if case_ok else 'FAIL'}")
+        ok = ok and case_ok
+    return ok
+
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--stream-test":
+        sys.exit(0 if stream_test() else 1)
+    if len(sys.argv) > 1 and sys.argv[1] == "--cache-test":
+        sys.exit(0 if cache_test() else 1)
+
     # Test the LLM module (requires a valid API key to be set in config.py or environment)
     print("Testing LLM module...")
     # Create a dummy image for testing multimodal input if needed
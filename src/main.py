@@ -2,27 +2,60 @@ import time
 import os
 import threading
 import config
-from audio_input import AudioInput
-from stt_module import STTModule
-from llm_module import get_llm_response
+from audio_input import AudioInput, SPEECH_START, SPEECH_END, BARGE_IN
+from stt_module import STTModule, STTSession, FINAL, WAKE
+from llm_module import get_llm_response, LLMStream, SpeculativeDispatcher, response_cache
+from llm_client import get_client
 from tts_module import TTSModule
+from tts_cache import pcm_cache
 from audio_output import AudioOutput
 from video_input import VideoInput
-from vision_module import VisionModule
+from vision_module import VisionModule, should_attach_image, encode_frame_jpeg
+from vision_worker import VisionWorker
+from model_registry import registry, language_model_items
+from speech_pipeline import PipelinedSpeaker
+from conversation import ConversationManager
+from intent_router import (IntentRouter, describe_time, describe_date, SWITCH_TO_CHINESE, SWITCH_TO_ENGLISH, EXIT,
+                           TIME, DATE, VOLUME_UP, VOLUME_DOWN, VISION)
 
 # Global state
 current_language = config.DEFAULT_LANGUAGE
 stop_interaction_flag = threading.Event()
+response_thread = None # Runs process_command() while the main loop keeps listening (barge-in)
+response_cancel = threading.Event() # Set when the user interrupts the current response
+_response_local = threading.local()
+active_llm_stream = None # Streaming LLM reply being spoken, cancelled on barge-in
+
+router = IntentRouter() # Trigger phrases of all commands, matched in one pass
+# Words after which an utterance is very likely to continue
+TRAILING_CONNECTIVES = {"and", "or", "but", "the", "a", "an", "to", "of", "with", "about", "和", "还有", "然后", "但是", "的"}
 
 # --- Initialization of Modules ---
 try:
     print("Initializing assistant modules...")
+    # The current language is loaded by STTModule/TTSModule below; the others load in the background
+    # so that switch_language() finds them in the registry.
+    other_languages = [lang for lang in config.MODEL_PRELOAD_LANGUAGES if lang != current_language]
+    if other_languages:
+        registry.preload(language_model_items(other_languages))
     audio_in = AudioInput(sample_rate=config.AUDIO_SAMPLE_RATE, device_index=config.AUDIO_INPUT_DEVICE_INDEX)
     stt = STTModule(language=current_language)
+    stt_session = STTSession(stt, audio_in) # Worker thread that owns the recognizer
     tts = TTSModule(language=current_language)
     audio_out = AudioOutput()
+    speaker = PipelinedSpeaker(tts, audio_out)
+    if config.BARGE_IN_ENABLED and audio_in.vad:
+        # Lets the mic tell the user's voice from the assistant's echo. Needs VAD: without it the
+        # session decodes continuously and would transcribe the assistant's own voice.
+        audio_in.echo_reference = audio_out
     video_in = VideoInput(camera_index=0, fps_limit=5) # Lower FPS for vision processing
     vision = VisionModule()
+    vision_worker = VisionWorker(video_in, vision) if config.VISION_WORKER_ENABLED else None
+    speculator = SpeculativeDispatcher() if config.LLM_SPECULATIVE_DISPATCH else None
+    if speculator and config.LLM_STREAMING:
+        print("Warning: LLM_SPECULATIVE_DISPATCH fetches whole replies, so LLM_STREAMING is not used "
+              "for requests without an attached image.")
+    conversation = ConversationManager() if config.CONVERSATION_ENABLED else None
     print("All modules initialized (or attempted). Check for errors above.")
 except Exception as e:
     print(f"Critical error during module initialization: {e}")
@@ -41,7 +74,7 @@ def check_model_files():
     }
     for lang, path in vosk_models.items():
         if not os.path.exists(path):
-            print(f"STTWarning: Vosk model for {lang} not found at 	hemed_text_is_not_recognized_by_the_user_facing_tool}. Please download from https://alphacephei.com/vosk/models and update config.py.")
+            print(f"STTWarning: Vosk model for {lang} not found at {path}. Please download from https://alphacephei.com/vosk/models and update config.py.")
             models_ok = False
         else:
             print(f"STT Info: Vosk model for {lang} found at {path}.")
@@ -96,67 +129,238 @@ def switch_language(new_lang):
 def speak_response(text_to_speak):
     if not text_to_speak:
         return
+    cancel = getattr(_response_local, "cancel", None)
+    if cancel is not None and cancel.is_set():
+        return # The user interrupted this response
     print(f"Assistant: {text_to_speak}")
-    temp_wav_file = "temp_tts_output.wav"
-    if tts.speak(text_to_speak, temp_wav_file):
-        audio_out.play_wav_file(temp_wav_file)
-        if os.path.exists(temp_wav_file):
-            try:
-                os.remove(temp_wav_file)
-            except OSError as e:
-                print(f"Error deleting temp WAV file: {e}")
+    if config.TTS_PIPELINED:
+        # Plays each clause as soon as it is synthesized while the next one is being synthesized
+        metrics = speaker.speak(text_to_speak)
+        if metrics["interrupted"]:
+            print("TTS: playback interrupted.")
+        elif metrics["clauses"] and metrics["time_to_first_audio_s"] is None:
+            print("TTS synthesis failed.")
+        elif metrics["clauses"] > 1:
+            gaps = metrics["gaps_s"]
+            print(f"TTS: first audio after {metrics['time_to_first_audio_s']:.2f}s, {metrics['clauses']} clauses, "
+                  f"max gap {max(gaps, default=0) * 1000:.0f} ms.")
+        return
+    # PCM goes straight from synthesis to the speaker; no temporary WAV file
+    synthesized = tts.synthesize(text_to_speak)
+    if synthesized:
+        audio_out.play_pcm(*synthesized)
     else:
         print("TTS synthesis failed.")
 
+def speak_stream_response(stream) -> str:
+    """
+    Speaks a streaming LLM reply sentence by sentence while the rest is still being generated.
+    Returns the reply text received (partial if the user interrupted).
+    """
+    global active_llm_stream
+    cancel = getattr(_response_local, "cancel", None)
+    if cancel is not None and cancel.is_set():
+        stream.cancel()
+        return ""
+    active_llm_stream = stream
+    try:
+        metrics = speaker.speak_stream(stream)
+    finally:
+        active_llm_stream = None
+        stream.cancel() # Stops reading the HTTP stream if speaking ended early
+    print(f"Assistant: {stream.text}")
+    if metrics["interrupted"]:
+        print("TTS: playback interrupted.")
+    elif metrics["time_to_first_audio_s"] is not None:
+        print(f"TTS: first audio after {metrics['time_to_first_audio_s']:.2f}s "
+              f"(first LLM text after {stream.time_to_first_chunk_s or 0:.2f}s), {metrics['clauses']} clauses.")
+    return stream.text
+
+def handle_local_intent(intent):
+    """Carries out a deterministic command (language, exit, time, date, volume) without an LLM round trip."""
+    if intent == SWITCH_TO_CHINESE:
+        switch_language("zh")
+    elif intent == SWITCH_TO_ENGLISH:
+        switch_language("en")
+    elif intent == EXIT:
+        speak_response("Goodbye!" if current_language == "en" else "再见！")
+        stop_interaction_flag.set()
+    elif intent == TIME:
+        speak_response(describe_time(current_language))
+    elif intent == DATE:
+        speak_response(describe_date(current_language))
+    elif intent in (VOLUME_UP, VOLUME_DOWN):
+        step = config.AUDIO_OUTPUT_VOLUME_STEP if intent == VOLUME_UP else -config.AUDIO_OUTPUT_VOLUME_STEP
+        percent = round(audio_out.set_volume(audio_out.volume + step) * 100)
+        speak_response(f"Volume {percent} percent." if current_language == "en" else f"音量{percent}%。")
+
+def capture_scene():
+    """(frame, description, detections) of the current view, or None if no frame could be captured."""
+    if vision_worker is not None and vision_worker.running:
+        snapshot = vision_worker.get() # Latest background detection, if recent enough
+        if snapshot is not None:
+            print(f"Vision: using detection of a frame {snapshot.age_s:.2f}s old.")
+            return snapshot.frame, snapshot.description, snapshot.objects
+        return None
+    print("Vision command detected. Capturing and analyzing frame...")
+    if not video_in.running:
+        video_in.start_capture()
+        time.sleep(1) # Give camera time to start
+    frame = video_in.get_frame()
+    if frame is None:
+        return None
+    description, objects = vision.describe_frame(frame)
+    return frame, description, objects
+
 def process_command(text_input):
     global current_language
     print(f"User: {text_input}")
-    text_input_lower = text_input.lower()
 
-    # Language switching commands
-    if any(cmd in text_input_lower for cmd in ["switch to chinese", "切换到中文"]):
-        switch_language("zh")
-        return
-    elif any(cmd in text_input_lower for cmd in ["switch to english", "切换到英文"]):
-        switch_language("en")
+    # Language switch, exit, time, date and volume are answered locally
+    intent = router.route(text_input)
+    if intent:
+        print(f"Local intent: {intent}")
+        handle_local_intent(intent)
         return
-    
+
     # Vision related commands
-    vision_prompt_addition = ""
-    if any(cmd in text_input_lower for cmd in ["what do you see", "describe the scene", "look around", "这是什么", "看见什么了"]):
-        print("Vision command detected. Capturing and analyzing frame...")
-        if not video_in.running:
-            video_in.start_capture()
-            time.sleep(1) # Give camera time to start
-        
-        frame = video_in.get_frame()
-        if frame is not None:
-            vision_description = vision.analyze_frame_for_prompt(frame)
+    vision_context = None
+    image_jpeg = None # The frame itself, sent when the detections alone are not reliable
+    if VISION in router.intents(text_input):
+        scene = capture_scene()
+        if scene is not None:
+            frame, vision_description, objects = scene
             print(f"Vision analysis: {vision_description}")
-            vision_prompt_addition = f" Current visual context: {vision_description}"
+            vision_context = vision_description
+            if should_attach_image(objects):
+                encoded = encode_frame_jpeg(frame) # Downscaled in memory to the upload budget
+                if encoded:
+                    image_jpeg, info = encoded
+                    print(f"Vision: attaching frame ({info['width']}x{info['height']}, quality {info['quality']}, "
+                          f"{info['bytes'] / 1024:.0f} KB, encoded in {info['encode_ms']:.0f} ms).")
             # Optionally, save or show the annotated frame for debugging
             # annotated_frame, _ = vision.detect_objects(frame)
             # if annotated_frame is not None: cv2.imwrite("last_vision_capture.jpg", annotated_frame)
         else:
-            vision_prompt_addition = " Could not get a frame from the camera."
+            vision_context = "Could not get a frame from the camera."
             print("Vision: Could not get frame.")
 
     # Prepare prompt for LLM
-    full_prompt = text_input + vision_prompt_addition
+    full_prompt = text_input
+    if conversation:
+        # Recent turns go in front so follow-up questions keep their context, within a fixed token budget
+        full_prompt = conversation.build_prompt(full_prompt, vision_context)
+    elif vision_context:
+        full_prompt += f" Current visual context: {vision_context}"
     if current_language == "zh":
         # Simple prompt engineering for Chinese if needed, or rely on Gemini's multilingual capabilities
-        # full_prompt = f"用户用中文说：	hemed_text_is_not_recognized_by_the_user_facing_tool} {vision_prompt_addition}"
+        # full_prompt = f"用户用中文说：{text_input}"
         pass # Assuming Gemini handles mixed language prompts or language is clear
 
-    print(f"Sending to LLM: {full_prompt}")
-    llm_response = get_llm_response(full_prompt) # Image path can be added here if LLM supports direct image input and vision module provides it
-    
-    speak_response(llm_response)
+    cache_key, llm_response = None, None
+    # With an image attached, the description does not identify the scene, so such answers are not cached
+    if response_cache is not None and image_jpeg is None and not response_cache.should_bypass(text_input):
+        # A scene question is answered from the fresh description; anything else may depend on the history
+        context = "" if vision_context or not conversation else conversation.history_digest()
+        cache_key = response_cache.make_key(text_input, current_language, vision_context, context)
+        llm_response = response_cache.get(cache_key)
+    if llm_response is not None:
+        print(f"LLM cache hit: {response_cache.stats()}")
+        if speculator:
+            speculator.invalidate()
+        speak_response(llm_response)
+    else:
+        print(f"Sending to LLM: {full_prompt}")
+        llm_start, complete = time.time(), True
+        if speculator and image_jpeg is None:
+            llm_response = speculator.resolve(full_prompt) # Reuses the request started on the last final segment
+            llm_latency = time.time() - llm_start
+            speak_response(llm_response)
+        elif config.LLM_STREAMING and config.TTS_PIPELINED:
+            stream = LLMStream(full_prompt, image_jpeg=image_jpeg)
+            llm_response = speak_stream_response(stream)
+            llm_latency, complete = stream.elapsed_s or 0.0, stream.complete
+        else:
+            llm_response = get_llm_response(full_prompt, image_jpeg=image_jpeg)
+            llm_latency = time.time() - llm_start
+            speak_response(llm_response)
+        if cache_key and complete:
+            response_cache.put(cache_key, llm_response, llm_latency)
+    if conversation:
+        conversation.record(text_input, llm_response, vision_context)
+        print(f"Conversation context: {conversation.stats()}")
 
-    # Exit command
-    if any(cmd in text_input_lower for cmd in ["exit", "quit", "stop listening", "再见", "退出"]):
-        speak_response("Goodbye!" if current_language == "en" else "再见！")
-        stop_interaction_flag.set()
+def can_speculate(text):
+    """
+    True if text looks like a complete request whose prompt process_command would
+    send to the LLM unchanged (no local command or vision capture involved).
+    """
+    words = text.lower().split()
+    if not words or words[-1] in TRAILING_CONNECTIVES:
+        return False
+    if len(words) < 2 and len(text) < 4: # Single short English word; Chinese has no spaces
+        return False
+    return not router.intents(text)
+
+def llm_prompt(text):
+    """The prompt process_command() sends for text that needs no vision capture."""
+    return conversation.build_prompt(text) if conversation else text
+
+def start_response(command):
+    """
+    Runs process_command() on a responder thread so the main loop keeps reading the
+    microphone while the assistant speaks. Responses run one at a time.
+    """
+    global response_thread, response_cancel
+    previous, cancel = response_thread, threading.Event()
+    response_cancel = cancel
+
+    def run():
+        if previous is not None:
+            previous.join() # An interrupted response finishes quickly; its output is suppressed
+        _response_local.cancel = cancel
+        if cancel.is_set():
+            return
+        process_command(command)
+        if not cancel.is_set():
+            stt_session.keep_awake() # Follow-up questions need no wake word
+            if not stop_interaction_flag.is_set():
+                print("\nAssistant is listening...") # Prompt for next command
+
+    response_thread = threading.Thread(target=run, name="responder", daemon=True)
+    response_thread.start()
+
+def interrupt_response():
+    """Barge-in: cancels the current response and stops playback immediately."""
+    response_cancel.set()
+    if active_llm_stream is not None:
+        active_llm_stream.cancel()
+    speaker.stop()
+    audio_out.flush()
+
+def response_active() -> bool:
+    return response_thread is not None and response_thread.is_alive()
+
+def prewarm_tts_cache():
+    """Synthesizes the fixed phrases of every preloaded language into the TTS cache, in the background."""
+    def run():
+        synthesized = 0
+        for lang in config.MODEL_PRELOAD_LANGUAGES:
+            phrases = config.TTS_PREWARM_PHRASES.get(lang, [])
+            if not phrases:
+                continue
+            try:
+                # A separate module so the voice in use is not switched; voices are shared via the registry.
+                warm_tts = TTSModule(language=lang)
+            except EnvironmentError as e:
+                print(f"TTS cache prewarm skipped: {e}")
+                return
+            synthesized += warm_tts.prewarm(phrases)
+            warm_tts.close()
+        print(f"TTS cache prewarmed ({synthesized} phrases synthesized, others already cached).")
+
+    if pcm_cache is not None:
+        threading.Thread(target=run, name="tts-prewarm", daemon=True).start()
 
 def main_interaction_loop():
     """Main loop to handle voice and vision interaction."""
@@ -171,61 +375,108 @@ def main_interaction_loop():
         speak_response("Critical error: Microphone not working. Please check connection and restart.")
         return
 
+    prewarm_tts_cache()
+    if vision_worker is not None:
+        vision_worker.start() # Keeps a recent detection ready for vision commands
     # Optional: Start video capture if always-on vision is desired, or start on demand.
     # video_in.start_capture() 
 
     speak_response("Hello! How can I help you today?" if current_language == "en" else "你好！今天我能帮你做些什么？")
     print("Assistant is listening... Say 'exit' or '再见' to stop.")
+    if config.WAKE_WORD_ENABLED:
+        print(f"Wake-word mode: start commands with one of {config.WAKE_WORD_PHRASES.get(current_language, [])}.")
 
-    active_utterance = ""
-    silence_start_time = None
-    SILENCE_THRESHOLD_S = 2.0 # Seconds of silence to consider an utterance complete
+    stt_session.start()
+    if not audio_in.vad:
+        stt_session.begin_utterance() # Without VAD the session decodes continuously
+    active_utterance = "" # Final segments of the current utterance, for display
+    last_text_time = None
+    SILENCE_THRESHOLD_S = 2.0 # Fallback when VAD is disabled: seconds without new recognition results
+
+    barge_in = audio_in.echo_reference is not None # Respond on a separate thread and keep listening
+
+    def end_utterance():
+        final_command = stt_session.end_utterance()
+        print(f"\nUser (end of utterance): {final_command}")
+        if final_command and barge_in:
+            start_response(final_command)
+        elif final_command:
+            process_command(final_command)
+            stt_session.keep_awake() # Follow-up questions need no wake word
+            # Speech events from while the assistant was busy are stale.
+            while audio_in.get_vad_event():
+                pass
+            if not stop_interaction_flag.is_set():
+                print("\nAssistant is listening...") # Prompt for next command
+        if not audio_in.vad or audio_in.is_speaking:
+            stt_session.begin_utterance()
 
     try:
         while not stop_interaction_flag.is_set():
-            chunk = audio_in.get_audio_chunk(timeout=0.1) # Non-blocking
-            if chunk:
-                text, is_final = stt.recognize_chunk(chunk)
-                if text:
-                    active_utterance += text + (" " if is_final else "")
-                    print(f"STT Partial/Final: {text} -> Current: 	hemed_text_is_not_recognized_by_the_user_facing_tool}", end=\'\r\', flush=True)
-                    silence_start_time = None # Reset silence timer on activity
-                
-                if is_final and active_utterance.strip():
+            result = stt_session.get_result(timeout=0.1)
+            if result:
+                kind, text = result
+                last_text_time = time.time()
+                if kind == WAKE:
+                    print(f"\nWake word detected: {text}")
+                elif kind == FINAL:
+                    active_utterance += text + " "
                     print(f"\nSTT Final segment: {active_utterance.strip()}")
-                    # Process immediately after a final segment from Vosk if desired
-                    # process_command(active_utterance.strip())
-                    # active_utterance = "" 
-                    # For now, we wait for silence to confirm end of full command
-
-            else: # No audio chunk, indicates silence
-                if active_utterance.strip(): # If there was prior speech
-                    if silence_start_time is None:
-                        silence_start_time = time.time()
-                    elif time.time() - silence_start_time > SILENCE_THRESHOLD_S:
-                        final_command = active_utterance.strip()
-                        # Additional final recognition from Vosk if any buffered
-                        final_buffered = stt.get_final_recognition()
-                        if final_buffered:
-                            final_command += " " + final_buffered.strip()
-                        final_command = final_command.strip()
-                        
-                        print(f"\nUser (end of utterance): {final_command}")
-                        if final_command:
-                            process_command(final_command)
-                        active_utterance = ""
-                        silence_start_time = None
-                        if stop_interaction_flag.is_set(): break
-                        print("\nAssistant is listening...") # Prompt for next command
-            
-            time.sleep(0.05) # Small delay to prevent busy loop
+                    if speculator and can_speculate(active_utterance.strip()):
+                        speculator.speculate(llm_prompt(active_utterance.strip()))
+                else:
+                    if speculator:
+                        speculator.invalidate() # Speech continued after the final segment
+                    print(f"STT Partial: {text} -> Current: {active_utterance}{text}", end='\r', flush=True)
+
+            # VAD endpointing: speech_start opens an utterance, speech_end closes it after the hangover.
+            vad_event = audio_in.get_vad_event()
+            while vad_event:
+                event, stream_time = vad_event
+                if event == BARGE_IN:
+                    if response_active():
+                        print(f"\nBarge-in at {stream_time:.2f}s of stream: stopping playback.")
+                        interrupt_response()
+                    stt_session.begin_utterance() # The user's speech (and its pre-roll) starts a new turn
+                elif event == SPEECH_START:
+                    stt_session.begin_utterance()
+                elif event == SPEECH_END and stt_session.in_utterance:
+                    print(f"\nVAD: speech ended at {stream_time:.2f}s of stream.")
+                    end_utterance()
+                    active_utterance, last_text_time = "", None
+                vad_event = audio_in.get_vad_event()
+
+            if not audio_in.vad and last_text_time and time.time() - last_text_time > SILENCE_THRESHOLD_S:
+                end_utterance()
+                active_utterance, last_text_time = "", None
 
     except KeyboardInterrupt:
         print("\nInteraction interrupted by user (Ctrl+C).")
+        if response_active():
+            interrupt_response()
+        _response_local.cancel = None
         speak_response("Shutting down." if current_language == "en" else "正在关机。")
     finally:
         print("Cleaning up resources...")
+        if speculator:
+            print(f"Speculative LLM dispatch: {speculator.stats()}")
+            speculator.shutdown()
+        print(f"LLM client: {get_client().stats()}")
+        if response_cache is not None:
+            print(f"LLM response cache: {response_cache.stats()}")
+            response_cache.flush()
+        if pcm_cache is not None:
+            print(f"TTS cache: {pcm_cache.stats()}")
+        print(f"Audio output latency (enqueue to first sample): {audio_out.latency_stats()}")
+        stt_session.stop()
         audio_in.stop_listening()
+        if vision_worker is not None:
+            print(f"Vision worker: {vision_worker.stats()}")
+            vision_worker.stop()
+        if getattr(vision, 'scene_gate', None) is not None:
+            print(f"Vision scene-change gating: {vision.scene_gate.stats()}")
+        if getattr(vision, 'tracker', None) is not None:
+            print(f"Vision tracking: {vision.tracker.stats()}")
         if video_in.running:
             video_in.stop_capture()
         if hasattr(vision, 'close'): vision.close()
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from . import config
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.size_bytes = 0
+        self.refs = 0
+        self.error = None
+        self.loaded = threading.Event()
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded STT/TTS models shared by STTModule and TTSModule.
+
+    Models are keyed by (kind, path) and reference-counted. Released models stay
+    loaded so that switching back to a language is a pointer swap; models nobody
+    references are evicted least-recently-used first once the total estimated
+    size exceeds the memory budget. Sizes are estimated from the files on disk.
+    """
+    def __init__(self, memory_budget_mb=config.MODEL_MEMORY_BUDGET_MB):
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._entries = OrderedDict() # LRU order: oldest first
+        self._lock = threading.Lock()
+        self._loaders = {}
+        self.register_loader("vosk", _load_vosk_model)
+        self.register_loader("piper", _load_piper_voice, size_fn=_config_size)
+        self.register_loader("piper_voice", _load_piper_onnx_voice)
+
+    def register_loader(self, kind, loader, size_fn=None):
+        """
+        loader(path) -> model object; size_fn(path) -> estimated bytes in memory
+        (defaults to the size on disk). Replaces any existing loader for that kind.
+        """
+        self._loaders[kind] = (loader, size_fn or _disk_size)
+
+    def acquire(self, kind, path):
+        """
+        Returns the loaded model for (kind, path), loading it if necessary, and takes a reference.
+        Concurrent callers for the same model wait for a single load. Raises the loader's error.
+        """
+        key = (kind, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+            entry.refs += 1
+            self._entries.move_to_end(key)
+
+        if owner:
+            self._load(key, entry)
+        else:
+            entry.loaded.wait()
+
+        if entry.error is not None:
+            with self._lock:
+                entry.refs -= 1
+                if self._entries.get(key) is entry:
+                    del self._entries[key] # Allow a later retry
+            raise entry.error
+        return entry.model
+
+    def release(self, kind, path):
+        """Drops a reference. The model stays cached until evicted under the memory budget."""
+        with self._lock:
+            entry = self._entries.get((kind, path))
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            self._evict_locked()
+
+    def preload(self, items, background=True):
+        """
+        Loads (kind, path) pairs without taking references, so they stay evictable.
+        Missing paths are skipped. Returns the loader thread when run in the background.
+        """
+        def run():
+            for kind, path in items:
+                if not os.path.exists(path):
+                    continue
+                try:
+                    self.acquire(kind, path)
+                    self.release(kind, path)
+                except Exception as e:
+                    print(f"ModelRegistry: Preloading {kind} model {path} failed: {e}")
+            print(f"ModelRegistry: Preload finished ({self.loaded_mb():.0f} MB loaded).")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, kind, path) -> bool:
+        with self._lock:
+            entry = self._entries.get((kind, path))
+        return bool(entry and entry.loaded.is_set() and entry.error is None)
+
+    def loaded_mb(self) -> float:
+        with self._lock:
+            return sum(e.size_bytes for e in self._entries.values()) / (1024 * 1024)
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [{"kind": kind, "path": path, "refs": e.refs, "size_mb": e.size_bytes / (1024 * 1024),
+                     "loaded": e.loaded.is_set()} for (kind, path), e in self._entries.items()]
+
+    def _load(self, key, entry):
+        kind, path = key
+        start = time.time()
+        try:
+            if kind not in self._loaders:
+                raise ValueError(f"No loader registered for model kind '{kind}'")
+            loader, size_fn = self._loaders[kind]
+            entry.model = loader(path)
+            entry.size_bytes = size_fn(path)
+            print(f"ModelRegistry: Loaded {kind} model {path} in {time.time() - start:.2f}s "
+                  f"(~{entry.size_bytes / (1024 * 1024):.0f} MB).")
+        except Exception as e:
+            entry.error = e
+        finally:
+            entry.loaded.set()
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        total = sum(e.size_bytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.memory_budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refs > 0 or not entry.loaded.is_set():
+                continue
+            del self._entries[key]
+            total -= entry.size_bytes
+            print(f"ModelRegistry: Evicted {key[0]} model {key[1]} (memory budget).")
+
+def _disk_size(path) -> int:
+    if os.path.isfile(path):
+        size = os.path.getsize(path)
+        if os.path.exists(path + ".json"):
+            size += os.path.getsize(path + ".json")
+        return size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def _config_size(path) -> int:
+    config_path = path + ".json"
+    return os.path.getsize(config_path) if os.path.exists(config_path) else 0
+
+def _load_vosk_model(path):
+    import vosk
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Vosk model path not found: {path}")
+    return vosk.Model(path)
+
+def _load_piper_voice(path):
+    """Parsed Piper voice config (sample rate etc.), read from disk only once."""
+    config_path = path + ".json"
+    voice_config = {}
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            voice_config = json.load(f)
+    return {"model_path": path, "config_path": config_path, "config": voice_config}
+
+def _load_piper_onnx_voice(path):
+    """In-process Piper voice (piper-tts package); its ONNX session is reused for every synthesis."""
+    from piper.voice import PiperVoice
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Piper voice not found: {path}")
+    return PiperVoice.load(path, config_path=path + ".json")
+
+def language_model_items(languages) -> list[tuple[str, str]]:
+    """(kind, path) pairs for the STT and TTS models of the given languages."""
+    paths = {
+        "en": (config.VOSK_MODEL_PATH_EN, config.PIPER_MODEL_PATH_EN),
+        "zh": (config.VOSK_MODEL_PATH_ZH, config.PIPER_MODEL_PATH_ZH),
+    }
+    items = []
+    for lang in languages:
+        if lang in paths:
+            vosk_path, piper_path = paths[lang]
+            items += [("vosk", vosk_path), ("piper", piper_path)]
+            if config.TTS_BACKEND == "inprocess":
+                items.append(("piper_voice", piper_path))
+    return items
+
+# Shared instance used by STTModule and TTSModule
+registry = ModelRegistry()
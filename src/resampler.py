@@ -0,0 +1,176 @@
+import math
+import numpy as np
+
+class StreamingResampler:
+    """
+    Stateful polyphase FIR resampler with optional downmix, for int16 PCM streams.
+
+    The rate ratio is reduced to up/down = target/source. Output sample n sits
+    at input position n * down / up; its value is a dot product of the
+    preceding `taps` input samples with one phase of a windowed-sinc
+    low-pass filter. Input history and the output position are carried across
+    calls, so chunk boundaries are seamless: feeding a signal in pieces gives
+    exactly the same output as feeding it in one go. All per-chunk work is
+    vectorized with numpy.
+    """
+    def __init__(self, source_rate, target_rate, channels=1, quality=16, rolloff=0.92):
+        self.source_rate = int(source_rate)
+        self.target_rate = int(target_rate)
+        self.channels = channels
+        g = math.gcd(self.source_rate, self.target_rate)
+        self.up = self.target_rate // g
+        self.down = self.source_rate // g
+        self.passthrough = self.up == self.down
+        # Filter length grows with the larger of up/down so the transition band stays narrow;
+        # it is centred on a whole number of output samples so the delay is an integer.
+        self.delay_samples = max(1, math.ceil(quality * max(self.up, self.down) / (2 * self.down)))
+        self.taps = math.ceil((2 * self.down * self.delay_samples + 1) / self.up)
+        self._phases = self._design_filter(rolloff)
+        self.reset()
+
+    def _design_filter(self, rolloff) -> np.ndarray:
+        """Returns an (up, taps) matrix; row p holds phase p reversed, ready for a dot product with a window."""
+        n = 2 * self.down * self.delay_samples + 1
+        cutoff = rolloff / max(self.up, self.down) # Relative to the Nyquist rate of the upsampled stream
+        k = np.arange(n) - (n - 1) / 2.0
+        h = cutoff * np.sinc(cutoff * k) * np.kaiser(n, 8.0)
+        h *= self.up / h.sum() # Unity DC gain after zero-stuffing
+        h = np.concatenate((h, np.zeros(self.up * self.taps - n))) # Trailing zeros keep the centre in place
+        return h.reshape(self.taps, self.up).T[:, ::-1].astype(np.float32).copy()
+
+    @property
+    def delay_s(self) -> float:
+        """Group delay of the filter in seconds (a whole number of output samples)."""
+        return self.delay_samples / self.target_rate
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0 # Input samples (per channel) seen so far
+        self._produced = 0 # Output samples produced so far
+
+    def downmix(self, audio_chunk) -> np.ndarray:
+        """Interleaved int16 bytes/array -> mono float32."""
+        samples = np.frombuffer(audio_chunk, dtype=np.int16) if not isinstance(audio_chunk, np.ndarray) else audio_chunk
+        if self.channels == 1:
+            return samples.astype(np.float32)
+        return samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+
+    def process(self, audio_chunk) -> np.ndarray:
+        """Converts one chunk of interleaved int16 PCM; returns mono int16 at the target rate."""
+        x = self.downmix(audio_chunk)
+        if self.passthrough:
+            return np.clip(np.rint(x), -32768, 32767).astype(np.int16)
+        return self._to_int16(self.process_float(x))
+
+    def process_float(self, x: np.ndarray) -> np.ndarray:
+        """Resamples a mono float32 block, keeping stream state."""
+        ext = np.concatenate((self._history, x))
+        total_in = self._consumed + x.size
+        # Output n needs input index floor(n * down / up) to have arrived.
+        last_n = (total_in * self.up - 1) // self.down
+        n = np.arange(self._produced, last_n + 1, dtype=np.int64)
+        if n.size:
+            pos = n * self.down
+            idx = pos // self.up # Newest input sample under the filter
+            phase = pos % self.up
+            start = idx - (self._consumed - self._history.size) - (self.taps - 1)
+            windows = np.lib.stride_tricks.sliding_window_view(ext, self.taps)[start]
+            y = np.einsum("ij,ij->i", windows, self._phases[phase])
+        else:
+            y = np.zeros(0, dtype=np.float32)
+        self._produced += n.size
+        self._consumed = total_in
+        self._history = ext[-(self.taps - 1):].copy() if self.taps > 1 else self._history
+        return y
+
+    @staticmethod
+    def _to_int16(y: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(y), -32768, 32767).astype(np.int16)
+
+def _sine_snr_db(signal, freq, rate) -> float:
+    """SNR of a signal against its least-squares best-fit sine at freq (amplitude/phase free)."""
+    t = np.arange(signal.size) / rate
+    basis = np.stack([np.sin(2 * np.pi * freq * t), np.cos(2 * np.pi * freq * t), np.ones_like(t)], axis=1)
+    coef, *_ = np.linalg.lstsq(basis, signal, rcond=None)
+    fit = basis @ coef
+    noise = signal - fit
+    return 10 * np.log10(np.sum(fit ** 2) / max(np.sum(noise ** 2), 1e-12))
+
+def _fft_reference_resample(x, source_rate, target_rate) -> np.ndarray:
+    """Band-limited FFT resampling, used as the reference when scipy is not installed."""
+    n_out = int(round(x.size * target_rate / source_rate))
+    spectrum = np.fft.rfft(x)
+    keep = min(spectrum.size, n_out // 2 + 1)
+    out = np.zeros(n_out // 2 + 1, dtype=complex)
+    out[:keep] = spectrum[:keep]
+    return np.fft.irfft(out, n_out) * (n_out / x.size)
+
+def accuracy_test() -> bool:
+    """Checks streaming consistency, sine SNR and agreement with a reference resampler."""
+    ok = True
+    rng = np.random.default_rng(0)
+    for source_rate, channels in ((48000, 2), (44100, 2), (44100, 1), (22050, 1)):
+        target_rate = 16000
+        duration_s = 2.0
+        t = np.arange(int(duration_s * source_rate)) / source_rate
+        tone = 8000 * np.sin(2 * np.pi * 1000 * t)
+        interleaved = np.repeat(tone, channels).astype(np.int16) if channels > 1 else tone.astype(np.int16)
+
+        one_shot = StreamingResampler(source_rate, target_rate, channels).process(interleaved)
+        streamed = StreamingResampler(source_rate, target_rate, channels)
+        pieces, pos = [], 0
+        while pos < interleaved.size: # Random chunk sizes, always whole frames
+            step = int(rng.integers(1, 3000)) * channels
+            pieces.append(streamed.process(interleaved[pos:pos + step]))
+            pos += step
+        chunked = np.concatenate(pieces)
+        seamless = np.array_equal(one_shot, chunked)
+
+        settle = int(0.05 * target_rate) # Skip filter start-up
+        snr = _sine_snr_db(one_shot[settle:].astype(np.float64), 1000, target_rate)
+
+        # Aliasing check: a tone above the target Nyquist must be strongly attenuated.
+        alias_tone = (8000 * np.sin(2 * np.pi * 11000 * t)).astype(np.int16)
+        alias_out = StreamingResampler(source_rate, target_rate, 1).process(alias_tone)[settle:].astype(np.float64)
+        rejection_db = 20 * np.log10(8000 / max(np.sqrt(2 * np.mean(alias_out ** 2)), 1e-9))
+
+        mono = tone.astype(np.float64)
+        try:
+            from scipy.signal import resample_poly
+            reference = resample_poly(mono, target_rate, source_rate)
+            ref_name = "scipy resample_poly"
+        except ImportError:
+            reference = _fft_reference_resample(mono, source_rate, target_rate)
+            ref_name = "FFT resample"
+        ours = one_shot.astype(np.float64)
+        lag = StreamingResampler(source_rate, target_rate).delay_samples
+        n = min(ours.size - lag, reference.size) - settle # Also skips the reference's wrap-around edge
+        diff = ours[lag + settle:lag + n] - reference[settle:n]
+        ref_snr = 10 * np.log10(np.sum(reference[settle:n] ** 2) / max(np.sum(diff ** 2), 1e-12))
+
+        case_ok = seamless and snr > 40 and rejection_db > 40 and ref_snr > 25
+        ok = ok and case_ok
+        print(f"{source_rate} Hz x{channels} -> {target_rate} Hz: seamless={seamless} tone SNR={snr:.1f} dB "
+              f"alias rejection={rejection_db:.1f} dB vs {ref_name}={ref_snr:.1f} dB -> {'OK' if case_ok else 'FAIL'}")
+    return ok
+
+def benchmark(duration_s=10.0, chunk_ms=64):
+    """Reports throughput of the streaming resampler in the capture-path configuration."""
+    import time
+    for source_rate, channels in ((48000, 2), (44100, 2), (48000, 1)):
+        chunk = int(source_rate * chunk_ms / 1000) * channels
+        audio = (np.random.default_rng(1).normal(0, 3000, int(duration_s * source_rate) * channels)).astype(np.int16)
+        resampler = StreamingResampler(source_rate, 16000, channels)
+        start = time.perf_counter()
+        for pos in range(0, audio.size, chunk):
+            resampler.process(audio[pos:pos + chunk])
+        elapsed = time.perf_counter() - start
+        print(f"{source_rate} Hz x{channels} -> 16 kHz mono: {duration_s / elapsed:7.0f}x real time, "
+              f"{elapsed / (audio.size / chunk) * 1e6:6.0f} us per {chunk_ms} ms chunk")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark()
+    else:
+        sys.exit(0 if accuracy_test() else 1)
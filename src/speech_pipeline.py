@@ -0,0 +1,243 @@
+import queue
+import re
+import threading
+import time
+from . import config
+
+# Sentence ends: ASCII punctuation needs following whitespace (so "3.5" or "e.g.x" stay intact),
+# CJK punctuation does not since Chinese text has no spaces.
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|(?<=[。！？；…])\s*|\n+")
+_CLAUSE_SPLIT = re.compile(r"(?<=[,:])\s+|(?<=[，、：])\s*")
+
+def split_into_clauses(text, max_chars=config.TTS_MAX_CLAUSE_CHARS, first_max_chars=config.TTS_FIRST_CLAUSE_CHARS,
+                       min_chars=config.TTS_MIN_CLAUSE_CHARS) -> list[str]:
+    """
+    Splits a reply into sentence/clause units for pipelined synthesis (English and Chinese punctuation).
+
+    Sentences longer than max_chars are split further at commas; the first unit uses the
+    smaller first_max_chars so the first audio is ready sooner. Fragments shorter than
+    min_chars are merged into a neighbour to avoid choppy prosody.
+    """
+    units = []
+    for sentence in _SENTENCE_SPLIT.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        limit = first_max_chars if not units else max_chars
+        if len(sentence) <= limit:
+            units.append(sentence)
+            continue
+        current = ""
+        for part in _CLAUSE_SPLIT.split(sentence):
+            part = part.strip()
+            if not part:
+                continue
+            limit = first_max_chars if not units else max_chars
+            joiner = "" if _is_cjk(current[-1:]) or _is_cjk(part[:1]) else " "
+            if current and len(current) + len(joiner) + len(part) > limit:
+                units.append(current)
+                current = part
+            else:
+                current = f"{current}{joiner}{part}" if current else part
+        if current:
+            units.append(current)
+
+    merged = []
+    for unit in units:
+        limit = first_max_chars if len(merged) == 1 else max_chars
+        if merged and len(merged[-1]) < min_chars and len(merged[-1]) + 1 + len(unit) <= limit:
+            joiner = "" if _is_cjk(merged[-1][-1:]) else " "
+            merged[-1] = f"{merged[-1]}{joiner}{unit}"
+        else:
+            merged.append(unit)
+    if len(merged) > 1 and len(merged[-1]) < min_chars:
+        tail = merged.pop()
+        joiner = "" if _is_cjk(tail[:1]) else " "
+        merged[-1] = f"{merged[-1]}{joiner}{tail}"
+    return merged
+
+def _is_cjk(char) -> bool:
+    return bool(char) and ("　" <= char <= "鿿" or "＀" <= char <= "￯")
+
+def _last_boundary(text, pattern) -> int | None:
+    """End of the last separator match in text, or None."""
+    end = None
+    for match in pattern.finditer(text):
+        end = match.end()
+    return end
+
+def iter_stream_clauses(chunks, max_chars=config.TTS_MAX_CLAUSE_CHARS, first_max_chars=config.TTS_FIRST_CLAUSE_CHARS,
+                        min_chars=config.TTS_MIN_CLAUSE_CHARS):
+    """
+    Incremental split_into_clauses() for text that arrives in chunks (e.g. a streaming LLM reply).
+    Yields each clause as soon as it is complete: at a sentence end, or at a clause
+    boundary once the pending text is longer than the clause limit.
+    """
+    buffer, emitted = "", False
+    for chunk in chunks:
+        buffer += chunk
+        limit = max_chars if emitted else first_max_chars
+        cut = _last_boundary(buffer, _SENTENCE_SPLIT)
+        # The first sentence goes out however short it is: it sets the time to first audio.
+        if cut is not None and emitted and len(buffer[:cut].strip()) < min_chars:
+            cut = None
+        if cut is None and len(buffer) > limit:
+            cut = _last_boundary(buffer, _CLAUSE_SPLIT)
+        if cut is None:
+            continue
+        for clause in split_into_clauses(buffer[:cut], max_chars, limit, min_chars):
+            emitted = True
+            yield clause
+        buffer = buffer[cut:]
+    if buffer.strip():
+        yield from split_into_clauses(buffer, max_chars, max_chars if emitted else first_max_chars, min_chars)
+
+class PipelinedSpeaker:
+    """
+    Speaks a reply clause by clause: a worker thread synthesizes clause N+1
+    while AudioOutput plays clause N, so playback starts after the first
+    clause instead of after the whole reply. Clauses are queued on the output
+    stream as soon as they are ready, so there is no gap when synthesis keeps up.
+    speak_stream() does the same for text that is still being generated.
+
+    Both return timing metrics: time to first audio and the gaps between
+    clauses (how long the speaker ran dry waiting for synthesis or text).
+    """
+    def __init__(self, tts, audio_out, lookahead=2):
+        self.tts = tts
+        self.audio_out = audio_out
+        self.lookahead = lookahead
+        self._stop = threading.Event() # Replaced for every reply, so a stopped worker never resumes
+
+    def stop(self):
+        """Stops synthesis and playback of the current reply immediately."""
+        self._stop.set()
+        self.audio_out.flush()
+
+    def _synthesize_worker(self, clauses, out_queue, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    out_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+        try:
+            for clause in clauses: # May block on a text stream; runs on this thread, not the caller's
+                if stop.is_set():
+                    break
+                put((clause, self.tts.synthesize(clause)))
+        except Exception as e:
+            print(f"TTS pipeline: text source failed: {e}")
+        put(None)
+
+    def speak(self, text) -> dict:
+        """Speaks a complete reply and returns when it has been played (or stopped)."""
+        return self._speak_clauses(split_into_clauses(text))
+
+    def speak_stream(self, chunks) -> dict:
+        """Speaks text chunks as they arrive; the first clause plays while the rest is still being generated."""
+        return self._speak_clauses(iter_stream_clauses(chunks))
+
+    def _speak_clauses(self, clauses) -> dict:
+        start = time.perf_counter()
+        stop = self._stop = threading.Event()
+        metrics = {"clauses": 0, "time_to_first_audio_s": None, "gaps_s": [], "failed": 0, "interrupted": False}
+        pcm_queue = queue.Queue(maxsize=self.lookahead)
+        worker = threading.Thread(target=self._synthesize_worker, args=(clauses, pcm_queue, stop),
+                                  name="tts-pipeline", daemon=True)
+        worker.start()
+        playback_end = None # When the audio queued so far finishes playing
+        while not stop.is_set():
+            try:
+                item = pcm_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            metrics["clauses"] += 1
+            clause, synthesized = item
+            if not synthesized:
+                metrics["failed"] += 1
+                continue
+            pcm, audio_format = synthesized
+            now = time.perf_counter()
+            if metrics["time_to_first_audio_s"] is None:
+                metrics["time_to_first_audio_s"] = now - start
+            elif playback_end is not None:
+                metrics["gaps_s"].append(max(0.0, now - playback_end))
+            if stop.is_set():
+                break
+            self.audio_out.enqueue_pcm(pcm, audio_format)
+            duration = len(pcm) / (audio_format["sample_rate"] * audio_format["channels"] * audio_format["sample_width"])
+            playback_end = max(now, playback_end or now) + duration
+        if not stop.is_set():
+            self.audio_out.drain()
+        metrics["interrupted"] = stop.is_set()
+        stop.set() # The worker exits at its next clause; it is not waited for (it may be blocked on a text stream)
+        metrics["total_s"] = time.perf_counter() - start
+        return metrics
+
+class _TimedNullOutput:
+    """Benchmark stand-in for AudioOutput: tracks when queued audio would finish playing."""
+    def __init__(self):
+        self._end = 0.0
+
+    def enqueue_pcm(self, audio_data, audio_format):
+        duration = len(audio_data) / (audio_format["sample_rate"] * audio_format["channels"] * audio_format["sample_width"])
+        self._end = max(self._end, time.perf_counter()) + duration
+        return True
+
+    def play_pcm(self, audio_data, audio_format):
+        self.enqueue_pcm(audio_data, audio_format)
+        self.drain()
+        return True
+
+    def drain(self, timeout=None):
+        time.sleep(max(0.0, self._end - time.perf_counter()))
+        return True
+
+    def flush(self):
+        self._end = 0.0
+
+def benchmark(tts, text, audio_out=None) -> dict:
+    """
+    Compares time to first audio of whole-reply synthesis with the clause pipeline,
+    and reports the gaps between clauses. Without audio_out, playback is simulated.
+    """
+    audio_out = audio_out or _TimedNullOutput()
+    start = time.perf_counter()
+    synthesized = tts.synthesize(text)
+    whole_first_audio = time.perf_counter() - start
+    if synthesized:
+        audio_out.play_pcm(*synthesized)
+    whole_total = time.perf_counter() - start
+
+    metrics = PipelinedSpeaker(tts, audio_out).speak(text)
+    gaps = metrics["gaps_s"]
+    print(f"Whole reply:  first audio after {whole_first_audio * 1000:7.0f} ms, done after {whole_total:5.2f} s")
+    print(f"Pipelined:    first audio after {metrics['time_to_first_audio_s'] * 1000:7.0f} ms, "
+          f"done after {metrics['total_s']:5.2f} s, {metrics['clauses']} clauses")
+    if gaps:
+        print(f"Clause gaps:  mean {sum(gaps) / len(gaps) * 1000:.0f} ms, max {max(gaps) * 1000:.0f} ms")
+    return {"whole_first_audio_s": whole_first_audio, **metrics}
+
+if __name__ == "__main__":
+    import sys
+    from .tts_module import TTSModule
+    # python -m src.speech_pipeline [--play] [en|zh] "text to speak"
+    args = sys.argv[1:]
+    play = "--play" in args
+    args = [a for a in args if a != "--play"]
+    language = args[0] if args and args[0] in config.SUPPORTED_LANGUAGES else config.DEFAULT_LANGUAGE
+    text = args[-1] if args and args[-1] not in config.SUPPORTED_LANGUAGES else (
+        "Sure. The camera shows a desk with a laptop, a coffee cup and a notebook. "
+        "The cup is on the left, next to the keyboard, and the notebook is open. "
+        "Would you like me to describe anything in more detail?" if language == "en" else
+        "好的。摄像头里有一张桌子，上面放着一台笔记本电脑、一个咖啡杯和一本笔记本。杯子在左边，靠近键盘。需要我再详细描述一下吗？")
+    print(f"Clauses: {split_into_clauses(text)}")
+    output = None
+    if play:
+        from .audio_output import AudioOutput
+        output = AudioOutput()
+    benchmark(TTSModule(language=language), text, output)
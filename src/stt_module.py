@@ -1,7 +1,13 @@
 import vosk
 import json
 import os
+import queue
+import threading
+import time
+from collections import deque
 from . import config
+from .model_registry import registry
+from .batch_transcribe import transcribe_file
 from .audio_input import AudioInput # Assuming audio_input.py is in the same directory
 
 class STTModule:
@@ -9,6 +15,7 @@ class STTModule:
         self.language = language
         self.model_path = self._get_model_path()
         self.model = None
+        self._acquired_path = None
         self.recognizer = None
         self._load_model()
 
@@ -18,7 +25,7 @@ class STTModule:
         elif self.language == "zh":
             return config.VOSK_MODEL_PATH_ZH
         else:
-            print(f"Warning: Language 	hemed_text_is_not_recognized_by_the_user_facing_tool} not supported by STT, defaulting to English.")
+            print(f"Warning: Language {self.language} not supported by STT, defaulting to English.")
             self.language = "en"
             return config.VOSK_MODEL_PATH_EN
 
@@ -34,7 +41,9 @@ class STTModule:
             # And extract to a directory, then update VOSK_MODEL_PATH_EN/ZH in config.py
             return
         try:
-            self.model = vosk.Model(self.model_path)
+            # Shared registry: already-loaded models are returned without touching the disk.
+            self.model = registry.acquire("vosk", self.model_path)
+            self._acquired_path = self.model_path
             # The recognizer is created per audio stream or when sample rate is known.
             # We will create it when recognize_stream is called, or use a default sample rate.
             print(f"STTModule: Vosk model for {self.language} loaded successfully from {self.model_path}.")
@@ -51,7 +60,12 @@ class STTModule:
             print(f"STTModule: Changing language from {self.language} to {language_code}")
             self.language = language_code
             self.model_path = self._get_model_path()
-            self._load_model() # Reload model for the new language
+            previous_path = self._acquired_path
+            self._acquired_path = None
+            self.model = None
+            self._load_model() # Pointer swap if the registry already holds this language
+            if previous_path:
+                registry.release("vosk", previous_path)
             self.recognizer = None # Recognizer needs to be recreated
 
     def recognize_chunk(self, audio_chunk, sample_rate=config.AUDIO_SAMPLE_RATE) -> tuple[str, bool]:
@@ -90,37 +104,336 @@ class STTModule:
         self.recognizer = None # Reset recognizer for next utterance
         return result.get("text", "")
 
-    def recognize_audio_file(self, file_path, sample_rate=config.AUDIO_SAMPLE_RATE) -> str:
+    def recognize_audio_file(self, file_path, sample_rate=None) -> str:
+        """
+        Transcribes a WAV file. The sample rate is taken from the WAV header unless given;
+        the header itself is never fed to the recognizer.
+        See batch_transcribe.py for multi-file, multi-process transcription.
+        """
         if not self.model:
             print("STT Error: Vosk model not loaded.")
             return ""
         if not os.path.exists(file_path):
             print(f"STT Error: Audio file not found: {file_path}")
             return ""
-        
-        recognizer = vosk.KaldiRecognizer(self.model, sample_rate)
-        # recognizer.SetWords(True) # If you want word timestamps
 
+        record = transcribe_file(self.model, file_path, words=False, sample_rate=sample_rate)
+        if "error" in record:
+            print(f"Error during file recognition: {record['error']}")
+            return ""
+        return record.get("text", "")
+
+PARTIAL = "partial"
+FINAL = "final"
+WAKE = "wake"
+
+class STTSession:
+    """
+    Long-lived recognition session owned by a dedicated STT worker thread.
+
+    The worker pulls chunks straight from an AudioInput and is the only thread
+    that touches the KaldiRecognizer. Audio is decoded only between
+    begin_utterance() and end_utterance(); outside an utterance the worker just
+    keeps a short pre-roll so the first syllable is not lost when the VAD
+    reports speech slightly late. Partial results are computed at most every
+    partial_interval_s and only if partials are enabled.
+
+    In wake-word mode, utterances are first decoded by a grammar-restricted
+    recognizer that only knows the wake phrases of the current language
+    (config.WAKE_WORD_PHRASES). Once a phrase is heard the rest of the audio
+    goes to the full recognizer, and the session stays awake for wake_active_s
+    after the last command.
+    """
+    def __init__(self, stt: "STTModule", audio_input: AudioInput = None,
+                 partial_interval_s=config.STT_PARTIAL_INTERVAL_S, preroll_ms=config.STT_PREROLL_MS,
+                 enable_partials=True, wake_word_enabled=config.WAKE_WORD_ENABLED,
+                 wake_active_s=config.WAKE_WORD_ACTIVE_S):
+        self.stt = stt
+        self.audio_input = audio_input
+        self.partial_interval_s = partial_interval_s
+        self.enable_partials = enable_partials
+        self.wake_word_enabled = wake_word_enabled
+        self.wake_active_s = wake_active_s
+        self.sample_rate = audio_input.sample_rate if audio_input else config.AUDIO_SAMPLE_RATE
+        chunk_ms = 1000 * (audio_input.chunk_size if audio_input else config.AUDIO_CHUNK_SIZE) / self.sample_rate
+        self._preroll = deque(maxlen=max(1, int(preroll_ms / chunk_ms + 0.5)))
+        self._results = queue.Queue()
+        self._commands = queue.Queue()
+        self._recognizer = None
+        self._wake_recognizer = None
+        self._wake_phrases = []
+        self._model = None
+        self._awake_until = 0.0
+        self._listening_for_wake = False
+        self._in_utterance = False # Worker-side decoding state
+        self._utterance_open = False # Caller-side view, updated synchronously
+        self._segments = []
+        self._last_partial_time = 0.0
+        self._last_partial = ""
+        self._thread = None
+        self._running = False
+        self.chunks_decoded = 0
+
+    # --- Public API (any thread) ---
+
+    def start(self):
+        if self._running:
+            print("STTSession is already running.")
+            return
+        if self.audio_input is None:
+            raise ValueError("STTSession needs an AudioInput to run a worker thread.")
+        self._running = True
+        self._thread = threading.Thread(target=self._worker_loop, name="stt-worker", daemon=True)
+        self._thread.start()
+        print("STTSession: Worker thread started.")
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+        self._thread = None
+        print("STTSession: Worker thread stopped.")
+
+    def begin_utterance(self):
+        """Starts decoding (pre-roll first). Returns immediately."""
+        self._utterance_open = True
+        self._call("begin", wait=False)
+
+    def end_utterance(self, timeout=2.0) -> str:
+        """Finishes the current utterance and returns its full text ("" if none or on timeout)."""
+        self._utterance_open = False
+        return self._call("end", wait=True, timeout=timeout) or ""
+
+    def get_result(self, timeout=0.1) -> tuple[str, str] | None:
+        """Returns the next (PARTIAL|FINAL, text) result published by the worker, or None."""
         try:
-            with open(file_path, "rb") as wf:
-                while True:
-                    data = wf.read(config.AUDIO_CHUNK_SIZE) # Read in chunks
-                    if len(data) == 0:
-                        break
-                    if recognizer.AcceptWaveform(data):
-                        pass # Processed full utterance segment
-                        # print(json.loads(recognizer.Result())["text"])
-                    else:
-                        pass # Processing partial result
-                        # print(json.loads(recognizer.PartialResult())["partial"])
-                
-                final_result = json.loads(recognizer.FinalResult())
-                return final_result.get("text", "")
-        except Exception as e:
-            print(f"Error during file recognition: {e}")
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    @property
+    def in_utterance(self) -> bool:
+        return self._utterance_open
+
+    @property
+    def is_awake(self) -> bool:
+        """True when utterances go straight to full recognition."""
+        return not self.wake_word_enabled or time.monotonic() < self._awake_until
+
+    def keep_awake(self):
+        """Restarts the awake window, e.g. after the assistant finished answering."""
+        self._awake_until = time.monotonic() + self.wake_active_s
+
+    def _call(self, command, wait, timeout=None):
+        if not (self._running and self._thread):
+            return self._handle_command(command) # No worker: the caller owns the recognizer
+        reply = queue.Queue(maxsize=1) if wait else None
+        self._commands.put((command, reply))
+        if not wait:
+            return None
+        try:
+            return reply.get(timeout=timeout)
+        except queue.Empty:
+            print(f"STTSession: '{command}' timed out.")
+            return None
+
+    # --- Worker thread ---
+
+    def _worker_loop(self):
+        while self._running:
+            self._drain_commands()
+            chunk = self.audio_input.get_audio_chunk(timeout=0.05)
+            if chunk:
+                self.process_chunk(chunk)
+        self._drain_commands()
+
+    def _drain_commands(self):
+        while True:
+            try:
+                command, reply = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            result = self._handle_command(command)
+            if reply is not None:
+                reply.put(result)
+
+    def _handle_command(self, command):
+        if command == "begin":
+            return self._begin()
+        if command == "end":
+            return self._end()
+        raise ValueError(f"Unknown STTSession command: {command}")
+
+    def _begin(self):
+        if self._in_utterance:
+            return None
+        model = self.stt.model
+        if model is None:
+            return None
+        if self._recognizer is None or model is not self._model: # Language switch swaps the model
+            self._recognizer = vosk.KaldiRecognizer(model, self.sample_rate)
+            self._wake_recognizer = None
+            self._model = model
+        self._listening_for_wake = not self.is_awake
+        if self._listening_for_wake and self._wake_recognizer is None:
+            self._wake_phrases = config.WAKE_WORD_PHRASES.get(self.stt.language, [])
+            # "[unk]" absorbs everything that is not a wake phrase.
+            grammar = json.dumps(self._wake_phrases + ["[unk]"], ensure_ascii=False)
+            self._wake_recognizer = vosk.KaldiRecognizer(model, self.sample_rate, grammar)
+        self._in_utterance = True
+        self._segments = []
+        self._last_partial = ""
+        self._last_partial_time = 0.0
+        while self._preroll:
+            self._decode(self._preroll.popleft())
+        return None
+
+    def _end(self) -> str:
+        if not self._in_utterance:
             return ""
+        self._in_utterance = False
+        if self._listening_for_wake: # Only the wake phrase (or nothing) was said
+            self._listening_for_wake = False
+            self._check_wake(json.loads(self._wake_recognizer.FinalResult()).get("text", ""))
+            return ""
+        tail = json.loads(self._recognizer.FinalResult()).get("text", "")
+        if tail:
+            self._segments.append(tail)
+        text = " ".join(self._segments).strip()
+        self._segments = []
+        if text and self.wake_word_enabled:
+            self.keep_awake()
+        return text
+
+    def _check_wake(self, text) -> bool:
+        phrase = next((p for p in self._wake_phrases if p in text), None)
+        if phrase is None:
+            return False
+        self.keep_awake()
+        self._results.put((WAKE, phrase))
+        return True
+
+    def _decode_wake(self, chunk):
+        if self._wake_recognizer.AcceptWaveform(chunk):
+            text = json.loads(self._wake_recognizer.Result()).get("text", "")
+        else:
+            text = json.loads(self._wake_recognizer.PartialResult()).get("partial", "")
+        if self._check_wake(text):
+            # The rest of this utterance is the command: hand it to the full recognizer.
+            self._wake_recognizer.FinalResult() # Resets the grammar decoder
+            self._listening_for_wake = False
+
+    def process_chunk(self, chunk):
+        """Feeds one chunk; only call from the thread that owns the session."""
+        if not chunk:
+            return # Never hand empty buffers to the recognizer
+        if not self._in_utterance:
+            self._preroll.append(chunk)
+            return
+        self._decode(chunk)
+
+    def _decode(self, chunk):
+        self.chunks_decoded += 1
+        if self._listening_for_wake:
+            self._decode_wake(chunk)
+            return
+        if self._recognizer.AcceptWaveform(chunk):
+            text = json.loads(self._recognizer.Result()).get("text", "")
+            self._last_partial = ""
+            if text:
+                self._segments.append(text)
+                self._results.put((FINAL, text))
+        elif self.enable_partials:
+            now = time.monotonic()
+            if now - self._last_partial_time >= self.partial_interval_s:
+                self._last_partial_time = now
+                partial = json.loads(self._recognizer.PartialResult()).get("partial", "")
+                if partial and partial != self._last_partial:
+                    self._last_partial = partial
+                    self._results.put((PARTIAL, partial))
+
+def benchmark_chunk_throughput(stt: STTModule, wav_path, chunk_frames=config.AUDIO_CHUNK_SIZE) -> dict:
+    """
+    Compares chunks/sec of the per-chunk recognize_chunk() path with an STTSession
+    fed the same 16-bit mono WAV. CPU time is process time, so it reflects decode cost.
+    """
+    import wave
+    with wave.open(wav_path, "rb") as wf:
+        sample_rate = wf.getframerate()
+        bytes_per_chunk = chunk_frames * wf.getsampwidth() * wf.getnchannels()
+        pcm = wf.readframes(wf.getnframes())
+    chunks = [pcm[i:i + bytes_per_chunk] for i in range(0, len(pcm), bytes_per_chunk)]
+    audio_s = len(pcm) / (bytes_per_chunk / chunk_frames) / sample_rate
+
+    results = {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    for chunk in chunks:
+        stt.recognize_chunk(chunk, sample_rate=sample_rate)
+    legacy_text = stt.get_final_recognition()
+    results["recognize_chunk"] = (time.perf_counter() - wall, time.process_time() - cpu, legacy_text)
+
+    session = STTSession(stt)
+    session.sample_rate = sample_rate
+    wall, cpu = time.perf_counter(), time.process_time()
+    session.begin_utterance()
+    for chunk in chunks:
+        session.process_chunk(chunk)
+    session_text = session.end_utterance()
+    results["session"] = (time.perf_counter() - wall, time.process_time() - cpu, session_text)
+
+    print(f"Benchmark on {wav_path}: {len(chunks)} chunks, {audio_s:.1f}s of audio")
+    for name, (wall_s, cpu_s, text) in results.items():
+        print(f"  {name:16s} {len(chunks) / wall_s:8.1f} chunks/s  CPU {cpu_s / audio_s * 1000:6.1f} ms per audio second"
+              f"  text: {text[:60]!r}")
+    return {name: {"chunks_per_s": len(chunks) / r[0], "cpu_s_per_audio_s": r[1] / audio_s}
+            for name, r in results.items()}
+
+def benchmark_wake_word_cpu(stt: STTModule, wav_path, chunk_frames=config.AUDIO_CHUNK_SIZE) -> dict:
+    """
+    CPU cost per second of audio for continuous full recognition versus the
+    grammar-restricted wake-word recognizer, on a recording of idle background
+    audio (room noise, TV, people not addressing the assistant).
+    """
+    import wave
+    with wave.open(wav_path, "rb") as wf:
+        sample_rate = wf.getframerate()
+        bytes_per_chunk = chunk_frames * wf.getsampwidth() * wf.getnchannels()
+        pcm = wf.readframes(wf.getnframes())
+    chunks = [pcm[i:i + bytes_per_chunk] for i in range(0, len(pcm), bytes_per_chunk)]
+    audio_s = len(pcm) / (bytes_per_chunk / chunk_frames) / sample_rate
+    phrases = config.WAKE_WORD_PHRASES.get(stt.language, [])
+    recognizers = {
+        "full recognition": vosk.KaldiRecognizer(stt.model, sample_rate),
+        "wake-word mode": vosk.KaldiRecognizer(stt.model, sample_rate, json.dumps(phrases + ["[unk]"], ensure_ascii=False)),
+    }
+    results = {}
+    print(f"Idle CPU on {wav_path} ({audio_s:.1f}s of audio), wake phrases: {phrases}")
+    for name, recognizer in recognizers.items():
+        cpu = time.process_time()
+        for chunk in chunks:
+            if recognizer.AcceptWaveform(chunk):
+                recognizer.Result()
+            else:
+                recognizer.PartialResult()
+        recognizer.FinalResult()
+        cpu_per_s = (time.process_time() - cpu) / audio_s
+        results[name] = cpu_per_s
+        print(f"  {name:16s} {cpu_per_s * 100:5.1f}% of one core")
+    return results
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] in ("--bench", "--bench-wake"):
+        # python -m src.stt_module --bench recording.wav [en|zh]
+        # python -m src.stt_module --bench-wake idle_room.wav [en|zh]
+        stt_bench = STTModule(language=sys.argv[3] if len(sys.argv) > 3 else config.DEFAULT_LANGUAGE)
+        if stt_bench.model:
+            if sys.argv[1] == "--bench":
+                benchmark_chunk_throughput(stt_bench, sys.argv[2])
+            else:
+                benchmark_wake_word_cpu(stt_bench, sys.argv[2])
+        sys.exit(0)
+
     print("Testing STTModule...")
     # This test requires Vosk models to be downloaded and paths configured in config.py
     # It also requires a microphone for live testing.
@@ -147,7 +460,7 @@ if __name__ == '__main__':
                     if chunk:
                         text, is_final = stt_en.recognize_chunk(chunk)
                         if text:
-                            print(f"Partial/Final EN: {text}", end=\'\r\', flush=True)
+                            print(f"Partial/Final EN: {text}", end='\r', flush=True)
                         if is_final and text:
                             full_transcript_en += text + " "
                             print(f"Final Segment EN: {text}") # Newline after final segment
@@ -174,7 +487,7 @@ if __name__ == '__main__':
                     if chunk:
                         text, is_final = stt_zh.recognize_chunk(chunk)
                         if text:
-                            print(f"Partial/Final ZH: {text}", end=\'\r\', flush=True)
+                            print(f"Partial/Final ZH: {text}", end='\r', flush=True)
                         if is_final and text:
                             full_transcript_zh += text + " " # Add space for sentence separation
                             print(f"Final Segment ZH: {text}")
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from . import config
+
+def normalize_text(text) -> str:
+    """Cache form of a phrase: NFKC (full-width -> ASCII forms) with whitespace collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+def voice_fingerprint(model_path, voice_config) -> str:
+    """
+    Identifies a voice: model path, size and modification time, plus its config
+    (sample rate, inference scales). Replacing the model or editing the config
+    changes the fingerprint, so stale audio is never served.
+    """
+    try:
+        stat = os.stat(model_path)
+        file_id = f"{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        file_id = "missing"
+    config_json = json.dumps(voice_config or {}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(f"{os.path.abspath(model_path)}|{file_id}|{config_json}".encode("utf-8")).hexdigest()[:16]
+
+class PCMCache:
+    """
+    Content-addressed cache of synthesized speech (raw 16-bit mono PCM).
+
+    Entries are keyed by sha1(voice fingerprint, normalized text). The memory
+    tier is an LRU bounded by memory_mb. With a cache directory, entries put with
+    persist=True (the prewarmed phrases; every entry if persist_all) are also
+    written to <dir>/<key>.pcm by a background writer and survive restarts, so
+    synthesizing a reply never waits on the SD card. The directory is indexed
+    once at start-up and trimmed oldest-access-first to disk_mb from that index.
+    """
+    def __init__(self, memory_mb=config.TTS_CACHE_MEMORY_MB, cache_dir=config.TTS_CACHE_DIR,
+                 disk_mb=config.TTS_CACHE_DISK_MB, persist_all=config.TTS_CACHE_PERSIST_ALL):
+        self.memory_budget_bytes = int(memory_mb * 1024 * 1024)
+        self.disk_budget_bytes = int(disk_mb * 1024 * 1024)
+        self.cache_dir = cache_dir
+        self.persist_all = persist_all
+        self._entries = OrderedDict() # LRU order: oldest first
+        self._memory_bytes = 0
+        self._disk_files = OrderedDict() # key -> size on disk, oldest access first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._write_queue = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._index_disk()
+            except OSError as e:
+                print(f"TTSCache: Cannot use cache directory {self.cache_dir}: {e}")
+                self.cache_dir = None
+
+    @staticmethod
+    def make_key(fingerprint, text) -> str:
+        return hashlib.sha1(f"{fingerprint}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, key) -> bytes | None:
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pcm
+        pcm = self._read_disk(key)
+        with self._lock:
+            if pcm is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._put_memory_locked(key, pcm)
+        return pcm
+
+    def put(self, key, pcm, persist=False):
+        """Adds an entry; with persist (or persist_all) it is also queued for writing to disk."""
+        if not pcm:
+            return
+        with self._lock:
+            self._put_memory_locked(key, pcm)
+            if not (self.cache_dir and (persist or self.persist_all)) or key in self._disk_files:
+                return
+            if self._write_queue is None:
+                self._write_queue = queue.Queue()
+                threading.Thread(target=self._write_loop, name="tts-cache-writer", daemon=True).start()
+        self._write_queue.put((key, pcm))
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries or key in self._disk_files
+
+    def is_persisted(self, key) -> bool:
+        """Whether the entry survives a restart (without a cache directory: whether it is cached at all)."""
+        with self._lock:
+            return key in self._disk_files if self.cache_dir else key in self._entries
+
+    def flush(self):
+        """Waits until queued disk writes are done."""
+        if self._write_queue is not None:
+            self._write_queue.join()
+
+    def clear(self):
+        """Empties the memory tier and deletes the disk entries."""
+        self.flush()
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+            keys = list(self._disk_files)
+            self._disk_files.clear()
+            self._disk_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                    "entries": len(self._entries), "memory_mb": self._memory_bytes / (1024 * 1024),
+                    "disk_entries": len(self._disk_files), "disk_mb": self._disk_bytes / (1024 * 1024)}
+
+    def _put_memory_locked(self, key, pcm):
+        if len(pcm) > self.memory_budget_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._entries[key] = pcm
+        self._memory_bytes += len(pcm)
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pcm")
+
+    def _index_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pcm"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name[:-len(".pcm")]))
+        for _, size, key in sorted(files):
+            self._disk_files[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key) -> bytes | None:
+        with self._lock:
+            if not self.cache_dir or key not in self._disk_files:
+                return None
+            self._disk_files.move_to_end(key)
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                pcm = f.read()
+            os.utime(path) # Access order for the index built at the next start
+            return pcm
+        except OSError:
+            return None
+
+    def _write_loop(self):
+        while True:
+            key, pcm = self._write_queue.get()
+            try:
+                self._write_disk(key, pcm)
+            finally:
+                self._write_queue.task_done()
+
+    def _write_disk(self, key, pcm):
+        if len(pcm) > self.disk_budget_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp_path, path) # Readers never see a partial file
+        except OSError as e:
+            print(f"TTSCache: Could not write {path}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(pcm) - self._disk_files.pop(key, 0)
+            self._disk_files[key] = len(pcm)
+            evicted = []
+            while self._disk_bytes > self.disk_budget_bytes:
+                old_key, size = self._disk_files.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+# Shared instance used by TTSModule
+pcm_cache = PCMCache() if config.TTS_CACHE_ENABLED else None
@@ -1,27 +1,133 @@
 import os
+import shutil
 import subprocess
+import time
 import wave
 from . import config
+from .model_registry import registry
+from .tts_cache import PCMCache, pcm_cache, voice_fingerprint
 
 class TTSModule:
-    def __init__(self, language=config.DEFAULT_LANGUAGE):
+    """
+    Piper text-to-speech with two backends:
+    - "inprocess": a PiperVoice (piper-tts package) loaded once per voice and kept in the
+      model registry, so its ONNX session is reused across calls.
+    - "subprocess": the piper executable, started per utterance. Also used as the
+      fallback when the piper-tts package or the voice cannot be loaded.
+
+    Synthesized PCM is looked up in and added to a PCMCache (shared by default),
+    so repeated phrases skip Piper entirely.
+    """
+    def __init__(self, language=config.DEFAULT_LANGUAGE, backend=config.TTS_BACKEND, cache=pcm_cache):
         self.language = language
+        self.backend = backend
+        self.cache = cache
         self.model_path, self.config_path = self._get_model_paths()
+        self.voice = None # Parsed voice config (sample rate etc.)
+        self.piper_voice = None # In-process PiperVoice, if that backend is active
+        self._acquire_voice()
         self._check_piper_executable()
 
-    def _check_piper_executable(self):
-        # This assumes piper executable is in PATH or a known location.
-        # For a real deployment, you might need to bundle it or ensure it's installed.
+    def _acquire_voice(self):
+        """Takes the current language's voice from the shared model registry (no disk I/O if preloaded)."""
         try:
-            subprocess.run(["piper", "--version"], capture_output=True, check=True)
+            self.voice = registry.acquire("piper", self.model_path)
+        except Exception as e:
+            print(f"TTSModule: Could not load Piper voice {self.model_path}: {e}")
+            self.voice = None
+        self.fingerprint = voice_fingerprint(self.model_path, self.voice["config"] if self.voice else None)
+        self.piper_voice = None
+        if self.backend == "inprocess":
+            try:
+                self.piper_voice = registry.acquire("piper_voice", self.model_path)
+            except Exception as e:
+                print(f"TTSModule: In-process Piper voice unavailable ({e}); using the piper executable.")
+
+    def _check_piper_executable(self):
+        # The executable is only required when the in-process backend is not available.
+        # shutil.which avoids starting a piper process just to probe for it.
+        self.piper_executable = shutil.which("piper")
+        if self.piper_executable:
             print("TTSModule: Piper executable found.")
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        elif self.piper_voice is not None:
+            print("TTSModule: Using in-process Piper voice (no piper executable found for fallback).")
+        else:
             print("Error: Piper executable not found or not working.")
-            print("Please ensure Piper is installed and in your system PATH.")
+            print("Please ensure Piper is installed and in your system PATH, or install the piper-tts package.")
             print("Download from: https://github.com/rhasspy/piper/releases")
             # Potentially, we could try to download/install it here if permissions allow.
             raise EnvironmentError("Piper TTS executable not found. Please install it.")
 
+    @property
+    def sample_rate(self) -> int:
+        """Output sample rate of the current voice (16-bit mono PCM), from its .onnx.json config."""
+        loaded_config = getattr(self.piper_voice, "config", None)
+        if getattr(loaded_config, "sample_rate", None):
+            return int(loaded_config.sample_rate)
+        if self.voice and self.voice.get("config"):
+            return int(self.voice["config"].get("audio", {}).get("sample_rate", 22050))
+        return 22050
+
+    @property
+    def audio_format(self) -> dict:
+        """Format of the PCM returned by speak_to_raw_audio(), as keyword arguments for AudioOutput.play_audio_data()."""
+        return {"sample_rate": self.sample_rate, "channels": 1, "sample_width": 2}
+
+    def synthesize(self, text: str) -> tuple[bytes, dict] | None:
+        """
+        Synthesizes speech in memory (no files) for direct playback.
+
+        Returns:
+            (pcm, audio_format), or None if synthesis failed.
+        """
+        audio_format = self.audio_format # Taken first so a concurrent language switch cannot mismatch it
+        raw_audio = self.speak_to_raw_audio(text)
+        return (raw_audio, audio_format) if raw_audio else None
+
+    def _iter_inprocess_audio(self, text):
+        """Yields raw 16-bit mono PCM blocks (roughly one per sentence) from the in-process voice."""
+        if hasattr(self.piper_voice, "synthesize_stream_raw"): # piper-tts 1.2
+            yield from self.piper_voice.synthesize_stream_raw(text)
+        else: # piper-tts >= 1.3 yields AudioChunk objects
+            for chunk in self.piper_voice.synthesize(text):
+                yield chunk.audio_int16_bytes
+
+    def _synthesize_inprocess(self, text) -> bytes | None:
+        try:
+            return b"".join(self._iter_inprocess_audio(text))
+        except Exception as e:
+            print(f"TTSModule: In-process synthesis failed: {e}")
+            return None
+
+    def _cache_key(self, text):
+        return PCMCache.make_key(self.fingerprint, text) if self.cache is not None else None
+
+    def prewarm(self, phrases) -> int:
+        """
+        Synthesizes phrases that are not persisted yet for the current voice and keeps them
+        in the disk cache. Returns how many were synthesized (or taken from memory).
+        """
+        if self.cache is None:
+            return 0
+        synthesized = 0
+        for phrase in phrases:
+            cache_key = self._cache_key(phrase)
+            if self.cache.is_persisted(cache_key):
+                continue
+            raw_audio = self.speak_to_raw_audio(phrase)
+            if raw_audio:
+                self.cache.put(cache_key, raw_audio, persist=True) # Known phrases are kept across restarts
+                synthesized += 1
+        return synthesized
+
+    def close(self):
+        """Releases this module's voices back to the model registry."""
+        if self.voice is not None:
+            registry.release("piper", self.model_path)
+        if self.piper_voice is not None:
+            registry.release("piper_voice", self.model_path)
+        self.voice = self.piper_voice = None
+
     def _get_model_paths(self):
         if self.language == "en":
             model = config.PIPER_MODEL_PATH_EN
@@ -55,7 +161,15 @@ class TTSModule:
         if self.language != language_code:
             print(f"TTSModule: Changing language from {self.language} to {language_code}")
             self.language = language_code
+            previous_path = self.model_path
             self.model_path, self.config_path = self._get_model_paths()
+            old_voice, old_piper_voice = self.voice, self.piper_voice
+            self._acquire_voice()
+            # Release the old language only after the new one is held, so a shared voice is never unloaded.
+            if old_voice is not None:
+                registry.release("piper", previous_path)
+            if old_piper_voice is not None:
+                registry.release("piper_voice", previous_path)
 
     def speak(self, text: str, output_file_path: str = "output.wav") -> bool:
         """
@@ -71,6 +185,25 @@ class TTSModule:
         if not self.model_path or not self.config_path:
             print("TTS Error: Model or config path not set.")
             return False
+
+        cache_key = self._cache_key(text)
+        raw_audio = self.cache.get(cache_key) if cache_key else None
+        if raw_audio is None and self.piper_voice is not None:
+            print(f"TTSModule: Synthesizing '{text}' to {output_file_path} in-process")
+            raw_audio = self._synthesize_inprocess(text)
+            if raw_audio and cache_key:
+                self.cache.put(cache_key, raw_audio)
+        if raw_audio is not None:
+            with wave.open(output_file_path, "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.sample_rate)
+                wf.writeframes(raw_audio)
+            print(f"TTSModule: Speech successfully synthesized to {output_file_path}")
+            return True
+        if self.piper_voice is not None and not self.piper_executable:
+            return False
+        # Otherwise fall back to the executable below
         
         # Check if model files actually exist before calling piper
         # Piper can auto-download models if they are specified by name (e.g., en_US-lessac-medium)
@@ -91,15 +224,14 @@ class TTSModule:
         #    command.extend(["--speaker", "0"]) 
 
         try:
-            print(f"TTSModule: Synthesizing 	hemed_text_is_not_recognized_by_the_user_facing_tool} to {output_file_path} using model {self.model_path}")
+            print(f"TTSModule: Synthesizing '{text}' to {output_file_path} using model {self.model_path}")
             process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             stdout, stderr = process.communicate(input=text.encode("utf-8"))
 
             if process.returncode != 0:
-                print(f"Error during Piper TTS synthesis: {stderr.decode(\'utf-8\', errors=\'ignore
-of_the_text_is_not_recognized_by_the_user_facing_tool)}")
-                if "Failed to load model" in stderr.decode(\'utf-8\', errors=\'ignore\'):
-                    print(f"Please ensure the model file 	hemed_text_is_not_recognized_by_the_user_facing_tool} and its .json config are correctly placed or downloadable by Piper.")
+                print(f"Error during Piper TTS synthesis: {stderr.decode('utf-8', errors='ignore')}")
+                if "Failed to load model" in stderr.decode('utf-8', errors='ignore'):
+                    print(f"Please ensure the model file {self.model_path} and its .json config are correctly placed or downloadable by Piper.")
                 return False
             
             print(f"TTSModule: Speech successfully synthesized to {output_file_path}")
@@ -126,6 +258,22 @@ of_the_text_is_not_recognized_by_the_user_facing_tool)}")
             print("TTS Error: Model path not set.")
             return None
 
+        cache_key = self._cache_key(text)
+        if cache_key:
+            raw_audio = self.cache.get(cache_key)
+            if raw_audio is not None:
+                return raw_audio
+        raw_audio = self._synthesize_raw(text)
+        if raw_audio and cache_key:
+            self.cache.put(cache_key, raw_audio)
+        return raw_audio
+
+    def _synthesize_raw(self, text: str) -> bytes | None:
+        if self.piper_voice is not None:
+            raw_audio = self._synthesize_inprocess(text)
+            if raw_audio is not None or not self.piper_executable:
+                return raw_audio
+
         command = [
             "piper",
             "--model", self.model_path,
@@ -133,12 +281,12 @@ of_the_text_is_not_recognized_by_the_user_facing_tool)}")
         ]
 
         try:
-            print(f"TTSModule: Synthesizing 	hemed_text_is_not_recognized_by_the_user_facing_tool} to raw audio using model {self.model_path}")
+            print(f"TTSModule: Synthesizing '{text}' to raw audio using model {self.model_path}")
             process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             raw_audio, stderr = process.communicate(input=text.encode("utf-8"))
 
             if process.returncode != 0:
-                print(f"Error during Piper TTS raw synthesis: {stderr.decode(\'utf-8\', errors=\'ignore\')}")
+                print(f"Error during Piper TTS raw synthesis: {stderr.decode('utf-8', errors='ignore')}")
                 return None
             
             print(f"TTSModule: Speech successfully synthesized to raw audio data (length: {len(raw_audio)} bytes).")
@@ -150,7 +298,47 @@ of_the_text_is_not_recognized_by_the_user_facing_tool)}")
             print(f"An unexpected error occurred during TTS raw audio synthesis: {e}")
             return None
 
+def benchmark_time_to_first_sample(tts: TTSModule, text="Hello! How can I help you today?", runs=5) -> dict:
+    """
+    Time from request to the first PCM bytes, per call, for each available backend.
+    The subprocess figure includes process start-up and loading the ONNX voice.
+    """
+    timings = {}
+    if tts.piper_voice is not None:
+        timings["inprocess"] = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            stream = tts._iter_inprocess_audio(text)
+            next(stream)
+            timings["inprocess"].append(time.perf_counter() - start)
+            stream.close()
+    if tts.piper_executable:
+        timings["subprocess"] = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            process = subprocess.Popen([tts.piper_executable, "--model", tts.model_path, "--output-raw"],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            process.stdin.write(text.encode("utf-8"))
+            process.stdin.close()
+            process.stdout.read(2)
+            timings["subprocess"].append(time.perf_counter() - start)
+            process.stdout.read()
+            process.wait()
+    for backend, values in timings.items():
+        values.sort()
+        print(f"  {backend:10s} time to first sample: median {values[len(values) // 2] * 1000:7.1f} ms, "
+              f"min {values[0] * 1000:7.1f} ms, max {values[-1] * 1000:7.1f} ms ({runs} runs)")
+    return timings
+
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        # python -m src.tts_module --bench [en|zh]
+        tts_bench = TTSModule(language=sys.argv[2] if len(sys.argv) > 2 else config.DEFAULT_LANGUAGE)
+        print(f"Benchmarking Piper backends for {tts_bench.model_path}")
+        benchmark_time_to_first_sample(tts_bench)
+        sys.exit(0)
+
     print("Testing TTSModule...")
     # This test requires Piper to be installed and models downloaded/configured.
     # Ensure piper executable is in PATH.
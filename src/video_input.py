@@ -25,12 +25,13 @@ class VideoInput:
                 ret, frame = self.cap.read()
                 last_frame_time = time.time()
                 if ret:
+                    item = (frame, last_frame_time) # Capture timestamp travels with the frame
                     if not self.frame_queue.full():
-                        self.frame_queue.put(frame, block=False) # Non-blocking put
+                        self.frame_queue.put(item, block=False) # Non-blocking put
                     else:
                         try:
                             self.frame_queue.get_nowait() # Discard oldest frame if full
-                            self.frame_queue.put(frame, block=False)
+                            self.frame_queue.put(item, block=False)
                         except queue.Empty:
                             pass # Should not happen if full was true
                 else:
@@ -103,10 +104,27 @@ class VideoInput:
             # print("VideoInput is not running. Cannot get frame.")
             return None
         try:
-            return self.frame_queue.get(timeout=timeout)
+            return self.frame_queue.get(timeout=timeout)[0]
         except queue.Empty:
             return None
 
+    def get_latest_frame(self, timeout=0.1):
+        """
+        Newest frame and its capture time (time.time()), discarding older queued frames.
+        Returns (None, None) if timeout or not running.
+        """
+        if not self.running:
+            return None, None
+        try:
+            item = self.frame_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+        while True:
+            try:
+                item = self.frame_queue.get_nowait()
+            except queue.Empty:
+                return item
+
     def __del__(self):
         self.stop_capture() # Ensure resources are released
 
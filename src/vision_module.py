@@ -1,12 +1,431 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+import os
+import threading
+import tracemalloc
+import types
+from collections import Counter
 from . import config # Assuming config.py exists for potential configurations
 from .video_input import VideoInput # Assuming video_input.py is in the same directory
 import time
 
+class DetectionBatch:
+    """
+    Detections of one frame as arrays: boxes (N x 4 int32 pixel xmin, ymin, width,
+    height), scores (N float32) and label_ids (N int32, -1 if unknown). label_names
+    maps ids to category names and is shared between batches; ids without a name
+    read as "ID:<id>". No per-object dicts are built unless to_dicts() is called.
+    Batches from an ObjectTracker also carry track_ids (N int32), stable across frames.
+    """
+    __slots__ = ("boxes", "scores", "label_ids", "label_names", "frame_shape", "track_ids")
+
+    def __init__(self, boxes, scores, label_ids, label_names, frame_shape, track_ids=None):
+        self.boxes = boxes
+        self.scores = scores
+        self.label_ids = label_ids
+        self.label_names = label_names
+        self.frame_shape = frame_shape[:2]
+        self.track_ids = track_ids
+
+    @classmethod
+    def empty(cls, frame_shape, label_names=None):
+        return cls(np.zeros((0, 4), np.int32), np.zeros(0, np.float32), np.zeros(0, np.int32),
+                   {} if label_names is None else label_names, frame_shape)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def label(self, i) -> str:
+        label_id = int(self.label_ids[i])
+        if label_id < 0:
+            return "UnknownObject"
+        return self.label_names.get(label_id) or f"ID:{label_id}"
+
+    def label_scores(self) -> list[tuple[str, float]]:
+        return [(self.label(i), float(score)) for i, score in enumerate(self.scores)]
+
+    def to_dicts(self) -> list[dict]:
+        """The detections in the list-of-dicts format of detect_objects()."""
+        h, w = self.frame_shape
+        objects = []
+        for i, (xmin, ymin, width, height) in enumerate(self.boxes.tolist()):
+            objects.append({
+                "label": self.label(i),
+                "score": float(self.scores[i]),
+                "box_normalized": {"xmin": xmin / w, "ymin": ymin / h, "width": width / w, "height": height / h},
+                "box_pixels": {"xmin": xmin, "ymin": ymin, "width": width, "height": height}
+            })
+            if self.track_ids is not None:
+                objects[-1]["track_id"] = int(self.track_ids[i])
+        return objects
+
+class SceneChangeGate:
+    """
+    Skips detector runs on an unchanged scene. Each frame is reduced to a small grayscale
+    thumbnail and compared with the thumbnail of the last frame that was actually
+    detected: when at most a threshold fraction of its cells changed by more than
+    pixel_delta grey levels, that frame's detections are reused. Averaging over a cell
+    hides sensor noise, while counting cells still catches a small object moving.
+    Comparing against the last detected frame rather than the previous one lets slow
+    changes add up. Detections older than max_age_s are always refreshed.
+    """
+    def __init__(self, threshold=config.VISION_CHANGE_THRESHOLD, pixel_delta=config.VISION_CHANGE_PIXEL_DELTA,
+                 max_age_s=config.VISION_CHANGE_MAX_AGE_S, size=(32, 24)):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_age_s = max_age_s
+        self.size = size
+        self._lock = threading.Lock()
+        self._reference = None # (thumbnail, detections, detection time)
+        self.frames = 0
+        self.skipped = 0
+        self.gate_s = 0.0 # Spent computing and comparing thumbnails
+        self.detect_s = 0.0 # Spent in the detector on frames that were not skipped
+
+    def signature(self, frame: np.ndarray) -> np.ndarray:
+        start = time.perf_counter()
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        with self._lock:
+            self.gate_s += time.perf_counter() - start
+        return thumbnail
+
+    def lookup(self, thumbnail: np.ndarray, now=None) -> "DetectionBatch | None":
+        """The reusable detections for a frame with this thumbnail, or None if it needs detecting."""
+        now = time.monotonic() if now is None else now
+        start = time.perf_counter()
+        with self._lock:
+            self.frames += 1
+            reference = self._reference
+            if (reference is None or now - reference[2] > self.max_age_s or
+                    reference[0].shape != thumbnail.shape or
+                    np.count_nonzero(cv2.absdiff(reference[0], thumbnail) > self.pixel_delta) >
+                    self.threshold * thumbnail.size):
+                self.gate_s += time.perf_counter() - start
+                return None
+            self.skipped += 1
+            self.gate_s += time.perf_counter() - start
+        return reference[1]
+
+    def store(self, thumbnail: np.ndarray, detections: "DetectionBatch", detect_s=0.0, now=None):
+        with self._lock:
+            self._reference = (thumbnail, detections, time.monotonic() if now is None else now)
+            self.detect_s += detect_s
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            detected = self.frames - self.skipped
+            mean_detect_s = self.detect_s / detected if detected else 0.0
+            return {"frames": self.frames, "skipped": self.skipped,
+                    "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+                    "gate_ms_per_frame": self.gate_s / self.frames * 1000 if self.frames else 0.0,
+                    "detector_s_saved": self.skipped * mean_detect_s - self.gate_s}
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of N and M boxes given as (xmin, ymin, width, height) rows: an N x M array."""
+    a, b = a.astype(np.float32), b.astype(np.float32)
+    inter_w = np.clip(np.minimum((a[:, 0] + a[:, 2])[:, None], b[:, 0] + b[:, 2]) -
+                      np.maximum(a[:, 0][:, None], b[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum((a[:, 1] + a[:, 3])[:, None], b[:, 1] + b[:, 3]) -
+                      np.maximum(a[:, 1][:, None], b[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1.0)
+
+class ObjectTracker:
+    """
+    Detect-every-N tracking for continuous vision. The detector runs on every
+    detect_every-th frame; in between, each track's box is moved by the median optical
+    flow (pyramidal Lucas-Kanade on a downscaled grayscale frame) of a 3x3 grid of
+    points inside it. A track's confidence is multiplied by the fraction of its points
+    that tracked well (forward-backward check), and the detector runs early once any
+    track drops below refresh_confidence, or when the last detection is more than
+    max_age_s old (frames far apart, e.g. one per voice command, are not tracked).
+
+    Detections are matched to tracks of the same label by IoU, or, for fast movers with
+    no overlap, by centroid distance under half the track's diagonal, so an object keeps
+    its track id for as long as it stays in view. Tracks missed by more than max_misses
+    detections in a row are dropped.
+    """
+    def __init__(self, detect_every=config.VISION_DETECT_EVERY_N,
+                 refresh_confidence=config.VISION_TRACK_REFRESH_CONFIDENCE,
+                 iou_threshold=config.VISION_TRACK_IOU_THRESHOLD, max_misses=config.VISION_TRACK_MAX_MISSES,
+                 max_age_s=config.VISION_TRACK_MAX_AGE_S, flow_scale=0.5):
+        self.detect_every = max(1, detect_every)
+        self.refresh_confidence = refresh_confidence
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.max_age_s = max_age_s
+        self.flow_scale = flow_scale
+        self.reset()
+
+    def reset(self):
+        """Forgets all tracks and counters."""
+        # Track state as parallel arrays
+        self.boxes = np.zeros((0, 4), np.float32)
+        self.scores = np.zeros(0, np.float32)
+        self.label_ids = np.zeros(0, np.int32)
+        self.track_ids = np.zeros(0, np.int32)
+        self.misses = np.zeros(0, np.int32)
+        self.first_seen = {} # track id -> time.monotonic() of its first detection
+        self.label_names = {}
+        self._next_id = 1
+        self._prev_gray = None
+        self._since_detect = 0
+        self._last_detection_time = None
+        self.frames = 0
+        self.detector_calls = 0
+
+    def update(self, frame: np.ndarray, detect, now=None) -> DetectionBatch:
+        """
+        Tracks for this frame (those currently in view) as a DetectionBatch with track_ids.
+        detect(frame) -> DetectionBatch is only called when a detection is due.
+        """
+        now = time.monotonic() if now is None else now
+        small = cv2.resize(frame, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        self.frames += 1
+        need_detection = (self._prev_gray is None or self._since_detect + 1 >= self.detect_every or
+                          now - self._last_detection_time > self.max_age_s)
+        if not need_detection and len(self.scores):
+            self._propagate(gray, frame.shape)
+            need_detection = bool((self.scores[self.misses == 0] < self.refresh_confidence).any())
+        if need_detection:
+            detections = detect(frame)
+            self.label_names = detections.label_names
+            self._associate(detections, now)
+            self.detector_calls += 1
+            self._since_detect = 0
+            self._last_detection_time = now
+        else:
+            self._since_detect += 1
+        self._prev_gray = gray
+        visible = self.misses == 0
+        return DetectionBatch(self.boxes[visible].astype(np.int32), self.scores[visible].copy(),
+                              self.label_ids[visible].copy(), self.label_names, frame.shape,
+                              self.track_ids[visible].copy())
+
+    def seen_for(self, detections: DetectionBatch, now=None) -> list[float]:
+        """Seconds each tracked object in detections has been in view."""
+        now = time.monotonic() if now is None else now
+        return [now - self.first_seen.get(int(track_id), now) for track_id in detections.track_ids]
+
+    def _propagate(self, gray, frame_shape):
+        grid = np.array([0.25, 0.5, 0.75], np.float32)
+        scale = self.flow_scale
+        xs = (self.boxes[:, 0:1] + self.boxes[:, 2:3] * grid) * scale # N x 3
+        ys = (self.boxes[:, 1:2] + self.boxes[:, 3:4] * grid) * scale
+        points = np.stack([np.repeat(xs, 3, axis=1), np.tile(ys, 3)], axis=2).reshape(-1, 1, 2).astype(np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, moved, None)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & \
+               (np.linalg.norm((back - points).reshape(-1, 2), axis=1) < 1.0)
+        good = good.reshape(-1, 9)
+        shift = (moved - points).reshape(-1, 9, 2) / scale
+        h, w = frame_shape[:2]
+        for i in range(len(self.boxes)):
+            tracked = good[i].sum()
+            if tracked >= 3:
+                dx, dy = np.median(shift[i][good[i]], axis=0)
+                self.boxes[i, 0] = np.clip(self.boxes[i, 0] + dx, 0, w - 1)
+                self.boxes[i, 1] = np.clip(self.boxes[i, 1] + dy, 0, h - 1)
+            self.scores[i] *= tracked / 9
+
+    def _associate(self, detections: DetectionBatch, now):
+        count = len(detections)
+        matched_det = np.zeros(count, bool)
+        matched_track = np.zeros(len(self.boxes), bool)
+        if count and len(self.boxes):
+            det_boxes = detections.boxes.astype(np.float32)
+            affinity = box_iou(self.boxes, det_boxes)
+            track_centers = self.boxes[:, :2] + self.boxes[:, 2:] / 2
+            det_centers = det_boxes[:, :2] + det_boxes[:, 2:] / 2
+            distance = np.linalg.norm(track_centers[:, None] - det_centers[None], axis=2)
+            near = distance < np.linalg.norm(self.boxes[:, 2:], axis=1)[:, None] / 2
+            affinity = np.where((affinity < self.iou_threshold) & near, self.iou_threshold, affinity)
+            affinity[self.label_ids[:, None] != detections.label_ids[None]] = 0
+            for flat in np.argsort(affinity, axis=None)[::-1]: # Greedy, best pairs first
+                t, d = divmod(int(flat), count)
+                if affinity[t, d] < self.iou_threshold:
+                    break
+                if matched_track[t] or matched_det[d]:
+                    continue
+                matched_track[t] = matched_det[d] = True
+                self.boxes[t] = det_boxes[d]
+                self.scores[t] = detections.scores[d]
+                self.misses[t] = 0
+        self.misses[~matched_track] += 1
+        keep = self.misses <= self.max_misses
+        for track_id in self.track_ids[~keep]:
+            self.first_seen.pop(int(track_id), None)
+        new = ~matched_det
+        new_ids = np.arange(self._next_id, self._next_id + new.sum(), dtype=np.int32)
+        self._next_id += len(new_ids)
+        for track_id in new_ids:
+            self.first_seen[int(track_id)] = now
+        self.boxes = np.concatenate([self.boxes[keep], detections.boxes[new].astype(np.float32)])
+        self.scores = np.concatenate([self.scores[keep], detections.scores[new]])
+        self.label_ids = np.concatenate([self.label_ids[keep], detections.label_ids[new]])
+        self.track_ids = np.concatenate([self.track_ids[keep], new_ids])
+        self.misses = np.concatenate([self.misses[keep], np.zeros(len(new_ids), np.int32)])
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "detector_calls": self.detector_calls,
+                "detect_ratio": self.detector_calls / self.frames if self.frames else 0.0,
+                "tracks_created": self._next_id - 1, "tracks_active": int((self.misses == 0).sum())}
+
+def _label_scores(objects) -> list[tuple[str, float]]:
+    if isinstance(objects, DetectionBatch):
+        return objects.label_scores()
+    return [(obj["label"], obj["score"]) for obj in objects]
+
+def _task_batch(result, shape, label_names) -> DetectionBatch:
+    """DetectionBatch of a mediapipe.tasks ObjectDetectorResult (pixel boxes); records category names in label_names."""
+    detections = result.detections
+    if not detections:
+        return DetectionBatch.empty(shape, label_names)
+    boxes = np.empty((len(detections), 4), np.int32)
+    scores = np.empty(len(detections), np.float32)
+    label_ids = np.empty(len(detections), np.int32)
+    for i, detection in enumerate(detections):
+        category, box = detection.categories[0], detection.bounding_box
+        boxes[i] = (box.origin_x, box.origin_y, box.width, box.height)
+        scores[i] = category.score
+        label_ids[i] = category.index
+        if category.category_name and category.index not in label_names:
+            label_names[category.index] = category.category_name
+    return DetectionBatch(boxes, scores, label_ids, label_names, shape)
+
+def annotate_frame(frame: np.ndarray, objects, copy=True) -> np.ndarray:
+    """The frame (a copy unless copy=False) with a labelled box drawn around each detection."""
+    annotated_frame = frame.copy() if copy else frame
+    if isinstance(objects, DetectionBatch):
+        boxes = objects.boxes.tolist()
+        captions = [f"{label}: {score:.2f}" for label, score in objects.label_scores()]
+    else:
+        boxes = [[o["box_pixels"][k] for k in ("xmin", "ymin", "width", "height")] for o in objects]
+        captions = [f"{o['label']}: {o['score']:.2f}" for o in objects]
+    for (xmin, ymin, width, height), caption in zip(boxes, captions):
+        cv2.rectangle(annotated_frame, (xmin, ymin), (xmin + width, ymin + height), (0, 255, 0), 2)
+        cv2.putText(annotated_frame, caption, (xmin, ymin - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    return annotated_frame
+
+def _describe_duration(seconds) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} seconds"
+    minutes = round(seconds / 60)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+def describe_objects(objects, seen_for=None) -> str:
+    """
+    Textual description of detected objects (a DetectionBatch or detect_objects() dicts) for
+    an LLM prompt. seen_for optionally gives, per object, how many seconds the same tracked
+    object has been in view; times under 10 s are left out.
+    """
+    if not objects:
+        return "No distinct objects were detected in the current view."
+
+    description = "In the current view, the following objects are detected: "
+    object_descriptions = []
+    for i, (label, score) in enumerate(_label_scores(objects)):
+        if seen_for is not None and seen_for[i] >= 10:
+            object_descriptions.append(f"a {label} (confidence: {score:.2f}, in view for "
+                                       f"{_describe_duration(seen_for[i])})")
+        else:
+            object_descriptions.append(f"a {label} (confidence: {score:.2f})")
+
+    if len(object_descriptions) > 1:
+        description += ", ".join(object_descriptions[:-1]) + " and " + object_descriptions[-1] + "."
+    else:
+        description += object_descriptions[0] + "."
+    return description
+
+def should_attach_image(objects, mode=config.LLM_IMAGE_MODE,
+                        min_confidence=config.LLM_IMAGE_ATTACH_BELOW_CONFIDENCE) -> bool:
+    """
+    Whether to send the frame itself with the prompt. In "auto" mode the detection list
+    is trusted when every object was detected confidently with a known label; the
+    image (a slower upload) is only attached when the detector found nothing, is
+    unsure, or could not name what it found.
+    """
+    if mode in ("always", "never"):
+        return mode == "always"
+    if not objects:
+        return True
+    return any(score < min_confidence or label == "UnknownObject" or label.startswith("ID:")
+               for label, score in _label_scores(objects))
+
+def encode_frame_jpeg(frame: np.ndarray, max_side=config.LLM_IMAGE_MAX_SIDE, max_bytes=config.LLM_IMAGE_MAX_BYTES,
+                      quality=config.LLM_IMAGE_JPEG_QUALITY, min_quality=config.LLM_IMAGE_MIN_QUALITY) -> tuple[bytes, dict] | None:
+    """
+    JPEG-encodes a BGR frame in memory within a resolution and byte budget.
+
+    The frame is downscaled (INTER_AREA) so its longer side is at most max_side.
+    If the JPEG is larger than max_bytes, quality is lowered in steps down to
+    min_quality, then the resolution is reduced by a quarter and the search repeats.
+    Returns (jpeg bytes, info) with the final size, quality and encode time, or None.
+    """
+    if frame is None:
+        return None
+    start = time.perf_counter()
+    height, width = frame.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    while True:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = frame if scale == 1.0 else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        for q in range(quality, min_quality - 1, -10):
+            ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, q])
+            if not ok:
+                return None
+            if len(encoded) <= max_bytes:
+                break
+        if len(encoded) <= max_bytes or min(size) <= 32:
+            break
+        scale *= 0.75
+    info = {"width": size[0], "height": size[1], "quality": q, "bytes": len(encoded),
+            "encode_ms": (time.perf_counter() - start) * 1000}
+    return encoded.tobytes(), info
+
 class VisionModule:
-    def __init__(self):
+    """
+    Object detection for vision commands, with two MediaPipe backends:
+
+    - "tasks": mediapipe.tasks ObjectDetector running an EfficientDet-Lite .tflite
+      model (int8 quantized by default) that reports real category names. In the
+      "live_stream" running mode frames are submitted with detect_async() and the
+      results arrive on MediaPipe's thread, so inference overlaps with capture;
+      detect_objects() still works synchronously by waiting for its result.
+    - "legacy": mp.solutions.object_detection, which only reports label ids.
+
+    The tasks backend falls back to legacy when its model file is missing.
+    """
+    def __init__(self, backend=config.VISION_BACKEND, model_path=config.VISION_MODEL_PATH,
+                 running_mode=config.VISION_RUNNING_MODE, max_results=config.VISION_MAX_RESULTS,
+                 score_threshold=config.VISION_SCORE_THRESHOLD, change_gating=config.VISION_CHANGE_GATING,
+                 tracking=config.VISION_TRACKING_ENABLED):
+        self.backend = backend
+        self.score_threshold = score_threshold
+        self.label_names = {} # Category id -> name, as reported by the tasks detector
+        self.live_stream = False
+        self.object_detector = None
+        self.scene_gate = SceneChangeGate() if change_gating else None
+        self.tracker = ObjectTracker() if tracking else None
+        if backend == "tasks":
+            if os.path.exists(model_path):
+                self._init_tasks(model_path, running_mode, max_results)
+            else:
+                print(f"VisionModule: Detector model not found at {model_path}; using the legacy MediaPipe detector. "
+                      "See README for the EfficientDet-Lite download.")
+                self.backend = "legacy"
+        if self.backend == "legacy":
+            self._init_legacy()
+
+    def _init_legacy(self):
         self.mp_drawing = mp.solutions.drawing_utils
         self.mp_objectron = mp.solutions.objectron # For 3D object detection
         self.mp_object_detection = mp.solutions.object_detection # For 2D object detection
@@ -17,7 +436,7 @@ class VisionModule:
         # For object detection (2D), which is generally faster and good for "what is this"
         self.object_detector = self.mp_object_detection.ObjectDetection(
             model_selection=0, # 0 for general purpose model, 1 for more fine-grained
-            min_detection_confidence=0.5)
+            min_detection_confidence=self.score_threshold)
         
         # For more specific tasks, other models can be initialized as needed
         # self.hands_detector = self.mp_hands.Hands(static_image_mode=False, max_num_hands=2, min_detection_confidence=0.5)
@@ -25,9 +444,49 @@ class VisionModule:
         # self.objectron_detector = self.mp_objectron.Objectron(static_image_mode=False, max_num_objects=5, min_detection_confidence=0.5, model_name=\'Cup\') # Example: Cup
         print("VisionModule: Initialized MediaPipe Object Detection.")
 
+    def _init_tasks(self, model_path, running_mode, max_results):
+        vision = mp.tasks.vision
+        self.live_stream = running_mode == "live_stream"
+        self._pending = {} # timestamp_ms -> (frame shape, callback, submit time) awaiting a LIVE_STREAM result
+        self._pending_lock = threading.Lock()
+        self._last_timestamp_ms = 0
+        options = vision.ObjectDetectorOptions(
+            base_options=mp.tasks.BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.LIVE_STREAM if self.live_stream else vision.RunningMode.IMAGE,
+            max_results=max_results,
+            score_threshold=self.score_threshold,
+            result_callback=self._on_live_result if self.live_stream else None)
+        self.object_detector = vision.ObjectDetector.create_from_options(options)
+        print(f"VisionModule: Initialized MediaPipe Tasks ObjectDetector ({os.path.basename(model_path)}, "
+              f"{running_mode} mode).")
+
+    def detect(self, frame: np.ndarray) -> DetectionBatch:
+        """
+        Detection only: the frame's detections as a DetectionBatch, without copying or
+        drawing on the frame. Use annotate_frame() if the boxes are to be shown. With
+        scene-change gating, an unchanged scene gets the previous detections back.
+        """
+        if self.scene_gate is None:
+            return self._detect(frame)
+        thumbnail = self.scene_gate.signature(frame)
+        detections = self.scene_gate.lookup(thumbnail)
+        if detections is None:
+            start = time.perf_counter()
+            detections = self._detect(frame)
+            self.scene_gate.store(thumbnail, detections, time.perf_counter() - start)
+        return detections
+
+    def _detect(self, frame: np.ndarray) -> DetectionBatch:
+        if self.backend == "legacy":
+            return self._detect_legacy(frame)
+        if self.live_stream:
+            return self._detect_live_sync(frame)
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        return _task_batch(self.object_detector.detect(image), frame.shape, self.label_names)
+
     def detect_objects(self, frame: np.ndarray) -> tuple[np.ndarray, list[dict]]:
         """
-        Detects objects in a given frame using MediaPipe ObjectDetection.
+        Detects objects in a given frame.
 
         Args:
             frame: The input image/frame (NumPy array, BGR format from OpenCV).
@@ -40,90 +499,138 @@ class VisionModule:
         """
         if frame is None:
             return None, []
+        detections = self.detect(frame)
+        return annotate_frame(frame, detections), detections.to_dicts()
 
+    def _detect_legacy(self, frame: np.ndarray) -> DetectionBatch:
         # Convert the BGR image to RGB, and make it non-writeable for performance
         image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         image_rgb.flags.writeable = False
 
         # Process the image and find objects
         results = self.object_detector.process(image_rgb)
+        if not results.detections:
+            return DetectionBatch.empty(frame.shape, self.label_names)
 
-        # To draw the bounding boxes, make the image writeable again
-        annotated_frame = frame.copy()
-        detected_objects_info = []
-
-        if results.detections:
-            for detection in results.detections:
-                # detection.label_id gives index, detection.score gives confidence
-                # detection.location_data.relative_bounding_box gives normalized coords
-                
-                # Get the label - MediaPipe ObjectDetection provides label_id and score directly.
-                # The actual string label might need mapping if not directly provided or if using a custom model.
-                # For the default model, scores often come with a list of labels.
-                # Here, we assume `detection.label_id` can be used or we might need a label map.
-                # For simplicity, we will try to get the first label if available in `detection.label` (newer versions)
-                # or use a placeholder if only `label_id` is present.
-                
-                label = "UnknownObject"
-                if hasattr(detection, "label") and detection.label:
-                    label = detection.label[0] # Assuming label is a list of strings
-                elif hasattr(detection, "label_id") and detection.label_id:
-                    # You might need a mapping from label_id to string names for some models
-                    # For now, just use the ID as a placeholder if no direct label string
-                    label = f"ID:{detection.label_id[0] if isinstance(detection.label_id, list) else detection.label_id}"
-                
-                score = detection.score[0] if isinstance(detection.score, list) else detection.score # Confidence score
-                
-                if score < self.object_detector.min_detection_confidence:
-                    continue
+        # detection.label_id gives index, detection.label the names (if the model has a
+        # label map), detection.score gives confidence,
+        # detection.location_data.relative_bounding_box gives normalized coords.
+        count = len(results.detections)
+        boxes = np.empty((count, 4), np.float32)
+        scores = np.empty(count, np.float32)
+        label_ids = np.full(count, -1, np.int32)
+        # score, label_id and label are protobuf repeated fields (sequences, not lists)
+        for i, detection in enumerate(results.detections):
+            scores[i] = float(detection.score[0]) if len(detection.score) else 0.0
+            label_id = int(detection.label_id[0]) if len(detection.label_id) else None
+            if len(detection.label):
+                label_id = self._legacy_label_id(detection.label[0], label_id)
+            if label_id is not None:
+                label_ids[i] = label_id
+            box = detection.location_data.relative_bounding_box
+            boxes[i] = (box.xmin, box.ymin, box.width, box.height)
+        keep = scores >= self.score_threshold
+        h, w = frame.shape[:2]
+        pixel_boxes = (boxes[keep] * np.array([w, h, w, h], np.float32)).astype(np.int32)
+        return DetectionBatch(pixel_boxes, scores[keep], label_ids[keep], self.label_names, frame.shape)
 
-                # Get bounding box
-                box = detection.location_data.relative_bounding_box
-                h, w, _ = annotated_frame.shape
-                xmin = int(box.xmin * w)
-                ymin = int(box.ymin * h)
-                width = int(box.width * w)
-                height = int(box.height * h)
-                
-                cv2.rectangle(annotated_frame, (xmin, ymin), (xmin + width, ymin + height), (0, 255, 0), 2)
-                cv2.putText(annotated_frame, f"{label}: {score:.2f}", (xmin, ymin - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                
-                detected_objects_info.append({
-                    "label": label,
-                    "score": float(score),
-                    "box_normalized": {"xmin": box.xmin, "ymin": box.ymin, "width": box.width, "height": box.height},
-                    "box_pixels": {"xmin": xmin, "ymin": ymin, "width": width, "height": height}
-                })
-        
-        return annotated_frame, detected_objects_info
+    def _legacy_label_id(self, name, label_id=None) -> int:
+        """Records a legacy detection's label string in label_names; names without an id get their own."""
+        if label_id is None:
+            label_id = next((i for i, known in self.label_names.items() if known == name), None)
+            if label_id is None:
+                label_id = max(self.label_names, default=999) + 1 # Clear of the model's own ids
+        self.label_names.setdefault(label_id, name)
+        return label_id
+
+    def detect_async(self, frame: np.ndarray, on_result) -> bool:
+        """
+        LIVE_STREAM mode: submits a frame and returns immediately; on_result(detections) is
+        called on MediaPipe's thread when it has been processed. MediaPipe drops frames
+        submitted while it is still busy; their callbacks never come. With scene-change
+        gating, an unchanged scene gets the previous detections back at once, on the
+        caller's thread.
+        """
+        if not self.live_stream:
+            raise RuntimeError("detect_async() needs the tasks backend in live_stream mode")
+        if self.scene_gate is None:
+            return self._submit_async(frame, on_result)
+        thumbnail = self.scene_gate.signature(frame)
+        detections = self.scene_gate.lookup(thumbnail)
+        if detections is not None:
+            on_result(detections)
+            return True
+        submitted = time.perf_counter()
+        def store_and_deliver(detections):
+            self.scene_gate.store(thumbnail, detections, time.perf_counter() - submitted)
+            on_result(detections)
+        return self._submit_async(frame, store_and_deliver)
+
+    def _submit_async(self, frame: np.ndarray, on_result) -> bool:
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        now = time.monotonic()
+        with self._pending_lock:
+            timestamp_ms = max(int(now * 1000), self._last_timestamp_ms + 1) # Must increase strictly
+            self._last_timestamp_ms = timestamp_ms
+            for stale in [t for t, (_, _, submitted) in self._pending.items() if now - submitted > 5.0]:
+                del self._pending[stale] # Dropped frames
+            self._pending[timestamp_ms] = (frame.shape, on_result, now)
+        self.object_detector.detect_async(image, timestamp_ms)
+        return True
+
+    def describe_frame_async(self, frame: np.ndarray, on_result) -> bool:
+        """detect_async() delivering on_result(description, objects), like describe_frame()."""
+        if self.tracker is not None: # Tracking needs the frames in order, so it runs synchronously
+            on_result(*self.describe_frame(frame))
+            return True
+        return self.detect_async(frame, lambda objects: on_result(describe_objects(objects), objects))
+
+    def _on_live_result(self, result, output_image, timestamp_ms):
+        with self._pending_lock:
+            pending = self._pending.pop(timestamp_ms, None)
+        if pending is None:
+            return
+        shape, on_result, _ = pending
+        try:
+            on_result(_task_batch(result, shape, self.label_names))
+        except Exception as e:
+            print(f"VisionModule: Detection callback failed: {e}")
+
+    def _detect_live_sync(self, frame: np.ndarray, timeout=2.0) -> DetectionBatch:
+        done, box = threading.Event(), []
+        def on_result(detections):
+            box.append(detections)
+            done.set()
+        self._submit_async(frame, on_result)
+        if not done.wait(timeout): # Dropped because the detector was busy
+            print("VisionModule: No detection result (frame dropped by the busy detector).")
+            return DetectionBatch.empty(frame.shape, self.label_names)
+        return box[0]
 
     def analyze_frame_for_prompt(self, frame: np.ndarray) -> str:
         """
         Analyzes a frame to generate a textual description of detected objects for an LLM prompt.
         """
-        _, objects = self.detect_objects(frame)
-        if not objects:
-            return "No distinct objects were detected in the current view."
-        
-        description = "In the current view, the following objects are detected: "
-        object_descriptions = []
-        for obj in objects:
-            object_descriptions.append(f"a {obj["label"]} (confidence: {obj["score"]:.2f})")
-        
-        if len(object_descriptions) > 1:
-            description += ", ".join(object_descriptions[:-1]) + " and " + object_descriptions[-1] + "."
-        elif object_descriptions:
-            description += object_descriptions[0] + "."
-        else: # Should not happen if objects list was not empty
-            return "No distinct objects were detected after filtering."
-            
-        return description
+        return self.describe_frame(frame)[0]
+
+    def describe_frame(self, frame: np.ndarray) -> tuple[str, DetectionBatch]:
+        """
+        analyze_frame_for_prompt() plus the detections, e.g. to decide whether to send the
+        image itself. Detection only: the frame is neither copied nor drawn on. With
+        tracking, the detector only runs every N frames and the description says how
+        long each tracked object has been in view.
+        """
+        if self.tracker is not None:
+            detections = self.tracker.update(frame, self.detect)
+            return describe_objects(detections, self.tracker.seen_for(detections)), detections
+        detections = self.detect(frame)
+        return describe_objects(detections), detections
 
     def close(self):
         """Release MediaPipe resources."""
-        if hasattr(self, 'object_detector') and self.object_detector:
+        if getattr(self, 'object_detector', None):
             self.object_detector.close()
+            self.object_detector = None
         # Close other detectors if they were initialized
         # if hasattr(self, 'hands_detector') and self.hands_detector: self.hands_detector.close()
         # if hasattr(self, 'face_detector') and self.face_detector: self.face_detector.close()
@@ -133,7 +640,322 @@ class VisionModule:
     def __del__(self):
         self.close()
 
+def encode_benchmark(uplink_kbps=1000) -> list[dict]:
+    """
+    Encodes a synthetic 640x480 camera frame under several budgets and reports size,
+    quality, encode time and the upload time (base64 in the request body) at uplink_kbps.
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:480, 0:640]
+    frame = np.dstack([(x * 0.3 + y * 0.1) % 256, (y * 0.4) % 256, (x * 0.2 + 80) % 256]).astype(np.uint8)
+    cv2.rectangle(frame, (80, 120), (260, 400), (40, 40, 200), -1) # A "cup" and a "laptop"
+    cv2.rectangle(frame, (320, 200), (600, 380), (90, 90, 90), -1)
+    cv2.putText(frame, "notebook", (340, 160), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+    frame = np.clip(frame + rng.normal(0, 14, frame.shape), 0, 255).astype(np.uint8) # Sensor noise
+
+    results = []
+    for max_side, max_bytes in [(640, 10 ** 9), (640, 60000), (512, 60000), (384, 30000), (256, 15000)]:
+        _, info = encode_frame_jpeg(frame, max_side=max_side, max_bytes=max_bytes)
+        upload_ms = info["bytes"] * 4 / 3 * 8 / uplink_kbps
+        budget = "none" if max_bytes >= 10 ** 9 else f"{max_bytes // 1000} KB"
+        print(f"max side {max_side:3d}, budget {budget:>6}: {info['width']}x{info['height']} q{info['quality']}, "
+              f"{info['bytes'] / 1024:5.1f} KB, encode {info['encode_ms']:5.1f} ms, "
+              f"upload {upload_ms:6.0f} ms at {uplink_kbps} kbit/s")
+        results.append({**info, "upload_ms": upload_ms})
+
+    confident = [{"label": "cup", "score": 0.91}, {"label": "laptop", "score": 0.85}]
+    for name, objects in [("confident detections", confident), ("nothing detected", []),
+                          ("low confidence", confident + [{"label": "book", "score": 0.55}]),
+                          ("unnamed object", [{"label": "ID:3", "score": 0.9}])]:
+        print(f"Attach image ({name}): {should_attach_image(objects, mode='auto')}")
+    return results
+
+class _RepeatedField(tuple):
+    """Stands in for a protobuf repeated field: indexable and sized, but not a list."""
+
+class _FakeLegacyDetector:
+    """mp.solutions.object_detection stand-in returning Detection-shaped results."""
+    def __init__(self, detections):
+        self.detections = detections
+
+    def process(self, image):
+        return types.SimpleNamespace(detections=self.detections)
+
+    def close(self):
+        pass
+
+def _legacy_detection(score, box, label_id=(), label=()):
+    return types.SimpleNamespace(score=_RepeatedField(score), label_id=_RepeatedField(label_id),
+                                 label=_RepeatedField(label), location_data=types.SimpleNamespace(
+                                     relative_bounding_box=types.SimpleNamespace(xmin=box[0], ymin=box[1],
+                                                                                 width=box[2], height=box[3])))
+
+def legacy_test() -> bool:
+    """Runs the legacy detection path on detections whose score, label_id and label are repeated fields."""
+    vision = VisionModule(backend="none", change_gating=False, tracking=False) # No MediaPipe model needed
+    vision.backend = "legacy"
+    vision.object_detector = _FakeLegacyDetector([
+        _legacy_detection([0.9], (0.1, 0.1, 0.2, 0.2), label_id=[47], label=["cup"]),
+        _legacy_detection([0.8], (0.5, 0.5, 0.2, 0.3), label=["book"]),
+        _legacy_detection([0.7], (0.3, 0.6, 0.1, 0.1), label_id=[3]),
+        _legacy_detection([0.1], (0.0, 0.0, 0.1, 0.1), label_id=[5], label=["person"]), # Below the threshold
+    ])
+    vision.score_threshold = 0.5
+    frame = np.zeros((240, 320, 3), np.uint8)
+    ok = True
+    try:
+        objects = vision.detect(frame).to_dicts()
+        error = None
+    except Exception as e:
+        objects, error = [], e
+    labels = [obj["label"] for obj in objects]
+    case_ok = error is None and labels == ["cup", "book", "ID:3"]
+    print(f"Legacy detections: labels {labels}{f', error {error!r}' if error else ''} -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    again = [obj["label"] for obj in vision.detect(frame).to_dicts()]
+    case_ok = again == labels and vision.label_names.get(47) == "cup" and len(vision.label_names) == 3
+    print(f"Label map: {vision.label_names}, stable across frames -> {'OK' if case_ok else 'FAIL'}")
+    return ok and case_ok
+
+def load_recorded_frames(path, max_frames=100) -> list[np.ndarray]:
+    """Frames of a recorded video file, or the images of a directory in name order."""
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")) and len(frames) < max_frames:
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    frames.append(frame)
+        return frames
+    capture = cv2.VideoCapture(path)
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+def detector_benchmark(frames, capture_fps=15) -> dict:
+    """
+    Runs the legacy detector and the tasks detector (IMAGE and LIVE_STREAM modes) over the
+    same recorded frames. The synchronous backends report ms per frame; LIVE_STREAM is fed
+    at capture_fps, as the camera would, and reports how many frames it kept up with and the
+    submit-to-result latency. Also lists the labels each backend produced.
+    """
+    results = {}
+    for name, kwargs in [("legacy", {"backend": "legacy"}),
+                         ("tasks image", {"backend": "tasks", "running_mode": "image"}),
+                         ("tasks live_stream", {"backend": "tasks", "running_mode": "live_stream"})]:
+        vision = VisionModule(change_gating=False, **kwargs)
+        if vision.backend != kwargs["backend"]:
+            print(f"{name}: skipped (tasks model unavailable)")
+            vision.close()
+            continue
+        labels = Counter()
+        vision.detect_objects(frames[0]) # Warm-up
+        if vision.live_stream:
+            latencies, lock = [], threading.Lock()
+            def on_result(objects, submitted):
+                with lock:
+                    latencies.append(time.perf_counter() - submitted)
+                    labels.update(label for label, _ in objects.label_scores())
+            start = time.perf_counter()
+            for i, frame in enumerate(frames):
+                time.sleep(max(0.0, start + i / capture_fps - time.perf_counter()))
+                submitted = time.perf_counter()
+                vision.detect_async(frame, lambda objects, s=submitted: on_result(objects, s))
+            time.sleep(1.0) # Let the last results arrive
+            with lock:
+                processed = len(latencies)
+                mean_ms = sum(latencies) / processed * 1000 if processed else float("nan")
+            results[name] = {"processed": processed, "frames": len(frames), "latency_ms": mean_ms,
+                             "fps": processed * capture_fps / len(frames), "labels": labels}
+            print(f"{name:18}: {processed}/{len(frames)} frames at {capture_fps} fps capture, "
+                  f"{mean_ms:.1f} ms submit-to-result, {results[name]['fps']:.1f} detections/s")
+        else:
+            start = time.perf_counter()
+            for frame in frames:
+                labels.update(obj["label"] for obj in vision.detect_objects(frame)[1])
+            ms = (time.perf_counter() - start) / len(frames) * 1000
+            results[name] = {"ms_per_frame": ms, "fps": 1000 / ms, "labels": labels}
+            print(f"{name:18}: {ms:.1f} ms/frame ({1000 / ms:.1f} fps, capture blocked meanwhile)")
+        print(f"{'':18}  labels: {dict(labels.most_common(8)) or 'none'}")
+        vision.close()
+    return results
+
+def _time_and_peak(fn, rounds) -> tuple[float, int]:
+    """Mean ms per call of fn, and the peak bytes allocated by one call."""
+    fn() # Warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    ms = (time.perf_counter() - start) / rounds * 1000
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ms, peak
+
+def detection_path_benchmark(frames=None, rounds=200) -> dict:
+    """
+    Per-frame time and peak allocation of the old prompt path (annotated copy of the frame
+    plus per-object dicts, the copy then thrown away) against the detection-only path
+    (DetectionBatch straight into the description). The post-processing comparison uses a
+    synthetic 640x480 frame with five detections; with recorded frames the configured
+    detector runs too, so the inference share is visible.
+    """
+    frame = np.full((480, 640, 3), 127, np.uint8)
+    names = {0: "person", 41: "cup", 63: "laptop", 73: "book", 67: "cell phone"}
+    batch = DetectionBatch(np.array([[40, 60, 200, 300], [300, 200, 80, 90], [380, 120, 220, 160],
+                                     [100, 380, 120, 60], [520, 300, 60, 100]], np.int32),
+                           np.array([0.91, 0.84, 0.77, 0.66, 0.58], np.float32),
+                           np.array(list(names), np.int32), names, frame.shape)
+    results = {}
+    def annotated_path():
+        annotated, objects = annotate_frame(frame, batch), batch.to_dicts()
+        return describe_objects(objects)
+    for name, fn in [("annotate + dicts", annotated_path), ("detection batch", lambda: describe_objects(batch))]:
+        ms, peak = _time_and_peak(fn, rounds)
+        results[f"postprocess {name}"] = {"ms": ms, "peak_bytes": peak}
+        print(f"Post-processing, {name:16}: {ms:7.3f} ms/frame, peak {peak / 1024:7.1f} KB allocated")
+
+    if frames:
+        vision = VisionModule(change_gating=False)
+        for name, fn in [("annotate + dicts", lambda f: describe_objects(vision.detect_objects(f)[1])),
+                         ("detection batch", lambda f: vision.describe_frame(f)[0])]:
+            ms = peak = 0
+            for f in frames:
+                frame_ms, frame_peak = _time_and_peak(lambda: fn(f), 1)
+                ms, peak = ms + frame_ms, max(peak, frame_peak)
+            results[f"{vision.backend} {name}"] = {"ms": ms / len(frames), "peak_bytes": peak}
+            print(f"{vision.backend} detector, {name:16}: {ms / len(frames):7.2f} ms/frame, "
+                  f"peak {peak / 1024:7.1f} KB allocated ({len(frames)} frames)")
+        vision.close()
+    return results
+
+def synthetic_clips(count=60) -> dict:
+    """A static 640x480 scene with sensor noise, and a busy one (moving objects, changing light)."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:480, 0:640]
+    room = np.dstack([(x * 0.2 + 60) % 256, (y * 0.3 + 40) % 256, (x * 0.1 + y * 0.1) % 256]).astype(np.uint8)
+    cv2.rectangle(room, (80, 260), (220, 420), (40, 40, 200), -1)
+    static, busy = [], []
+    for i in range(count):
+        noise = rng.normal(0, 4, room.shape)
+        static.append(np.clip(room + noise, 0, 255).astype(np.uint8))
+        frame = np.clip(room * (0.8 + 0.2 * np.sin(i / 4)) + noise, 0, 255).astype(np.uint8)
+        cv2.rectangle(frame, (i * 45 % 520, 100), (i * 45 % 520 + 120, 300), (200, 160, 60), -1) # Someone walking by
+        busy.append(frame)
+    return {"static": static, "busy": busy}
+
+def gate_benchmark(clips: dict, fps=5.0) -> dict:
+    """
+    Detector CPU time on each clip with and without scene-change gating, frames taken
+    at fps (the clip's own timeline, so max_age_s refreshes happen as they would live).
+    Reports the skip ratio, gate overhead and CPU saved.
+    """
+    vision = VisionModule(change_gating=False)
+    results = {}
+    for name, frames in clips.items():
+        vision._detect(frames[0]) # Warm-up
+        start = time.process_time()
+        for frame in frames:
+            vision._detect(frame)
+        ungated_s = time.process_time() - start
+
+        gate = SceneChangeGate()
+        start = time.process_time()
+        for i, frame in enumerate(frames):
+            thumbnail = gate.signature(frame)
+            if gate.lookup(thumbnail, now=i / fps) is None:
+                detect_start = time.perf_counter()
+                detections = vision._detect(frame)
+                gate.store(thumbnail, detections, time.perf_counter() - detect_start, now=i / fps)
+        gated_s = time.process_time() - start
+        stats = gate.stats()
+        saved = 1 - gated_s / ungated_s if ungated_s else 0.0
+        results[name] = {**stats, "ungated_cpu_s": ungated_s, "gated_cpu_s": gated_s, "cpu_saved": saved}
+        print(f"{name:8}: skipped {stats['skipped']}/{stats['frames']} frames ({stats['skip_ratio']:.0%}), "
+              f"gate {stats['gate_ms_per_frame']:.2f} ms/frame, CPU {ungated_s * 1000:.0f} -> {gated_s * 1000:.0f} ms "
+              f"({saved:.0%} saved)")
+    vision.close()
+    return results
+
+def tracking_clip(count=90) -> list[np.ndarray]:
+    """Synthetic 640x480 clip: two textured objects, one still and one crossing the view at 8 px/frame."""
+    rng = np.random.default_rng(1)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8), (0, 0), 3)
+    still = rng.integers(0, 256, (90, 70, 3), dtype=np.uint8)
+    mover = cv2.GaussianBlur(rng.integers(0, 256, (120, 100, 3), dtype=np.uint8), (0, 0), 1.5)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        frame[300:390, 80:150] = still
+        x = 150 + i * 8 % 380
+        frame[120:240, x:x + 100] = mover
+        frames.append(frame)
+    return frames
+
+def track_benchmark(frames, camera_fps=15.0, every=(1, 3, 5, 10)) -> dict:
+    """
+    Effective fps (frames processed per second of processing time) and detector calls per
+    second at camera_fps, for detection on every frame and for the tracker with several N.
+    Also counts the track ids created; ideally one per object in the clip.
+    """
+    vision = VisionModule(change_gating=False)
+    vision.detect(frames[0]) # Warm-up
+    results = {}
+    for n in every:
+        tracker = ObjectTracker(detect_every=n)
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            tracker.update(frame, vision.detect, now=i / camera_fps)
+        elapsed = time.perf_counter() - start
+        stats = tracker.stats()
+        effective_fps = len(frames) / elapsed
+        calls_per_s = stats["detector_calls"] / len(frames) * min(camera_fps, effective_fps)
+        results[n] = {**stats, "effective_fps": effective_fps, "detector_calls_per_s": calls_per_s}
+        print(f"{'detect every frame' if n == 1 else f'detect every {n} frames':22}: "
+              f"{effective_fps:6.1f} fps effective, {stats['detector_calls']}/{len(frames)} detector calls "
+              f"({calls_per_s:.1f}/s at {camera_fps:g} fps camera), {stats['tracks_created']} track ids")
+    vision.close()
+    return results
+
 if __name__ == '__main__':
+    import sys
+    # python -m src.vision_module --legacy-test
+    if len(sys.argv) > 1 and sys.argv[1] == "--legacy-test":
+        sys.exit(0 if legacy_test() else 1)
+    # python -m src.vision_module --encode-bench [uplink_kbps]
+    if len(sys.argv) > 1 and sys.argv[1] == "--encode-bench":
+        encode_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+        sys.exit(0)
+    # python -m src.vision_module --detect-bench [video file | image directory]
+    if len(sys.argv) > 1 and sys.argv[1] == "--detect-bench":
+        detection_path_benchmark(load_recorded_frames(sys.argv[2], 30) if len(sys.argv) > 2 else None)
+        sys.exit(0)
+    # python -m src.vision_module --gate-bench [static clip] [busy clip]
+    if len(sys.argv) > 1 and sys.argv[1] == "--gate-bench":
+        if len(sys.argv) > 3:
+            gate_benchmark({"static": load_recorded_frames(sys.argv[2]), "busy": load_recorded_frames(sys.argv[3])})
+        else:
+            gate_benchmark(synthetic_clips())
+        sys.exit(0)
+    # python -m src.vision_module --track-bench [video file | image directory] [camera_fps]
+    if len(sys.argv) > 1 and sys.argv[1] == "--track-bench":
+        clip = load_recorded_frames(sys.argv[2], 300) if len(sys.argv) > 2 else tracking_clip()
+        track_benchmark(clip, float(sys.argv[3]) if len(sys.argv) > 3 else 15.0)
+        sys.exit(0)
+    # python -m src.vision_module --bench <video file | image directory> [max_frames]
+    if len(sys.argv) > 2 and sys.argv[1] == "--bench":
+        recorded = load_recorded_frames(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 100)
+        if not recorded:
+            print(f"No frames read from {sys.argv[2]}")
+            sys.exit(1)
+        detector_benchmark(recorded)
+        sys.exit(0)
     print("Testing VisionModule...")
     # This test requires a connected camera and OpenCV for display.
     video_input = VideoInput(camera_index=0, fps_limit=5) # Lower FPS for testing vision processing
@@ -0,0 +1,210 @@
+import threading
+import time
+from . import config
+
+class VisionSnapshot:
+    """Detections of one frame. frame_time is when the camera captured it (time.time())."""
+    __slots__ = ("frame", "objects", "description", "frame_time", "inference_ms")
+
+    def __init__(self, frame, objects, description, frame_time, inference_ms):
+        self.frame = frame
+        self.objects = objects
+        self.description = description
+        self.frame_time = frame_time
+        self.inference_ms = inference_ms
+
+    @property
+    def age_s(self) -> float:
+        return time.time() - self.frame_time
+
+class VisionWorker:
+    """
+    Always-on vision: runs detection on the newest camera frame at rate_hz on a
+    background thread and publishes the result as the latest VisionSnapshot.
+
+    A vision command then reads the snapshot instantly instead of starting the
+    camera and running inference itself. get() only returns snapshots whose frame
+    was at most max_staleness_s old when it was called; for an older one it asks
+    the worker for a new detection and waits up to wait_s for it.
+    """
+    def __init__(self, video_in, vision, rate_hz=config.VISION_WORKER_RATE_HZ,
+                 max_staleness_s=config.VISION_MAX_STALENESS_S):
+        self.video_in = video_in
+        self.vision = vision
+        self.period_s = 1.0 / rate_hz
+        self.max_staleness_s = max_staleness_s
+        self._latest = None
+        self._cond = threading.Condition()
+        self._wake = threading.Event() # Run the next detection now instead of at the next period
+        self._stop = threading.Event()
+        self._thread = None
+        self.detections = 0
+        self.inference_ms_total = 0.0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self.video_in.running:
+            self.video_in.start_capture()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vision-worker", daemon=True)
+        self._thread.start()
+        print(f"VisionWorker: Detecting at {1.0 / self.period_s:.1f} Hz.")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            frame, frame_time = self.video_in.get_latest_frame(timeout=0.5)
+            if frame is not None:
+                inference_start = time.time()
+                try:
+                    if getattr(self.vision, "live_stream", False):
+                        # Result arrives on the detector's thread; keep capturing meanwhile
+                        self.vision.describe_frame_async(frame, lambda description, objects, f=frame, t=frame_time,
+                                                         s=inference_start: self._publish(f, objects, description, t, s))
+                    else:
+                        description, objects = self.vision.describe_frame(frame)
+                        self._publish(frame, objects, description, frame_time, inference_start)
+                except Exception as e:
+                    print(f"VisionWorker: Detection failed: {e}")
+            elif not self.video_in.running:
+                print("VisionWorker: Camera stopped; worker exiting.")
+                break
+            self._wake.wait(max(0.0, self.period_s - (time.time() - started)))
+            self._wake.clear()
+
+    def _publish(self, frame, objects, description, frame_time, inference_start):
+        inference_ms = (time.time() - inference_start) * 1000
+        snapshot = VisionSnapshot(frame, objects, description, frame_time, inference_ms)
+        with self._cond:
+            if self._latest is not None and self._latest.frame_time > frame_time:
+                return # An async result overtaken by a newer frame's
+            self._latest = snapshot
+            self.detections += 1
+            self.inference_ms_total += inference_ms
+            self._cond.notify_all()
+
+    def latest(self) -> VisionSnapshot | None:
+        """The most recent snapshot, however old."""
+        with self._cond:
+            return self._latest
+
+    def get(self, max_staleness_s=None, wait_s=None) -> VisionSnapshot | None:
+        """
+        The latest snapshot if its frame is fresh enough; otherwise triggers a detection
+        and waits up to wait_s (default: one period plus a second) for a fresh one.
+        """
+        max_staleness_s = self.max_staleness_s if max_staleness_s is None else max_staleness_s
+        wait_s = self.period_s + 1.0 if wait_s is None else wait_s
+        now = time.time()
+        oldest_frame_time, deadline = now - max_staleness_s, now + wait_s
+        with self._cond:
+            while True:
+                snapshot = self._latest
+                if snapshot is not None and snapshot.frame_time >= oldest_frame_time:
+                    return snapshot
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.running:
+                    return None
+                self._wake.set()
+                self._cond.wait(remaining)
+
+    def stats(self) -> dict:
+        with self._cond:
+            latest = self._latest
+            return {"detections": self.detections,
+                    "mean_inference_ms": self.inference_ms_total / self.detections if self.detections else None,
+                    "latest_age_s": latest.age_s if latest else None}
+
+class _FakeCamera:
+    """VideoInput stand-in: a new frame every 1/fps seconds, after start_delay_s of camera start-up."""
+    def __init__(self, fps=5, start_delay_s=1.0):
+        self.fps = fps
+        self.start_delay_s = start_delay_s
+        self.running = False
+        self._started_at = None
+
+    def start_capture(self):
+        time.sleep(self.start_delay_s)
+        self.running = True
+        self._started_at = time.time()
+
+    def get_latest_frame(self, timeout=0.1):
+        if not self.running:
+            return None, None
+        index = int((time.time() - self._started_at) * self.fps)
+        return f"frame {index}", self._started_at + index / self.fps
+
+    def get_frame(self, timeout=0.1):
+        return self.get_latest_frame(timeout)[0]
+
+class _FakeDetector:
+    def __init__(self, inference_s=0.15):
+        self.inference_s = inference_s
+
+    def describe_frame(self, frame):
+        time.sleep(self.inference_s)
+        return f"objects in {frame}", [{"label": "cup", "score": 0.9}]
+
+def worker_test() -> bool:
+    """Compares the synchronous vision path with reading the worker's snapshot, and checks staleness handling."""
+    ok = True
+    camera, detector = _FakeCamera(), _FakeDetector()
+    start = time.time()
+    camera.start_capture() # What process_command did per vision command when the camera was off
+    detector.describe_frame(camera.get_frame())
+    sync_s = time.time() - start
+
+    worker = VisionWorker(_FakeCamera(start_delay_s=0.2), detector, rate_hz=2, max_staleness_s=1.0)
+    worker.start()
+    time.sleep(1.0)
+    start = time.time()
+    snapshot = worker.get()
+    read_ms = (time.time() - start) * 1000
+    case_ok = snapshot is not None and read_ms < 5 and snapshot.age_s <= 1.0
+    print(f"Vision command latency: synchronous {sync_s * 1000:.0f} ms, worker snapshot {read_ms:.2f} ms "
+          f"(frame {snapshot.age_s * 1000:.0f} ms old) -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    start = time.time()
+    snapshot = worker.get(max_staleness_s=0.05)
+    waited_ms = (time.time() - start) * 1000
+    case_ok = snapshot is not None and snapshot.frame_time >= start - 0.05
+    print(f"Stale snapshot: waited {waited_ms:.0f} ms for a detection of a frame captured at most 50 ms "
+          f"before the request -> {'OK' if case_ok else 'FAIL'}")
+    ok = ok and case_ok
+
+    worker.stop()
+    case_ok = worker.get(max_staleness_s=0.0, wait_s=0.5) is None and not worker.running
+    print(f"Stopped worker: stale reads return None, stats {worker.stats()} -> {'OK' if case_ok else 'FAIL'}")
+    return ok and case_ok
+
+if __name__ == "__main__":
+    import sys
+    # python -m src.vision_worker --worker-test
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker-test":
+        sys.exit(0 if worker_test() else 1)
+    from .video_input import VideoInput
+    from .vision_module import VisionModule
+    worker = VisionWorker(VideoInput(camera_index=0, fps_limit=5), VisionModule())
+    worker.start()
+    try:
+        while True:
+            time.sleep(2)
+            snapshot = worker.latest()
+            if snapshot:
+                print(f"[{snapshot.age_s:.2f}s old, {snapshot.inference_ms:.0f} ms] {snapshot.description}")
+    except KeyboardInterrupt:
+        worker.stop()
+        worker.video_in.stop_capture()